@@ -9,9 +9,14 @@ showing school expenditures by category, for schools grouped by demographic attr
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
+from collections import OrderedDict
 from ipywidgets import interactive, widgets
 import re
 from IPython.display import display
+from data_store import get_data_store
+
+## The number of selections whose statistics are kept (least recently used selections are discarded first)
+STATISTICS_CACHE_SIZE = 32
 
 class boxplot_comparisons(object):
     '''
@@ -22,14 +27,25 @@ class boxplot_comparisons(object):
         - A checkbox allowing the user to specify whether the expenditure should be normalized
         (so the expenditures are plotted as a percent of a school's total expenditures).
     Upon new user input through the ipywidget menu, a new array of boxplots is generated and
-    output to the screen.
+    output to the screen. The statistics plotted for each selection (bins, medians, box statistics
+    and regression fits) are computed once, and kept in a least recently used cache (so re-selecting
+    a recent selection doesn't recompute them).
+    
+    The data is read from store (by default, the data store shared by all visualizers).
     
     Note this class will only behave as expected in the Jupyter iPython notebook environment
     since it uses is built on the ipywidget package.
     '''
     
-    def __init__(self):
+    def __init__(self, store=None):
+        self.store = store if store is not None else get_data_store()
         self.all_years_data = self.read_all_years_data()
+        self.normalized_data = None
+        self.feature_labels = self.make_labels_from_features()
+        self.statistics = OrderedDict()
+        self.figure = None
+        ## Warm up the cache with the default selection
+        self.get_statistics('Total', 'Title_1', False)
         self.expenditure_options = self.build_expenditure_dicts()
         self.groupby_options = self.build_groupby_dicts()
         w = interactive(self.make_boxplot,
@@ -45,9 +61,8 @@ class boxplot_comparisons(object):
         '''
         Reads in all the data for boxplot analysis.
         '''
-        all_years_data={}
+        all_years_data = self.store.all_years_data()
         for year in range(2006, 2013):
-            all_years_data[year] = pd.read_csv('../data/merged_data/expenditure_demo_account_year_{}.csv'.format(year), index_col=0)
             all_years_data[year] = all_years_data[year][~all_years_data[year].duplicated()]
         return all_years_data
     
@@ -61,65 +76,18 @@ class boxplot_comparisons(object):
         
         When %matplotlib inline magic on in ipython notebook, prints a plot with 7 boxplots
         comparing the input expenditure, by groupby_feature, across all years (2006-2012).
+        The plots are drawn from the selection's precomputed statistics (see compute_statistics), in a
+        single figure that is re-used (with its artists updated in place) for every selection.
         '''
-        plt.close('all')
-        ##Bin the expenditure feature, if needed
-        quartiles_or_fewer_bins = self.map_onto_quartile(groupby_feature)
-        
-        
-        ## Set data depending on normalization
-        data = self.normalize_expenditures(normalized)
-        
-        ## find maximum value of 'expenditure' to set ylims:
-        max_val = 0
+        statistics = self.get_statistics(expenditure, groupby_feature, normalized)
+        feature_labels = self.feature_labels
+        if self.figure is None:
+            self.figure = self.make_figure()
         for year in range(2006,2013):
-            if data[year][expenditure].max() > max_val:
-                max_val = data[year][expenditure].max()
-        
-        ## Create dictionary for labeling
-        feature_labels = self.make_labels_from_features()
-        
-        ## Create plots 
-        fig = plt.figure(figsize=(16,16))
-        for year in range(2006,2013):
-            axes = {}
-            axes[year] = plt.subplot(4,2, year-2005)
-            data[year].boxplot(column=expenditure, by=quartiles_or_fewer_bins[year], ax=axes[year], widths=0.3)
+            self.draw_year(year, statistics, normalized)
             
-            ## Add simple linear regression line
-            line_of_best_fit = np.polyfit(quartiles_or_fewer_bins[year], data[year][expenditure], deg=1)
-            num_vals = len(quartiles_or_fewer_bins[year].value_counts())
-            xs = np.arange(0.5,num_vals+1,1)
-            ys = line_of_best_fit[0]*xs + line_of_best_fit[1]
-            if normalized:
-                label = r'Linear regression $\beta_{slope}$' + '= ' + '%s' % float('%.2g' % line_of_best_fit[0])
-            else:
-                label = r'Linear regression $\beta_{slope}$' + '= ' + '%s' % float('%.2g' % line_of_best_fit[0])
-            plt.plot(xs, ys, 'g--', linewidth=1, label=label)
-            
-            ## Get medians for each level of group, and label medians on plot
-            grouped = data[year].groupby(quartiles_or_fewer_bins[year])[expenditure].median()
-            i = 1.16 ## indexer for label position
-            for group in grouped:
-                if normalized:
-                    axes[year].text(i, group, '- {}%'.format(str(round(group,2))), verticalalignment='center')
-                    i+=1
-                else:
-                    axes[year].text(i, group, '- ${}'.format(str(int(group))), verticalalignment='center')
-                    i+=1
-            
-            ## Add labels to x and axis, ticks, legend
-            axes[year].set_title(str(year))
-            axes[year].set_xlabel('')
-            axes[year].set_ylim((0,max_val)) ##want comparability across years
-            axes[year].set_xlim((0,len(quartiles_or_fewer_bins[year].value_counts())+1))
-            axes[year].set_xticklabels(self.make_xtick_labels(groupby_feature)[year].values())
-            axes[year].legend(loc='best')
-            
-        ## In 8th axis, add informative plot summary
-        axes['key'] = plt.subplot(4,2,8)
-        axes['key'].axis('off')
-        axes['key'].text(0, 1,"Explanation:\n\nThese boxplots show per student expenditures\n"
+        ## Update the informative plot summary (in the 8th axis) and title
+        self.figure['explanation'].set_text("Explanation:\n\nThese boxplots show per student expenditures\n"
                          "for the expenditure variable '{0}'\n"
                          "for each school year between 2005-2006 and 2011-2012,\n"
                          "grouped by the school characteristic '{1}'.\n".format(feature_labels[expenditure], feature_labels[groupby_feature]) +
@@ -129,15 +97,190 @@ class boxplot_comparisons(object):
                          "1.5 times the IQR. Finally, outliers are plotted as + signs.\n"
                          r"Additionally, note the regression coefficient $\beta_{slope}$" + "\n"
                          "provided in the legend is for regression on the grouped feature\n"
-                         "(comparing across either binary classes or quartile groups).", fontsize=12,
-                        horizontalalignment='left', verticalalignment='top')
+                         "(comparing across either binary classes or quartile groups).")
         if normalized:
             title = "Comparing per student expenditures on {0},\n (as % of school's total budget) grouped by {1}".format(feature_labels[expenditure], feature_labels[groupby_feature])
         else:
             title = "Comparing per student expenditures on {0}\ngrouped by {1}".format(feature_labels[expenditure], feature_labels[groupby_feature])
-        fig.suptitle(title, x=0.5, y= 0.95, fontsize=16)
-        return
+        self.figure['title'].set_text(title)
+        return self.figure['figure']
+    
+    def make_figure(self):
+        '''
+        Creates the (persistent) figure the boxplots are drawn in: a boxplot axis for each year, and an
+        axis for the plot summary. Returns a dictionary holding the figure, its axes, and the artists
+        drawn in each year's axis (which make_boxplot updates in place for each selection).
+        '''
+        fig = plt.figure(figsize=(16,16))
+        ## Note the figure is displayed by the widget (make_boxplot returns it), rather than by pyplot
+        plt.close(fig)
+        figure = {'figure': fig, 'axes': {}, 'artists': {}}
+        for year in range(2006,2013):
+            figure['axes'][year] = fig.add_subplot(4,2, year-2005)
+            figure['axes'][year].set_title(str(year))
+            figure['axes'][year].grid(True)
+            figure['artists'][year] = {'boxes': {}, 'medians': [],
+                                       'fit': figure['axes'][year].plot([], [], 'g--', linewidth=1)[0]}
+        key = fig.add_subplot(4,2,8)
+        key.axis('off')
+        figure['explanation'] = key.text(0, 1, '', fontsize=12, horizontalalignment='left', verticalalignment='top')
+        figure['title'] = fig.suptitle('', x=0.5, y= 0.95, fontsize=16)
+        return figure
+    
+    def draw_year(self, year, statistics, normalized):
+        '''
+        Draws the year's boxplots, regression line, and median labels for the selection (with the given
+        statistics) into the year's axis. The existing artists are updated in place (boxes are
+        only drawn anew the first time the year is drawn with a given number of bins).
+        '''
+        ax = self.figure['axes'][year]
+        artists = self.figure['artists'][year]
+        boxes = statistics['boxes'][year]
+        num_vals = statistics['num_vals'][year]
+        
+        ## Draw the boxes from their precomputed statistics (into the boxes already drawn for this
+        ## number of bins, if any- the boxes drawn for other numbers of bins are hidden)
+        if len(boxes) in artists['boxes']:
+            self.update_boxes(artists['boxes'][len(boxes)], boxes, 0.3)
+        else:
+            artists['boxes'][len(boxes)] = ax.bxp(boxes, widths=0.3, medianprops={'color': 'red'}, flierprops={'marker': '+'})
+        for count, box_artists in artists['boxes'].items():
+            for lines in box_artists.values():
+                for line in lines:
+                    line.set_visible(count == len(boxes))
+        
+        ## Update simple linear regression line
+        line_of_best_fit = statistics['fits'][year]
+        xs = np.arange(0.5,num_vals+1,1)
+        artists['fit'].set_data(xs, line_of_best_fit[0]*xs + line_of_best_fit[1])
+        artists['fit'].set_label(r'Linear regression $\beta_{slope}$' + '= ' + '%s' % float('%.2g' % line_of_best_fit[0]))
         
+        ## Label medians on plot
+        medians = list(statistics['medians'][year])
+        if len(artists['medians']) != len(medians):
+            for text in artists['medians']:
+                text.remove()
+            artists['medians'] = [ax.text(0, 0, '', verticalalignment='center') for group in medians]
+        i = 1.16 ## indexer for label position
+        for text, group in zip(artists['medians'], medians):
+            text.set_position((i, group))
+            if normalized:
+                text.set_text('- {}%'.format(str(round(group,2))))
+            else:
+                text.set_text('- ${}'.format(str(int(group))))
+            i+=1
+        
+        ## Update axis limits, ticks, legend
+        ax.set_ylim((0,statistics['max_val'])) ##want comparability across years
+        ax.set_xlim((0,num_vals+1))
+        ax.set_xticks(range(1, len(boxes)+1))
+        ax.set_xticklabels(statistics['xtick_labels'][year].values())
+        ax.legend(loc='best')
+    
+    def update_boxes(self, artists, boxes, width):
+        '''
+        Moves the lines drawn by ax.bxp (artists) to show the box statistics boxes (as drawn by ax.bxp
+        with the same number of boxes, at positions 1, 2, ..., with the given width).
+        '''
+        for i, box in enumerate(boxes):
+            x = i + 1
+            left, right = x - width/2.0, x + width/2.0
+            artists['boxes'][i].set_data([left, right, right, left, left], [box['q1'], box['q1'], box['q3'], box['q3'], box['q1']])
+            artists['medians'][i].set_data([left, right], [box['med'], box['med']])
+            artists['whiskers'][2*i].set_data([x, x], [box['q1'], box['whislo']])
+            artists['whiskers'][2*i+1].set_data([x, x], [box['q3'], box['whishi']])
+            artists['caps'][2*i].set_data([x - width/4.0, x + width/4.0], [box['whislo'], box['whislo']])
+            artists['caps'][2*i+1].set_data([x - width/4.0, x + width/4.0], [box['whishi'], box['whishi']])
+            artists['fliers'][i].set_data([x]*len(box['fliers']), box['fliers'])
+        
+    def get_statistics(self, expenditure, groupby_feature, normalized):
+        '''
+        Returns the statistics for the selection (see compute_statistics), from the cache if the selection
+        was made recently. Otherwise, computes them and adds them to the cache (discarding the least
+        recently used selection, if the cache is full).
+        '''
+        key = (expenditure, groupby_feature, normalized)
+        if key in self.statistics:
+            statistics = self.statistics.pop(key)
+        else:
+            statistics = self.compute_statistics(expenditure, groupby_feature, normalized)
+            if len(self.statistics) >= STATISTICS_CACHE_SIZE:
+                self.statistics.popitem(last=False)
+        self.statistics[key] = statistics
+        return statistics
+    
+    def compute_statistics(self, expenditure, groupby_feature, normalized):
+        '''
+        Computes everything make_boxplot plots for the selection, returning a dictionary with keys:
+            data: the (normalized, if selected) data for each year
+            bins: each year's schools, binned on groupby_feature (see map_onto_quartile)
+            xtick_labels: the bins' labels for each year (see make_xtick_labels)
+            max_val: the maximum value of expenditure across all years
+            num_vals, fits, medians, boxes: dictionaries with keys = years, vals = the number of bins,
+            the linear regression fit (slope, intercept) of expenditure on the bins, the median of
+            expenditure in each bin, and the box statistics (quartiles, whiskers and outliers, in the
+            form drawn by matplotlib's ax.bxp) of expenditure in each bin (see box_statistics).
+        '''
+        data = self.normalize_expenditures(normalized)
+        bins = self.map_onto_quartile(groupby_feature)
+        
+        ## find maximum value of 'expenditure' to set ylims:
+        max_val = 0
+        for year in range(2006,2013):
+            if data[year][expenditure].max() > max_val:
+                max_val = data[year][expenditure].max()
+        
+        statistics = {'data': data, 'bins': bins, 'xtick_labels': self.make_xtick_labels(groupby_feature),
+                      'max_val': max_val, 'num_vals': {}}
+        for year in range(2006,2013):
+            statistics['num_vals'][year] = len(bins[year].value_counts())
+        statistics.update(self.box_statistics(data, bins, expenditure))
+        return statistics
+    
+    def box_statistics(self, data, bins, expenditure):
+        '''
+        Computes the box statistics, medians, and regression fits for expenditure (in data), grouped by bins,
+        for all years at once (rather than one year and bin at a time). Returns a dictionary with keys
+        fits, medians, boxes (as described in compute_statistics). The box statistics match those of
+        cbook.boxplot_stats (with whiskers at 1.5 times the IQR).
+        '''
+        ## One long table of every (year, bin, value), so each statistic is a single groupby
+        values = pd.concat([pd.DataFrame({'year': year, 'bin': np.asarray(bins[year]), 'value': data[year][expenditure].values})
+                            for year in range(2006,2013)], ignore_index=True).dropna()
+        groups = [values['year'], values['bin']]
+        quartiles = values.groupby(groups)['value'].quantile([0.25, 0.5, 0.75]).unstack()
+        q1, med, q3 = quartiles[0.25], quartiles[0.5], quartiles[0.75]
+        
+        ## Whiskers reach the most extreme values within 1.5 IQR of the box (but not inside the box)
+        keys = pd.MultiIndex.from_arrays(groups)
+        high = (q3 + 1.5*(q3 - q1)).reindex(keys).values
+        low = (q1 - 1.5*(q3 - q1)).reindex(keys).values
+        whishi = values['value'][values['value'].values <= high].groupby([g[values['value'].values <= high] for g in groups]).max()
+        whishi = whishi.reindex(q3.index).where(lambda x: x >= q3, q3)
+        whislo = values['value'][values['value'].values >= low].groupby([g[values['value'].values >= low] for g in groups]).min()
+        whislo = whislo.reindex(q1.index).where(lambda x: x <= q1, q1)
+        outside = (values['value'].values > whishi.reindex(keys).values) | (values['value'].values < whislo.reindex(keys).values)
+        fliers = dict((key, group.values) for key, group in values['value'][outside].groupby([g[outside] for g in groups]))
+        means = values.groupby(groups)['value'].mean()
+        
+        ## Simple linear regression of value on bin (as np.polyfit with deg=1), for each year
+        by_year = values.groupby('year')
+        x = values['bin'] - by_year['bin'].transform('mean')
+        y = values['value'] - by_year['value'].transform('mean')
+        slopes = (x*y).groupby(values['year']).sum() / (x*x).groupby(values['year']).sum()
+        intercepts = by_year['value'].mean() - slopes*by_year['bin'].mean()
+        
+        statistics = {'fits': {}, 'medians': {}, 'boxes': {}}
+        for year in range(2006,2013):
+            statistics['fits'][year] = np.array([slopes[year], intercepts[year]])
+            statistics['medians'][year] = med.loc[year]
+            statistics['boxes'][year] = [{'label': group, 'mean': means[(year, group)], 'med': med[(year, group)],
+                                          'q1': q1[(year, group)], 'q3': q3[(year, group)],
+                                          'whislo': whislo[(year, group)], 'whishi': whishi[(year, group)],
+                                          'fliers': fliers.get((year, group), np.array([]))}
+                                         for group in med.loc[year].index]
+        return statistics
+    
     def map_onto_quartile(self, expenditure):
         '''
         Accepts an expenditure feature as input. If this features value_counts is less than 4,
@@ -161,7 +304,7 @@ class boxplot_comparisons(object):
         labels = {}
         for year in range(2006,2013):
                 if len(self.all_years_data[year][groupby_feature].value_counts()) == 2:
-                    label = self.make_labels_from_features()[groupby_feature]
+                    label = self.feature_labels[groupby_feature]
                     ##Append "school" to features like Title_1, which lacks "school" string.
                     if 'School' not in label:
                         label = label + ' school'
@@ -173,27 +316,19 @@ class boxplot_comparisons(object):
     
     def normalize_expenditures(self, boolean):
         '''
-        If input boolean == True, then normalizes the expenditure data (dividing each expenditure
-        for a given school by that school's total expenditures. Returns this normalized data.
+        If input boolean == True, then returns the normalized expenditure data (each expenditure
+        for a given school divided by that school's total expenditures).
         If boolean == False, returns the original data.
         '''
-        data = {}
         if boolean:
-            for year in self.all_years_data:
-                ##Drop non-expenditure and non-numeric fields, then normalize
-                numeric = self.all_years_data[year].drop(['School','District','Title_1', 'Name', 'schoolyear',
-                                                     'fl_percent', 'frl_percent', 'total_enrollment', 'ell_percent',
-                                                     'sped_percent', 'asian_per', 'black_per', 'hispanic_per', 'white_per',
-                                                     'male_per', 'female_per', 'poverty_level', 'elementary_school',
-                                                     'middle_school', 'high_school'], axis=1)
-                numeric = numeric.div(numeric.Total, axis='index')
-    
-                ##Concatenate back together
-                data[year] = pd.merge(numeric, self.all_years_data[year][['School','District','Title_1', 'Name', 'schoolyear',
-                                                     'fl_percent', 'frl_percent', 'total_enrollment', 'ell_percent',
-                                                     'sped_percent', 'asian_per', 'black_per', 'hispanic_per', 'white_per',
-                                                     'male_per', 'female_per', 'poverty_level', 'elementary_school',
-                                                     'middle_school', 'high_school']], left_index=True, right_index=True)
+            ## The normalized data is only read once (when first selected)
+            if self.normalized_data is None:
+                self.normalized_data = {}
+                for year in self.all_years_data:
+                    ##The expenditure shares are derived by the get_clean_data pipeline (see derived_features.py)
+                    shares = self.store.derived('shares', year)
+                    self.normalized_data[year] = shares[~shares.duplicated()]
+            data = self.normalized_data
         else:
             data = self.all_years_data
         return data
@@ -0,0 +1,123 @@
+'''This module provides the data store shared by the expenditure visualizers.
+
+The visualizers all read the same merged data (and main.ipynb runs them all in one kernel). Rather
+than each visualizer reading every year's data when it's created, they all get their data from one
+data_store per process (get_data_store), which:
+    - Loads each dataset lazily, the first time it's requested,
+    - Loads only the requested columns (keeping them for later requests), and
+    - Reloads a dataset if its file has changed since it was loaded (i.e. after main.py is re-run).
+Each request returns a copy, so visualizers can modify their data freely. The store also provides
+the derived features (see get_clean_data/derived_features.py)- these are saved by main.py's
+derived_features stage, but if they're missing (i.e. on a fresh checkout) the store derives them
+from the merged data the first time they're requested.'''
+
+import os
+import sys
+import pandas as pd
+## The visualizers import get_clean_data's modules (i.e. storage and derived_features) from its directory,
+## found relative to this file (rather than the working directory), so they can be imported from anywhere.
+## Note the other visualizers rely on this module to put get_clean_data on the path.
+GET_CLEAN_DATA_DIRECTORY = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'get_clean_data'))
+if GET_CLEAN_DATA_DIRECTORY not in sys.path:
+    sys.path.append(GET_CLEAN_DATA_DIRECTORY)
+from storage import load_table, binary_path
+from derived_features import derived_path, derived_outputs, save_derived_features, load_column_registry, DERIVED_DIRECTORY
+
+MERGED_PATH = '../data/merged_data/expenditure_demo_account_year_{}.csv'
+SCHMA_PATH = '../data/clean_SCHMA.csv'
+YEARS = range(2006, 2013)
+
+class data_store(object):
+    '''
+    Memoizes the datasets (csv files, read with storage.load_table) requested so far, keyed by path.
+    For each dataset, the store holds the columns loaded so far, whether all columns are loaded,
+    and the modification times of its files when they were loaded. The derived features are read
+    from (and, if missing, saved in) derived_directory.
+    '''
+
+    def __init__(self, derived_directory=DERIVED_DIRECTORY):
+        self.tables = {}
+        self.derived_directory = derived_directory
+
+    def table(self, path, columns=None):
+        '''
+        Returns (a copy of) the dataset at path, with only the input columns (a list, or None for all columns).
+        '''
+        version = self.file_version(path)
+        if path not in self.tables or self.tables[path]['version'] != version:
+            self.tables[path] = {'version': version, 'data': None, 'complete': False}
+        cached = self.tables[path]
+        if columns is None:
+            if not cached['complete']:
+                cached['data'] = load_table(path)
+                cached['complete'] = True
+            return cached['data'].copy()
+        columns = list(columns)
+        if cached['data'] is None:
+            cached['data'] = load_table(path, columns)
+        else:
+            missing = [c for c in columns if c not in cached['data'].columns]
+            if missing:
+                cached['data'] = pd.concat([cached['data'], load_table(path, missing)], axis=1)
+        return cached['data'][columns]
+
+    def columns(self, path):
+        '''
+        Returns the names of the dataset's columns (reading only its header, if it isn't loaded yet).
+        '''
+        cached = self.tables.get(path)
+        if cached is not None and cached['complete'] and cached['version'] == self.file_version(path):
+            return list(cached['data'].columns)
+        return list(pd.read_csv(path, index_col=0, nrows=0).columns)
+
+    def year(self, year, columns=None):
+        '''Returns (a copy of) the merged data for year, with only the input columns (or all columns).'''
+        return self.table(MERGED_PATH.format(year), columns)
+
+    def year_columns(self, year):
+        '''Returns the names of the merged data's columns for year.'''
+        return self.columns(MERGED_PATH.format(year))
+
+    def all_years_data(self, years=YEARS, columns=None):
+        '''
+        Returns a dictionary with keys = years, vals = (a copy of) the merged data for that year,
+        with only the input columns (or all columns).
+        '''
+        return {year: self.year(year, columns) for year in years}
+
+    def derived(self, name, year, columns=None):
+        '''
+        Returns (a copy of) the derived dataset name ('shares' or 'scaled'- see derived_features.py) for year,
+        with only the input columns (or all columns).
+        '''
+        self.derive_features()
+        return self.table(derived_path(name, year, self.derived_directory), columns)
+
+    def column_registry(self):
+        '''Returns the column registry (see derived_features.py), with keys = years.'''
+        self.derive_features()
+        return load_column_registry(self.derived_directory)
+
+    def derive_features(self):
+        '''
+        Derives (and saves) the derived features from the merged data, if any of the derived files is missing.
+        '''
+        if not all(os.path.exists(path) for path in derived_outputs(YEARS, self.derived_directory)):
+            save_derived_features(MERGED_PATH, YEARS, self.derived_directory)
+
+    def file_version(self, path):
+        ## The modification times of the csv file and its binary copy (if any)- if either changes, the data is reloaded
+        binary = binary_path(path)
+        return (os.path.getmtime(path), os.path.getmtime(binary) if os.path.exists(binary) else None)
+
+    def clear(self):
+        '''Discards all loaded data.'''
+        self.tables.clear()
+
+_data_store = data_store()
+
+def get_data_store():
+    '''
+    Returns the data store shared by all visualizers (in this process).
+    '''
+    return _data_store
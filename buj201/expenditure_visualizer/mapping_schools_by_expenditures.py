@@ -8,11 +8,12 @@ Created on Dec 11, 2015
 colored by their percentile score for a user-input expenditure category.'''
 
 import pandas as pd
-from scipy import stats
 import matplotlib.pyplot as plt
 from mpl_toolkits.basemap import Basemap
 from ipywidgets import interactive
 from IPython.display import display
+from data_store import get_data_store, SCHMA_PATH
+from percentile_rank import percentile_rank
 
 class NYC_school_interactive_map(object):
     '''
@@ -23,6 +24,10 @@ class NYC_school_interactive_map(object):
         based on their percentile score for the selected category).
     Instantiating the class produces an ipywidget box (with two drop down menus to accept
     user input), and an initial school map.
+    The schools' percentile ranks for every (year, expenditure) are computed once, when the map is
+    created, and each year's schools are drawn once (as one scatter collection)- so selecting an
+    expenditure or year only recolors (and shows) that year's schools, rather than adding a new layer
+    to the map.
     
     Note this class will only behave as expected in the Jupyter iPython notebook environment
     since it uses is built on the ipywidget package.
@@ -31,10 +36,15 @@ class NYC_school_interactive_map(object):
     def __init__(self, feature = 'Total', year = 2012):
         self.feature = feature
         self.year = year
+        self.features_for_widget = self.features_for_interaction()
         self.all_years_data = self.read_and_merge_data()
+        self.percentiles = self.rank_schools()
         self.basemap, self.ax, self.fig = self.make_NYC_basemap()
+        self.schools = self.add_schools()
         self.color_bar = self.create_color_bar(feature = 'Total', year = 2012)
-        self.features_for_widget = self.features_for_interaction()
+        ##The map is displayed (and redrawn) by the widget, so close it here- otherwise the notebook
+        ##also displays it when the cell finishes
+        plt.close(self.fig)
         w = interactive(self.interactive_update, Expenditure = self.features_for_widget, Year={'2010':2010, '2011':2011, '2012':2012})
         w.border_color = 'red'
         w.border_style = 'dotted'
@@ -47,20 +57,14 @@ class NYC_school_interactive_map(object):
         for each year 2010-2012.
         '''
         #Read in expenditure/demographic data
-        all_years_data = {}
-        for year in range(2010,2013):
-            all_years_data[year] = pd.read_csv('../data/merged_data/expenditure_demo_account_year_{}.csv'.format(str(year)), index_col=0)
+        all_years_data = get_data_store().all_years_data(range(2010,2013))
     
-        SCHMA = pd.read_csv('../data/clean_SCHMA.csv', index_col=0).reset_index(drop=True)
+        SCHMA = get_data_store().table(SCHMA_PATH).reset_index(drop=True)
+        registry = get_data_store().column_registry()
     
         for year in all_years_data:
-            ##Drop non-expenditure and non-numeric fields, then normalize
-            numeric = all_years_data[year].drop(['School','District','Title_1', 'Name', 'schoolyear',
-                                                 'fl_percent', 'frl_percent', 'total_enrollment', 'ell_percent',
-                                                 'sped_percent', 'asian_per', 'black_per', 'hispanic_per', 'white_per',
-                                                 'male_per', 'female_per', 'poverty_level', 'elementary_school',
-                                                 'middle_school', 'high_school'], axis=1)
-            numeric = numeric.div(numeric.Total, axis='index')
+            ##Get the normalized expenditures (derived by the get_clean_data pipeline- see derived_features.py)
+            numeric = get_data_store().derived('shares', year, registry[year]['expenditure'])
             
             ##Concatenate the normed numeric features and the non-numeric/non-expenditure features
             all_years_data[year] = all_years_data[year].join(numeric, how='inner',  rsuffix='_percent_of_total')
@@ -72,6 +76,14 @@ class NYC_school_interactive_map(object):
         
         return all_years_data
 
+    def rank_schools(self):
+        '''
+        Returns a dictionary with keys = years, vals = a dataframe with each school's percentile rank
+        (from 0 to 1) for every expenditure in self.features_for_widget (computed once, so updates are lookups).
+        '''
+        features = sorted(self.features_for_widget.values())
+        return {year: percentile_rank(data[features])/100.0 for year, data in self.all_years_data.items()}
+
     def make_NYC_basemap(self, ax=None, lllat=40.45, urlat=40.95, lllon=-74.3, urlon=-73.68):
         '''
         This function creates the initial NYC basemap. It is only called once (in the initialization
@@ -97,6 +109,21 @@ class NYC_school_interactive_map(object):
         m.drawcounties(linewidth=0.5)
         
         return m, ax, fig
+
+    def add_schools(self):
+        '''
+        Adds each year's schools to the map (as one scatter collection per year, colored by
+        self.feature), and returns a dictionary with keys = years, vals = the collection. Only
+        self.year's schools are visible. Note all collections share a fixed color scale (0 to 1),
+        so the color bar applies to every expenditure and year.
+        '''
+        m = self.basemap
+        schools = {}
+        for year, data in self.all_years_data.items():
+            schools[year] = m.scatter(data['LCGGEOX'].values, data['LCGGEOY'].values, latlon=True, s=30,
+                                      c=self.percentiles[year][self.feature].values, vmin=0, vmax=1,
+                                      alpha=0.8, cmap='cool', visible=(year == self.year))
+        return schools
         
     def create_color_bar(self, feature, year):
         '''
@@ -106,11 +133,9 @@ class NYC_school_interactive_map(object):
         self.fig
         ax = self.ax
         m = self.basemap
-        data = self.all_years_data[year]
-        ##add points and color bar for the default feature- note the same colormap is used for 
-        ##all plots produced by interactive_update, so the specific feature used is irrelevant.
-        percentiles = [stats.percentileofscore(data[feature],x,kind='weak')/100.0 for x in data[feature]]
-        schools = m.scatter(data['LCGGEOX'].values, data['LCGGEOY'].values, latlon=True, s=30, c=percentiles, alpha=0.8, cmap='cool')
+        ##add color bar for the default feature's points- note the same colormap (and color scale) is used
+        ##for all plots produced by interactive_update, so the specific feature used is irrelevant.
+        schools = self.schools[year]
         ax.set_title('NYC Schools, colored by ranked on\n{} expenditures for year = {}'.format(self.features_for_labels(feature), str(year)))
         cbar = m.colorbar(schools,location='bottom',pad="5%")
         label = 'Rank (percentile score) of each school for selected expenditure category'
@@ -122,18 +147,17 @@ class NYC_school_interactive_map(object):
         interactive_update takes an Expenditure type and a Year as input- the allowed Expenditures are the values in self.features_for_widget,
         and the allowed years are 2010, 2011, and 2012.
         Note this function receives input from the widget, and as such no input validation is needed.
+        The year's schools (already on the map) are recolored with their precomputed ranks, and the
+        other years' schools are hidden- no artists are added, so each update costs the same.
         '''
         
-        plt.close('all')
         fig = self.fig
         ax = self.ax
-        m = self.basemap
-        self.color_bar
         
-        data = self.all_years_data[Year]
-        ##add points title
-        percentiles = [stats.percentileofscore(data[Expenditure],x,kind='weak')/100.0 for x in data[Expenditure]]
-        m.scatter(data['LCGGEOX'].values, data['LCGGEOY'].values, latlon=True, s=30, c=percentiles, alpha=0.8, cmap='cool')
+        ##recolor the year's points, show only them, and update the title
+        self.schools[Year].set_array(self.percentiles[Year][Expenditure].values)
+        for year, schools in self.schools.items():
+            schools.set_visible(year == Year)
         ax.set_title('NYC Schools, colored by ranked on\n{} expenditures for year = {}'.format(self.features_for_labels(Expenditure), str(Year)))
         return fig
     
@@ -6,13 +6,13 @@ Created on Dec 11, 2015
 '''
 This module provides methods for PCA analysis of school budget data.
 '''
-import pandas as pd
 from sklearn.decomposition import PCA
 import matplotlib.pyplot as plt
-from scipy import stats
 import re
 from ipywidgets import interactive, widgets
 from IPython.display import display
+from data_store import get_data_store
+from percentile_rank import percentile_rank
 
 class pca_explorer(object):
     '''
@@ -44,37 +44,14 @@ class pca_explorer(object):
         self.w.border_width = 3
         display(self.w)
          
-    def read_data(self):
-        '''
-        read_data reads in the merged data set containing expenditure and demographic features for each school,
-        for each year 2006-2012.
-        '''
-        all_years_data={}
-        for year in range(2006,2013):
-            all_years_data[year] = pd.read_csv('../data/merged_data/expenditure_demo_account_year_{}.csv'.format(str(year)), index_col=0)
-        return all_years_data
-        
     def norm_numeric(self):
         '''
-        norm_numeric centers the expenditure features (by subtracting the mean), then scales them
-        (dividing by the maximum). This is necessary so that PCA will identify the directions of
-        maximal variation.
+        norm_numeric returns the expenditure features for each school, for each year 2006-2012, centered
+        (by subtracting the mean), then scaled (dividing by the maximum). This is necessary so that PCA
+        will identify the directions of maximal variation. Note the scaled expenditures are derived by
+        the get_clean_data pipeline (see derived_features.py).
         '''
-        all_years_data = self.read_data()
-        for year in all_years_data:
-            numeric = all_years_data[year].drop(['School','District','Title_1', 'Name', 'schoolyear',
-                                                'fl_percent', 'frl_percent', 'total_enrollment', 'ell_percent',
-                                                'sped_percent', 'asian_per', 'black_per', 'hispanic_per', 'white_per',
-                                                'male_per', 'female_per', 'poverty_level', 'elementary_school',
-                                                'middle_school', 'high_school'], axis=1)
-            numeric = (numeric - numeric.mean())
-            numeric = numeric / numeric.max()
-            all_years_data[year] = pd.concat([numeric, all_years_data[year][['School','District','Title_1', 'Name', 'schoolyear',
-                                                'fl_percent', 'frl_percent', 'total_enrollment', 'ell_percent',
-                                                'sped_percent', 'asian_per', 'black_per', 'hispanic_per', 'white_per',
-                                                'male_per', 'female_per', 'poverty_level', 'elementary_school',
-                                                'middle_school', 'high_school']]], axis=1)
-        return all_years_data
+        return {year: get_data_store().derived('scaled', year) for year in range(2006,2013)}
     
     def PCA_fit(self):
         '''
@@ -111,7 +88,7 @@ class pca_explorer(object):
         for year in all_years_data:
             ax = plt.subplot(4,2,year-2005)
             mask = (all_years_data[year]['Title_1'] == 1)
-            colors = pd.Series([stats.percentileofscore(all_years_data[year][feature],x,kind='weak')/100.0 for x in all_years_data[year][feature]], index=all_years_data[year][feature].index)
+            colors = percentile_rank(all_years_data[year][feature])/100.0
             title1schools = ax.scatter(trans_x[year][mask.values,0],trans_x[year][mask.values,1], marker='+', c=colors[mask], cmap='cool', label='Title 1 schools')
             ax.scatter(trans_x[year][~mask.values,0],trans_x[year][~mask.values,1], marker='o', c=colors[~mask], cmap='cool', label='Non-Title 1 schools')
             Title = ' Title 1 vs non-Title 1 schools for year = {}\nSchools colored by {}'.format(str(year), self.map_feature_to_key(feature))
@@ -11,6 +11,7 @@ import matplotlib.patches as mpatches
 from ipywidgets import widgets, interactive
 import re
 from IPython.display import display, clear_output
+from data_store import get_data_store
 
 class school_dashboard(object):
     '''
@@ -43,11 +44,14 @@ class school_dashboard(object):
     def get_data(self):
         '''
         Reads in the merged data set containing expenditure and demographic features for each school,
-        for each year 2006-2012.
+        for each year 2006-2012. Note only the features used by the dashboard are read (school name
+        and DBN, Title 1 status, and the total and category subtotal expenditures).
         '''
+        store = get_data_store()
         all_years_data={}
         for year in range(2006, 2013):
-            all_years_data[year] = pd.read_csv('../data/merged_data/expenditure_demo_account_year_{}.csv'.format(year), index_col=0)
+            subtotals = [column for column in store.year_columns(year) if '_All_Funds' in column]
+            all_years_data[year] = store.year(year, ['School', 'Name', 'Title_1', 'Total'] + subtotals)
         return all_years_data
     
     def update_dropdown(self, search):
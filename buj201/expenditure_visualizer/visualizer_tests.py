@@ -7,6 +7,14 @@ import unittest
 import pandas as pd
 from check_data_and_ipython_call import *
 from school_dashboard import school_dashboard
+from data_store import data_store, MERGED_PATH
+from derived_features import expenditure_shares
+from box_plot import boxplot_comparisons
+import numpy as np
+from matplotlib import cbook
+import os
+import shutil
+import tempfile
 
 class Test(unittest.TestCase):
 
@@ -18,6 +26,62 @@ class Test(unittest.TestCase):
         ## Note we want to be sure data is available- if this test fails print msg.
         self.assertTrue(data_available(),'Data not available- re-run main.py in get_clean_data.')
         
+    def test_data_store(self):
+        store = data_store()
+        expected = pd.read_csv(MERGED_PATH.format(2011), index_col=0)
+        pd.util.testing.assert_frame_equal(store.year(2011, ['Total', 'Name']), expected[['Total', 'Name']])
+        pd.util.testing.assert_frame_equal(store.year(2011, ['Name', 'Title_1']), expected[['Name', 'Title_1']])
+        self.assertEqual(store.year_columns(2011), list(expected.columns))
+        pd.util.testing.assert_frame_equal(store.year(2011), expected)
+        ## Returned data is a copy
+        store.year(2011)['Total'] = 0
+        pd.util.testing.assert_frame_equal(store.year(2011), expected)
+        
+        ## A changed file is reloaded
+        scratch_directory = tempfile.mkdtemp()
+        path = os.path.join(scratch_directory, 'table.csv')
+        pd.DataFrame({'count': [1, 2]}, index=['x', 'y']).to_csv(path)
+        self.assertEqual(list(store.table(path)['count']), [1, 2])
+        pd.DataFrame({'count': [3]}, index=['z']).to_csv(path)
+        os.utime(path, (0, 0))
+        self.assertEqual(list(store.table(path, ['count'])['count']), [3])
+        shutil.rmtree(scratch_directory)
+        
+        ## Missing derived features are derived on request
+        scratch_directory = tempfile.mkdtemp()
+        store = data_store(derived_directory=os.path.join(scratch_directory, 'v1'))
+        shares = expenditure_shares(expected)
+        pd.util.testing.assert_frame_equal(store.derived('shares', 2011, ['Total', 'Teachers']), shares[['Total', 'Teachers']])
+        self.assertEqual(store.column_registry()[2011]['id'], ['District', 'School', 'Name', 'schoolyear'])
+        shutil.rmtree(scratch_directory)
+        
+    def test_boxplot_statistics_cache(self):
+        ## Note the derived features are derived into a scratch directory (not the data directory)
+        scratch_directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, scratch_directory)
+        plots = boxplot_comparisons(data_store(derived_directory=os.path.join(scratch_directory, 'v1')))
+        self.assertEqual(plots.statistics.keys(), [('Total', 'Title_1', False)])
+        statistics = plots.get_statistics('Teachers', 'poverty_level', True)
+        plots.get_statistics('Total', 'Title_1', False)
+        self.assertIs(plots.get_statistics('Teachers', 'poverty_level', True), statistics)
+        self.assertEqual(plots.statistics.keys(), [('Total', 'Title_1', False), ('Teachers', 'poverty_level', True)])
+        
+        data = plots.normalize_expenditures(True)
+        bins = plots.map_onto_quartile('poverty_level')
+        for year in range(2006, 2013):
+            np.testing.assert_allclose(statistics['fits'][year], np.polyfit(bins[year], data[year]['Teachers'], deg=1))
+            np.testing.assert_array_equal(statistics['medians'][year], data[year].groupby(bins[year])['Teachers'].median())
+            ## The box statistics match matplotlib's
+            for box, (group, values) in zip(statistics['boxes'][year], data[year].groupby(bins[year])['Teachers']):
+                expected = cbook.boxplot_stats(values.values, whis=1.5)[0]
+                for stat in ['med', 'q1', 'q3', 'whislo', 'whishi', 'mean']:
+                    self.assertAlmostEqual(box[stat], expected[stat])
+                np.testing.assert_array_equal(np.sort(box['fliers']), np.sort(expected['fliers']))
+        
+        ## The figure is re-used for every selection
+        figure = plots.make_boxplot('Total', 'Title_1', False)
+        self.assertIs(plots.make_boxplot('Teachers', 'poverty_level', True), figure)
+        
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,195 @@
+'''
+This module benchmarks the targeted expenditure report extractor (report_page_extractor.py)
+against the original report page parser, over a corpus of saved report pages.
+
+The corpus is every expenditure report page in the scraper's page archive, or, with --fixtures, the
+small corpus of report pages in report_page_fixtures (which the tests also check both parsers
+agree on). For each page, the benchmark checks that both parsers extract the same features, then
+reports the total time each parser takes to parse the corpus. It exits with an error if the corpus
+is empty, or if the parsers disagree on any page.
+
+It is run from the terminal (after cd-ing into the get_clean_data directory) with the command
+'python benchmark_report_extractor.py' (optionally followed by the number of timing repeats).
+'python benchmark_report_extractor.py --save-fixtures N' replaces the fixture corpus with N of the
+report pages in the page archive.
+'''
+import sys
+import argparse
+import json
+import os
+import re
+import time
+from StringIO import StringIO
+from lxml.html import parse
+import pandas as pd
+from report_page_extractor import extract_school_features
+from page_archive import page_archive, ARCHIVE_DIRECTORY
+
+FIXTURE_DIRECTORY = 'report_page_fixtures'
+
+def legacy_extract_school_features(page, school_name, DBN):
+    '''
+    The original report page parser (from get_all_school_data), kept as the reference for
+    the targeted extractor.
+    '''
+    parsed = parse(StringIO(page))
+    doc = parsed.getroot()
+    tables = doc.findall('.//table')
+
+    ##Table 5 data includes the school name, district, and it's Title 1 status
+    rows = tables[4].findall('.//tr')
+    elts = rows[2].findall('.//td')
+
+    ## This will work for Districts 1-32, but not 75 or 79, which are formatted differently
+    if int(school_name[4:6]) in range(1,33):
+        for val in elts[0]:
+            table_5_dat = val.text_content()
+            table_5_dat = re.split('[\xa0]+[\s]?',table_5_dat)
+            school_features = {}
+            for i in table_5_dat:
+                school_features[str(re.sub('\s','_', re.split(':\s',i)[0]))]=str(re.split(':[\s]+',i)[1])
+
+    ## Handles districts 75 and 79
+    else:
+        for val in elts[0]:
+            table_5_dat = val.text_content()
+            table_5_dat = re.split('[\s]?[\xa0]+[\s]?',table_5_dat)
+            school_features = {}
+            school_features['District'] = str(re.sub('\s', '_', table_5_dat[0]))
+            for i in table_5_dat[1:]:
+                school_features[str(re.sub('\s','_', re.split(':\s',i)[0]))]=str(re.split(':[\s]+',i)[1])
+
+    ## Now we need to convert the text district names to numeric district codes:
+    if school_features['District'] == 'Citywide_Sp_Ed_(75)':
+        school_features['District'] = 75
+    elif  school_features['District'] == 'Alternative_HS':
+        school_features['District'] = 79
+
+    ##Make expenditure dict:
+    expenditures = {}
+
+    ##Tables 7 and 10 include the per student expenditures
+    for table in [tables[6], tables[9]]:
+        rows = table.findall('.//tr')
+        for row in rows:
+            elts = row.findall('.//td')
+            for pair in zip(elts[0],elts[3]):
+                key = re.sub('[\xa0]+','_', pair[0].text_content())
+                key = re.sub('.*?\._','',key)
+                key = re.sub('[^A-Za-z_]','',key)
+                expenditures[key] = re.sub('[^0-9]','', pair[1].text_content())
+
+    del expenditures['_']
+    school_features.update(expenditures)
+    return pd.Series(school_features.values(), index=school_features.keys(), name=DBN)
+
+def parse_or_error(parser, page, school_name, DBN):
+    '''
+    Returns the features extracted by parser, as a dictionary of strings (as written to the
+    scraped data csv files), or the name of the error raised if the page couldn't be parsed.
+    '''
+    try:
+        school_features = parser(page, school_name, DBN)
+    except IndexError as e:
+        return type(e).__name__
+    return dict((str(k), '' if v is None else str(v)) for k, v in school_features.iteritems())
+
+def load_corpus(archive, years=range(2006,2013)):
+    '''
+    Returns a list of (year, DBN, school_name, page) for every report page in archive.
+    '''
+    corpus = []
+    for year in years:
+        for DBN in archive.DBNs(year):
+            school_name, page = archive.get(year, DBN)
+            corpus.append((year, DBN, school_name, page))
+    return corpus
+
+def load_fixture_corpus(directory=FIXTURE_DIRECTORY):
+    '''
+    Returns the list of (year, DBN, school_name, page) saved in directory (see save_fixture_corpus).
+    '''
+    with open(os.path.join(directory, 'index.json')) as f:
+        index = json.load(f)
+    corpus = []
+    for year, DBN, school_name, file_name in index:
+        with open(os.path.join(directory, file_name)) as f:
+            corpus.append((year, str(DBN), str(school_name), f.read()))
+    return corpus
+
+def save_fixture_corpus(corpus, directory=FIXTURE_DIRECTORY):
+    '''
+    Saves corpus (a list of (year, DBN, school_name, page)) in directory: each page as an html file,
+    and an index (index.json) of each page's year, DBN, school name and file name.
+    '''
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    index = []
+    for year, DBN, school_name, page in corpus:
+        file_name = '{}_{}.html'.format(year, DBN)
+        with open(os.path.join(directory, file_name), 'w') as f:
+            f.write(page)
+        index.append([year, DBN, school_name, file_name])
+    with open(os.path.join(directory, 'index.json'), 'w') as f:
+        json.dump(index, f, indent=1, separators=(',', ': '))
+
+def time_parser(parser, corpus, repeats):
+    '''
+    Returns the best (over repeats) total time, in seconds, for parser to parse the corpus.
+    '''
+    times = []
+    for i in range(repeats):
+        start = time.time()
+        for year, DBN, school_name, page in corpus:
+            try:
+                parser(page, school_name, DBN)
+            except IndexError:
+                pass
+        times.append(time.time() - start)
+    return min(times)
+
+def run_benchmark(corpus, repeats=3):
+    '''
+    Checks the two parsers agree on every page in corpus, then times them. Returns a dictionary
+    of results (including the list of (year, DBN) for pages where the parsers disagree).
+    Raises a ValueError if corpus is empty.
+    '''
+    if len(corpus) == 0:
+        raise ValueError('The report page corpus is empty')
+    mismatches = [(year, DBN) for year, DBN, school_name, page in corpus
+                  if parse_or_error(legacy_extract_school_features, page, school_name, DBN) !=
+                     parse_or_error(extract_school_features, page, school_name, DBN)]
+    legacy_time = time_parser(legacy_extract_school_features, corpus, repeats)
+    extractor_time = time_parser(extract_school_features, corpus, repeats)
+    return {'pages': len(corpus), 'mismatches': mismatches, 'legacy_seconds': legacy_time,
+            'extractor_seconds': extractor_time,
+            'speedup': legacy_time/extractor_time if extractor_time > 0 else float('nan')}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the report page extractor against the original parser.')
+    parser.add_argument('repeats', nargs='?', type=int, default=3, help='number of timing repeats')
+    parser.add_argument('--fixtures', action='store_true', help='benchmark the fixture corpus (in {})'.format(FIXTURE_DIRECTORY))
+    parser.add_argument('--save-fixtures', type=int, metavar='N', help='save N archived report pages as the fixture corpus, then exit')
+    args = parser.parse_args()
+    corpus = load_fixture_corpus() if args.fixtures else load_corpus(page_archive(ARCHIVE_DIRECTORY))
+    if len(corpus) == 0:
+        sys.exit('No saved report pages found- run main.py to populate the page archive first (or use --fixtures).')
+    if args.save_fixtures is not None:
+        ## Note the pages are spread over the corpus (so over the years, and the districts within each year)
+        fixtures = corpus[::max(len(corpus)//args.save_fixtures, 1)][:args.save_fixtures]
+        save_fixture_corpus(fixtures)
+        print 'Saved', len(fixtures), 'report pages in', FIXTURE_DIRECTORY
+        return
+    results = run_benchmark(corpus, args.repeats)
+    print 'Pages in corpus:', results['pages']
+    print 'Pages where the parsers disagree:', len(results['mismatches'])
+    for year, DBN in results['mismatches']:
+        print '   ', year, DBN
+    print 'Original parser: {:.2f} s ({:.2f} ms/page)'.format(results['legacy_seconds'], 1000*results['legacy_seconds']/results['pages'])
+    print 'Targeted extractor: {:.2f} s ({:.2f} ms/page)'.format(results['extractor_seconds'], 1000*results['extractor_seconds']/results['pages'])
+    print 'Speedup: {:.2f}x'.format(results['speedup'])
+    if results['mismatches']:
+        sys.exit('The parsers disagree on {} pages'.format(len(results['mismatches'])))
+
+if __name__ == '__main__':
+    main()
@@ -4,8 +4,8 @@ Created on Dec 11, 2015
 @author: Benjamin Jakubowski
 '''
 '''
-This module checks that the SCHMA data is available, and that it is stored in a data sub-directory
-of the parent directory. It then checks that other necessary directories exist, and if not,
+This module checks that the SCHMA data is available (if it's needed), and that it is stored in a data
+sub-directory of the parent directory. It then checks that other necessary directories exist, and if not,
 it creates them (so they're available for getting/cleaning/saving data)
 '''
 
@@ -16,8 +16,11 @@ if __name__ == "__main__":
     
 import os
 
-def check_filesystem():
-    if os.path.exists('../data/SCHMA/schma19962013.csv'):
+def check_filesystem(SCHMA_required=True):
+    '''
+    SCHMA_required is False if none of the stages being run reads the SCHMA data (i.e. main.py --only derived_features).
+    '''
+    if os.path.exists('../data/SCHMA/schma19962013.csv') or not SCHMA_required:
         if not os.path.isdir('../data/raw_school_expenditures_by_year'):
             os.mkdir('../data/raw_school_expenditures_by_year')
         if not os.path.isdir('../data/clean_expenditure_data_by_year'):
@@ -15,18 +15,23 @@ if __name__ == "__main__":
     print "Not to be called directly- exiting program"
     sys.exit()
 
-from urllib2 import urlopen, HTTPError, URLError
-from lxml.html import parse
 import pandas as pd
-from retrying import retry
+from scrape_expenditure_data import search_expenditure_reports, school_name_from_options, retry_if_URL_error_not_HTTP_error
+from school_name_index import get_school_name_index, save_school_name_indexes
+from demo_account_snapshot import get_demo_account_snapshot
 
 def get_all_DBNs():
-    query = 'https://nycopendata.socrata.com/api/views/ihfw-zy9j/rows.csv?accessType=DOWNLOAD'
-    Demo_and_Account = pd.read_csv(query)
+    Demo_and_Account = get_demo_account_snapshot()
     all_DBNs = Demo_and_Account[['DBN','schoolyear']]
     return all_DBNs
 
 def check_webscraper_coverage():
+    '''
+    Returns a dictionary with keys = years, vals = the number of schools missed by the webscraper whose
+    expenditure reports are found by the search form. Note this needs the network (to get the
+    Demographic and Accountability snapshot, if it isn't cached, and to search for the missed schools),
+    and raises URLError if the snapshot or a search can't be fetched.
+    '''
     ## read in raw scraped data
     all_years_data = {}
     for year in range(2006,2013):
@@ -55,59 +60,37 @@ def check_webscraper_coverage():
         print 'Year = ', year
         for school in missed_schools[year]:
             results[year] += how_many_schools_missed(year, school)
+    save_school_name_indexes()
             
     return results
         
 
-def retry_if_URL_error_not_HTTP_error(exception):
-    '''Return True if we should retry (in this case when it's a URLError (i.e. network is down) and not an
-    HTTPError (i.e. page doesn't exist)'''
-    return (isinstance(exception, URLError) and not isinstance(exception, HTTPError))
-            
-##Retry decorator will retry every two seconds, for up to 10 seconds, if server side error
- 
-@retry(retry_on_exception=retry_if_URL_error_not_HTTP_error, wait_fixed=2000, stop_max_delay=10000)
+##Note failed searches are retried by the scraper's retry scheduler (with backoff), so they aren't retried here
 def how_many_schools_missed(year, DBN):
     ##counter for missed schools:
     missed_school_counts = 0
     
-    ##build initial query using year and DBN
-    years = str(year-1) + '_' + str(year)
-    query1 = ("https://www.nycenet.edu/offices/d_chanc_oper/budget/exp01/y" + years +
-             "/function.asp?district=All&search=" + DBN +
-             "&searchgo=Search&LCMS=**&GRANT=NO&cr1=All&cr2=All&cr3=All&cr4=All&R=1&prior=search")
-    
-    ##get school name by searching html page returned from query- if not found, return None.
-    try:
-        parsed1 = parse(urlopen(query1))
-        doc=parsed1.getroot()
-        options = doc.findall('.//option')
-        
-        print_next=False
-        for option in options:
-            if 'No Schools Found' in option.text_content():
-                print option.text_content()
-                return 0
-                
-            elif 'School List' in option.text_content():
-                print_next=True ##Then the next option includes the school name
-                missed_school_counts +=1
-                continue
-                
-            if print_next==True: ##So print it
-                print option.text_content()
-                print_next=False
-                
-        return missed_school_counts
-    
-    except HTTPError as e:
-        print e
-        return None
+    ##get search results from the year's school name index (searching by DBN if not yet indexed)
+    ##- if the search fails, its URLError is raised (since the coverage can't be checked).
+    index = get_school_name_index(year)
+    entry = index.get(DBN)
+    if entry is None:
+        options = search_expenditure_reports(year, DBN)
+        entry = index.put(DBN, school_name_from_options(DBN, options), options)
     
-    except URLError as y:
-        print y
-        return None
-    
-    except URLError as y:
-        print y
-        return None
\ No newline at end of file
+    print_next=False
+    for option in entry['options']:
+        if 'No Schools Found' in option:
+            print option
+            return 0
+            
+        elif 'School List' in option:
+            print_next=True ##Then the next option includes the school name
+            missed_school_counts +=1
+            continue
+            
+        if print_next==True: ##So print it
+            print option
+            print_next=False
+            
+    return missed_school_counts
@@ -19,25 +19,28 @@ if __name__ == "__main__":
     sys.exit()
     
     
-import pandas as pd
+from schma_reader import iter_SCHMA, SCHMA_PATH, SCHMA_DTYPES
+from storage import save_table_chunks
 
-def clean_SCHMA():
+def clean_SCHMA(path=SCHMA_PATH, save_path='../data/clean_SCHMA.csv', years=(2006,2012), chunksize=100000):
     '''
     Read and clean the SCHMA data. Save cleaned SCHMA data to csv file. Note that
     in an exploratory ipython notebook, the max and min of the latitude and longitudes
     was shown to be in the permissible range (such that these feaures don't need additional
     cleaning.
+    The SCHMA data is read (and the cleaned data written) chunksize rows at a time, keeping only
+    records with YEAR between 2006 and 2012 (or the input years), with each column's type fixed
+    (see schma_reader.SCHMA_DTYPES) so it's the same in every chunk. The binary copy of the csv file
+    (see storage.py) is built from the same chunks, as they're written.
     '''
     
-    raw_SCHMA = pd.read_csv('../data/SCHMA/schma19962013.csv', usecols=['YEAR', 'BNLONG','LCGGEOX','LCGGEOY'], low_memory=False)
+    columns = ['YEAR', 'BNLONG','LCGGEOX','LCGGEOY']
+    def cleaned_chunks():
+        for proc_SCHMA in iter_SCHMA(path, columns=columns, years=years, chunksize=chunksize,
+                                     dtype=dict((c, SCHMA_DTYPES[c]) for c in columns)):
+            ## Drop missing values- need BNLONG and Year to merge, and lat/long to plot. Imputation also
+            ## not permissible, since schools can move between buildings while retaining code.
+            yield proc_SCHMA.dropna().astype({'YEAR': int})
     
-    ## Drop all records with YEAR not between 2006 and 2012.
-    proc_SCHMA = raw_SCHMA.loc[(2006 <= raw_SCHMA.YEAR)]
-    proc_SCHMA = proc_SCHMA.loc[(raw_SCHMA.YEAR <= 2012)]
-    
-    ## Drop missing values- need BNLONG and Year to merge, and lat/long to plot. Imputation also
-    ## not permissible, since schools can move between buildings while retaining code.
-    proc_SCHMA.dropna(inplace=True)
-    
-    ##Save to csv file
-    proc_SCHMA.to_csv('../data/clean_SCHMA.csv')
\ No newline at end of file
+    ##Save to csv file (and binary), a chunk at a time
+    save_table_chunks(cleaned_chunks(), save_path)
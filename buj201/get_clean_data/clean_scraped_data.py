@@ -5,7 +5,7 @@ Created on Dec 10, 2015
 '''
 '''
 This module reads in the scraped school expenditure data.
-It then cleans this data and saves each year as a cleaned csv file.
+It then cleans this data and saves each year as a cleaned csv file (and its binary copy- see storage.py).
 '''
 import sys
 if __name__ == "__main__":
@@ -14,6 +14,7 @@ if __name__ == "__main__":
     
     
 import pandas as pd
+from storage import save_table
 
 def clean_scraped_data():
     '''Cleans the data scraped from NYC schol expenditure reports and saves cleaned data.'''
@@ -38,4 +39,4 @@ def clean_scraped_data():
         all_years_data[year].drop(mask, axis=1, inplace=True)
         all_years_data[year]['Title_1'] = all_years_data[year]['Title_1'].map({'Yes':1.0, 'No':0.0})
         path = '../data/clean_expenditure_data_by_year/clean_year_{}.csv'.format(str(year))
-        all_years_data[year].to_csv(path)
\ No newline at end of file
+        save_table(all_years_data[year], path)
\ No newline at end of file
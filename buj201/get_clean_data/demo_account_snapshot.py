@@ -0,0 +1,88 @@
+'''
+This module provides a single, shared accessor for the NYC School Demographics and
+Accountability Snapshot 2006-2012 (from NYC Open Data).
+
+The snapshot is used by the scraper (to get the list of DBNs to scrape), by the webscraper
+coverage check, and by the demographics cleaning stage. Rather than each of these downloading
+and parsing the multi-megabyte csv file, get_demo_account_snapshot:
+    - Downloads the snapshot once to a local file (SNAPSHOT_PATH), recording its MD5 checksum (under
+    a file lock, so concurrent pipeline stages- the scrape and the demographics cleaning- don't
+    both download it)
+    - Verifies the checksum whenever the local copy is used (re-downloading it if corrupted)
+    - Parses it once per process, returning a copy of the parsed dataframe to each caller.
+To run the pipeline offline, a local copy of the snapshot can be used instead by setting
+the DEMO_ACCOUNT_SNAPSHOT environment variable to its path.
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import fcntl
+import hashlib
+import os
+import tempfile
+import pandas as pd
+from http_transport import shared_transport
+
+SNAPSHOT_URL = 'https://data.cityofnewyork.us/api/views/ihfw-zy9j/rows.csv?accessType=DOWNLOAD'
+SNAPSHOT_PATH = '../data/demo_account_snapshot.csv'
+LOCAL_SNAPSHOT_PATH = os.environ.get('DEMO_ACCOUNT_SNAPSHOT')
+
+_parsed_snapshots = {}
+
+def file_md5(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024*1024), ''):
+            md5.update(block)
+    return md5.hexdigest()
+
+def snapshot_is_valid(path=SNAPSHOT_PATH):
+    '''
+    Returns True if the snapshot at path exists and matches its recorded MD5 checksum.
+    '''
+    if not (os.path.exists(path) and os.path.exists(path + '.md5')):
+        return False
+    with open(path + '.md5') as f:
+        return f.read().strip() == file_md5(path)
+
+def download_snapshot(url=SNAPSHOT_URL, path=SNAPSHOT_PATH):
+    '''
+    Downloads the snapshot from url to path (via a temporary file, so an interrupted download
+    never leaves a partial snapshot at path), and records its MD5 checksum in path + '.md5'.
+    '''
+    print 'Downloading demographics and accountability snapshot'
+    snapshot = shared_transport.request(url)
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(handle, 'wb') as f:
+        f.write(snapshot)
+    os.rename(temp_path, path)
+    with open(path + '.md5', 'w') as f:
+        f.write(hashlib.md5(snapshot).hexdigest())
+
+def get_snapshot_path():
+    '''
+    Returns the path of a verified local copy of the snapshot: either the local stand-in
+    (if DEMO_ACCOUNT_SNAPSHOT is set), or the cached download (downloading it if needed, while
+    holding a lock on SNAPSHOT_PATH + '.lock').
+    '''
+    if LOCAL_SNAPSHOT_PATH is not None:
+        if not os.path.exists(LOCAL_SNAPSHOT_PATH):
+            raise IOError('DEMO_ACCOUNT_SNAPSHOT is set, but {} does not exist'.format(LOCAL_SNAPSHOT_PATH))
+        return LOCAL_SNAPSHOT_PATH
+    ## Note the lock is held while validating, so a process waiting on another's download uses it
+    with open(SNAPSHOT_PATH + '.lock', 'a') as lock_file:
+        fcntl.lockf(lock_file, fcntl.LOCK_EX)
+        if not snapshot_is_valid(SNAPSHOT_PATH):
+            download_snapshot(SNAPSHOT_URL, SNAPSHOT_PATH)
+    return SNAPSHOT_PATH
+
+def get_demo_account_snapshot():
+    '''
+    Returns the demographics and accountability snapshot as a dataframe. The snapshot is only
+    downloaded and parsed once- each call returns a copy, so callers can modify it freely.
+    '''
+    if 'snapshot' not in _parsed_snapshots:
+        _parsed_snapshots['snapshot'] = pd.read_csv(get_snapshot_path())
+    return _parsed_snapshots['snapshot'].copy()
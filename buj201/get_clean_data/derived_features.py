@@ -0,0 +1,105 @@
+'''
+This module derives the features the expenditure visualizers plot from the merged data, once (as
+a pipeline stage- see main.py), rather than in every visualizer, on every interaction.
+
+For each year, it saves (with storage.save_table):
+    - The expenditure shares: each expenditure as a fraction of the school's total expenditures
+    (as plotted by the boxplots, and mapped by the school map), followed by the school's ID and
+    demographic features.
+    - The scaled expenditures: each expenditure centered (by subtracting the mean) and scaled
+    (dividing by the maximum), as projected by the PCA explorer, followed by the ID and demographic
+    features.
+It also saves the column registry: which merged features are IDs, demographic features, or
+expenditures (for each year).
+The derived datasets are versioned- if the way a feature is derived changes, DERIVED_VERSION is
+incremented, so the datasets are saved in a new directory (and visualizers never read datasets
+derived by an older version).
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import json
+import os
+import pandas as pd
+from storage import load_table, save_table
+
+DERIVED_VERSION = 1
+DERIVED_DIRECTORY = '../data/derived_features/v{}'.format(DERIVED_VERSION)
+YEARS = range(2006,2013)
+
+ID_FEATURES = ['School', 'District', 'Name', 'schoolyear']
+DEMOGRAPHIC_FEATURES = ['Title_1', 'fl_percent', 'frl_percent', 'total_enrollment', 'ell_percent',
+                        'sped_percent', 'asian_per', 'black_per', 'hispanic_per', 'white_per',
+                        'male_per', 'female_per', 'poverty_level', 'elementary_school',
+                        'middle_school', 'high_school']
+## The non-expenditure features, in the order the visualizers append them to the derived expenditures
+NON_EXPENDITURE_FEATURES = ['School', 'District', 'Title_1', 'Name', 'schoolyear'] + DEMOGRAPHIC_FEATURES[1:]
+
+def derived_path(name, year, directory=DERIVED_DIRECTORY):
+    '''Returns the path of the derived dataset name ('shares' or 'scaled') for year.'''
+    return os.path.join(directory, '{}_year_{}.csv'.format(name, year))
+
+def registry_path(directory=DERIVED_DIRECTORY):
+    return os.path.join(directory, 'column_registry.json')
+
+def derived_outputs(years=YEARS, directory=DERIVED_DIRECTORY):
+    '''Returns the paths of every file saved by save_derived_features.'''
+    return ([derived_path(name, year, directory) for name in ['shares', 'scaled'] for year in years] +
+            [registry_path(directory)])
+
+def column_registry(columns):
+    '''
+    Takes a list of merged features, and returns a dictionary mapping 'id', 'demographic', and
+    'expenditure' to the (merged) features of that kind.
+    '''
+    return {'id': [c for c in columns if c in ID_FEATURES],
+            'demographic': [c for c in columns if c in DEMOGRAPHIC_FEATURES],
+            'expenditure': [c for c in columns if c not in NON_EXPENDITURE_FEATURES]}
+
+def expenditure_shares(data):
+    '''
+    Takes a year's merged data, and returns each expenditure as a fraction of the school's
+    total expenditures, followed by the non-expenditure features.
+    '''
+    numeric = data.drop(NON_EXPENDITURE_FEATURES, axis=1)
+    numeric = numeric.div(numeric.Total, axis='index')
+    return pd.concat([numeric, data[NON_EXPENDITURE_FEATURES]], axis=1)
+
+def scaled_expenditures(data):
+    '''
+    Takes a year's merged data, and returns the expenditures centered (by subtracting the mean),
+    then scaled (dividing by the maximum), followed by the non-expenditure features.
+    '''
+    numeric = data.drop(NON_EXPENDITURE_FEATURES, axis=1)
+    numeric = (numeric - numeric.mean())
+    numeric = numeric / numeric.max()
+    return pd.concat([numeric, data[NON_EXPENDITURE_FEATURES]], axis=1)
+
+def save_derived_features(merged_path='../data/merged_data/expenditure_demo_account_year_{}.csv',
+                          years=YEARS, directory=DERIVED_DIRECTORY):
+    '''
+    Derives the expenditure shares and scaled expenditures from each year's merged data (at merged_path),
+    and saves them (and the column registry) in directory.
+    '''
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    registry = {'version': DERIVED_VERSION, 'years': {}}
+    for year in years:
+        data = load_table(merged_path.format(year))
+        save_table(expenditure_shares(data), derived_path('shares', year, directory))
+        save_table(scaled_expenditures(data), derived_path('scaled', year, directory))
+        registry['years'][str(year)] = column_registry(list(data.columns))
+    with open(registry_path(directory), 'w') as f:
+        json.dump(registry, f, indent=1, sort_keys=True)
+
+def load_column_registry(directory=DERIVED_DIRECTORY):
+    '''
+    Returns the column registry, as a dictionary with keys = years, vals = the year's registry
+    (see column_registry).
+    '''
+    with open(registry_path(directory)) as f:
+        registry = json.load(f)
+    return dict((int(year), dict((str(kind), [str(c) for c in columns]) for kind, columns in kinds.items()))
+                for year, kinds in registry['years'].items())
@@ -0,0 +1,155 @@
+'''
+This module provides a concurrent fetch engine for the webscraper.
+
+Scraping the expenditure reports one DBN at a time leaves the program idle for
+almost all of its run time (waiting on two network round trips per school). The
+fetch engine instead runs the per-DBN work in a pool of worker threads, with:
+    - A configurable concurrency limit (number of DBNs in flight at once)
+    - Per-host politeness settings: a cap on the number of simultaneous connections
+    to any one host, and a minimum interval between requests to that host.
+    - Optionally, a shared retry_scheduler (see retry_scheduler.py), which rate limits all
+    requests and retries failed requests with backoff.
+Results are always returned in input order, so the scraped data is identical to
+that produced by the sequential scraper.
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+from urllib2 import HTTPError
+from urlparse import urlparse
+from StringIO import StringIO
+from http_transport import shared_transport
+from response_cache import cacheable_error
+
+## Waiting on a pool's results without a timeout can't be interrupted (a KeyboardInterrupt isn't raised
+## until the wait returns), so results are waited for with this timeout (one week, i.e. unbounded) instead.
+RESULT_WAIT_SECONDS = 7*24*60*60
+
+class host_politeness(object):
+    '''
+    Tracks requests made to each host, and blocks callers as needed so that
+    no more than max_connections requests are in flight to a host at once, and
+    so that consecutive requests to a host start at least min_interval seconds apart.
+    '''
+
+    def __init__(self, max_connections=8, min_interval=0.05):
+        self.max_connections = max_connections
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        self.slots = {}
+        self.next_start = {}
+
+    def acquire(self, host):
+        '''
+        Wait for a free connection slot for host, then wait until min_interval has
+        passed since the last request to host started.
+        '''
+        with self.lock:
+            if host not in self.slots:
+                self.slots[host] = threading.BoundedSemaphore(self.max_connections)
+                self.next_start[host] = 0.0
+            slot = self.slots[host]
+        slot.acquire()
+        with self.lock:
+            start = max(time.time(), self.next_start[host])
+            self.next_start[host] = start + self.min_interval
+        delay = start - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def release(self, host):
+        self.slots[host].release()
+
+
+class fetch_engine(object):
+    '''
+    Concurrent fetch engine. fetch_engine.map runs a function over a list of work items
+    (i.e. DBNs) in a thread pool, and fetch_engine.urlopen opens URLs subject to the
+    engine's per-host politeness settings. If a response_cache is given, pages are served
+    from the cache when available, and fetched pages (and error responses that won't change on a
+    retry) are stored in it. Pages are fetched using transport (by default, the shared pooled
+    http_transport). If a retry_scheduler is given, every network request is made through it.
+    '''
+
+    def __init__(self, concurrency=16, max_connections_per_host=8, min_request_interval=0.05, cache=None, transport=None, scheduler=None):
+        self.concurrency = concurrency
+        self.cache = cache
+        self.transport = transport if transport is not None else shared_transport
+        self.scheduler = scheduler
+        self.politeness = host_politeness(max_connections_per_host, min_request_interval)
+
+    def urlopen(self, url, store=True):
+        '''
+        Opens url (once a connection slot for its host is available), reads the full response,
+        and returns it as a file-like object. Note HTTPError and URLError propagate to the caller
+        (once the scheduler, if any, gives up retrying), so callers handle them exactly as they
+        would for urllib2.urlopen. If store is False, the fetched page isn't stored in the cache
+        (the caller stores it elsewhere, i.e. in the page archive)- but error responses still are.
+        '''
+        if self.cache is not None:
+            page = self.cache.get(url)
+            if page is not None:
+                return StringIO(page)
+        try:
+            if self.scheduler is not None:
+                page = self.scheduler.call(self.fetch, url)
+            else:
+                page = self.fetch(url)
+        except HTTPError as error:
+            if self.cache is not None and cacheable_error(error.code):
+                self.cache.put_error(url, error.code)
+            raise
+        if self.cache is not None and store:
+            self.cache.put(url, page)
+        return StringIO(page)
+
+    def fetch(self, url):
+        '''
+        Makes a single request for url (once a connection slot for its host is available),
+        and returns the response body.
+        '''
+        host = urlparse(url).netloc
+        self.politeness.acquire(host)
+        try:
+            return self.transport.request(url)
+        finally:
+            self.politeness.release(host)
+
+    def map(self, function, items):
+        '''
+        Applies function to each of items, running up to self.concurrency calls at once.
+        Returns the list of results, in the same order as items.
+        '''
+        items = list(items)
+        if self.concurrency <= 1:
+            return [function(item) for item in items]
+        pool = ThreadPool(min(self.concurrency, max(len(items), 1)))
+        try:
+            ## Note we get() with a timeout so a KeyboardInterrupt reaches the main thread.
+            results = pool.map_async(function, items).get(timeout=RESULT_WAIT_SECONDS)
+        finally:
+            pool.terminate()
+        return results
+
+    def imap(self, function, items):
+        '''
+        Like fetch_engine.map, but yields results (in the same order as items) as soon as they
+        are available, so callers can consume results without holding them all in memory.
+        '''
+        items = list(items)
+        if self.concurrency <= 1:
+            for item in items:
+                yield function(item)
+            return
+        pool = ThreadPool(min(self.concurrency, max(len(items), 1)))
+        try:
+            results = pool.imap(function, items)
+            for i in range(len(items)):
+                yield results.next(timeout=RESULT_WAIT_SECONDS)
+        finally:
+            pool.terminate()
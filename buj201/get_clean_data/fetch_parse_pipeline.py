@@ -0,0 +1,136 @@
+'''
+This module provides a two-stage fetch/parse pipeline for the webscraper.
+
+Fetching a report page is almost all waiting on the network, while parsing it is almost all
+CPU time- and in a single thread (or in threads sharing one interpreter lock), each leaves the
+other idle. The pipeline separates the two:
+    - Fetch stage: the fetch engine's I/O threads run the fetch function on each work unit (i.e.
+    fetching and archiving a school's report page), passing the results on to the parse stage.
+    - Parse stage: a pool of worker processes runs the parse function on each fetched item (i.e.
+    parsing the archived page into the school's features), using every CPU.
+At most queue_size fetched items are handed to the parse stage and not yet parsed at once: the fetch
+stage takes a slot for each item it hands on, and a slot is freed as each parse result is consumed.
+So if parsing falls behind, the fetch stage waits (and, since the next batch of units is only fetched
+once the current batch has been handed on, stops fetching once the current batch is fetched), and
+pages never pile up in memory. Note the pool's own task queue is unbounded, so the slots (rather than
+a bounded queue) are what limit the work in flight. fetch_parse_pipeline.parse runs the parse stage
+alone, i.e. to re-parse archived pages without fetching anything.
+Note the parse function is called in other processes, so it must be a module-level function,
+and its argument and result must be picklable.
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import Queue
+import threading
+import time
+from multiprocessing import Pool
+from fetch_engine import RESULT_WAIT_SECONDS
+
+## Marks the end of the fetch stage's output
+_END = object()
+
+class fetch_parse_pipeline(object):
+    '''
+    Fetches work units with engine (a fetch_engine), and parses them in a pool of processes
+    worker processes (by default, one per CPU). At most queue_size fetched items are in flight
+    (handed to the parse stage, but their results not yet consumed).
+    '''
+
+    def __init__(self, engine, processes=None, queue_size=64):
+        self.engine = engine
+        self.processes = processes
+        self.queue_size = queue_size
+
+    def run(self, batches, fetch, parse):
+        '''
+        Runs fetch (in the engine's threads) on each unit in batches (an iterable of lists of work
+        units, which is only advanced once the previous batch has been fetched), and parse (in the
+        process pool) on each fetched item. Yields the parse results as they're available (not
+        necessarily in order).
+        '''
+        ## Note the pool is started before the fetch thread, so worker processes aren't forked mid-fetch.
+        pool = Pool(self.processes)
+        fetched = Queue.Queue(self.queue_size)
+        ## One slot per fetched item in flight- taken by the fetch stage, freed as results are consumed
+        slots = threading.Semaphore(self.queue_size)
+        stopped = threading.Event()
+        errors = []
+
+        def put(item):
+            ## Returns False (without waiting for a slot or space in the queue) once the consumer has stopped
+            if item is not _END:
+                while not slots.acquire(False):
+                    if stopped.is_set():
+                        return False
+                    time.sleep(0.01)
+            while not stopped.is_set():
+                try:
+                    fetched.put(item, timeout=0.1)
+                    return True
+                except Queue.Full:
+                    pass
+            return False
+
+        def fetch_all():
+            try:
+                for batch in batches:
+                    for item in self.engine.imap(fetch, batch):
+                        if not put(item):
+                            return
+            except Exception as e:
+                errors.append(e)
+            finally:
+                put(_END)
+
+        def fetched_items():
+            ## Note this runs in the pool's task handler thread- it must also end once the consumer has stopped
+            while True:
+                try:
+                    item = fetched.get(timeout=0.1)
+                except Queue.Empty:
+                    if stopped.is_set():
+                        return
+                    continue
+                if item is _END:
+                    return
+                yield item
+
+        fetch_thread = threading.Thread(target=fetch_all)
+        fetch_thread.daemon = True
+        fetch_thread.start()
+        try:
+            for result in self.iter_results(pool.imap_unordered(parse, fetched_items())):
+                slots.release()
+                yield result
+        finally:
+            ## Stop the fetch stage too (i.e. if the caller stops early, or parsing fails)
+            stopped.set()
+            fetch_thread.join()
+            pool.terminate()
+        if errors:
+            raise errors[0]
+
+    def parse(self, items, parse):
+        '''
+        Runs parse (in the process pool) on each of items, yielding the results as they're
+        available (not necessarily in order).
+        '''
+        pool = Pool(self.processes)
+        try:
+            for result in self.iter_results(pool.imap_unordered(parse, items)):
+                yield result
+        finally:
+            pool.terminate()
+
+    def iter_results(self, results):
+        ## Note we call next() with a timeout (see RESULT_WAIT_SECONDS) so a KeyboardInterrupt reaches the main thread (this is
+        ## why items are sent to the pool one at a time- with a chunksize, imap_unordered returns a
+        ## plain generator).
+        while True:
+            try:
+                yield results.next(timeout=RESULT_WAIT_SECONDS)
+            except StopIteration:
+                return
@@ -17,19 +17,16 @@ if __name__ == "__main__":
     sys.exit()
     
     
-import numpy as np
 import pandas as pd
-from scipy import stats
-import re
+from demo_account_snapshot import get_demo_account_snapshot
+from percentile_rank import percentile_rank
+from storage import save_table
 
 def get_and_clean_demo_and_account():
-    query = 'https://data.cityofnewyork.us/api/views/ihfw-zy9j/rows.csv?accessType=DOWNLOAD'
-    demo_and_account = pd.read_csv(query)
+    demo_and_account = get_demo_account_snapshot()
     
-    ## Clean all the numeric features in demo_and_account dataframe using find_bad_vals helper function.
-    for feature in demo_and_account.drop(['Name','DBN','schoolyear'],axis=1).columns:
-        demo_and_account.loc[(demo_and_account[feature].isin(find_bad_vals(feature, demo_and_account).keys())),feature] = np.NaN
-        demo_and_account[feature] =  demo_and_account[feature].astype(float)
+    ## Clean all the numeric features in demo_and_account dataframe using coerce_numeric_features helper function.
+    coerce_numeric_features(demo_and_account, demo_and_account.drop(['Name','DBN','schoolyear'],axis=1).columns)
     
     ## Drop the first two characters (district code) from the DBN
     ## (so DBN can be used as a merge key with our other datasets),
@@ -43,7 +40,7 @@ def get_and_clean_demo_and_account():
     demo_and_account.drop(['ell_num','sped_num','ctt_num','selfcontained_num','asian_num','black_num','hispanic_num','white_num','male_num','female_num'], axis=1, inplace=True)
     
     ## Fill the missing grade-level enrollment values:
-    for feature in ['prek','k','grade1','grade2','grade3','grade4','grade5','grade6','grade7','grade8','grade9','grade10','grade11','grade12']:
+    for feature in GRADES:
         demo_and_account[feature].fillna(0,inplace=True)
         
     ## Use mean imputation to fill missing ell_percent values:
@@ -56,37 +53,65 @@ def get_and_clean_demo_and_account():
     demo_and_account = impute_school_type(demo_and_account)
     
     ##Finally write to a csv file:
-    demo_and_account.to_csv('../data/clean_demo_account.csv')
+    save_table(demo_and_account, '../data/clean_demo_account.csv')
 
     
+## Numeric entries start with digits (optionally followed by a decimal point and more digits)
+NUMERIC = '[0-9]+\.?[0-9]*'
+
+def coerce_numeric_features(dataframe, features):
+    '''
+    A helper function that converts each of the input features in dataframe to float (in place),
+    replacing non-numeric entries with NaN. Returns a dictionary with keys = features,
+    vals = the dictionary of bad values for that feature (as returned by find_bad_vals).
+    '''
+    bad_vals = {}
+    for feature in features:
+        dataframe[feature], bad_vals[feature] = coerce_numeric(dataframe[feature])
+    return bad_vals
+
+def coerce_numeric(column):
+    '''
+    Converts column to float, replacing non-numeric entries with NaN. Returns the converted column and
+    its dictionary of bad values. Note each distinct value is only checked once (so the regular expression
+    is matched against the column's distinct values, rather than every entry).
+    '''
+    counts = column.value_counts(dropna=False)
+    tokens = pd.Series(counts.index, index=counts.index).astype(str)
+    is_bad = ~tokens.str.match(NUMERIC).values
+    bad_vals = {}
+    for val, count in zip(tokens.values[is_bad], counts.values[is_bad]):
+        bad_vals[val] = bad_vals.get(val, 0) + int(count)
+    return column.where(~column.isin(counts.index[is_bad])).astype(float), bad_vals
+
 def find_bad_vals(feature, dataframe):
     '''
     A helper function that takes an input feature and returns dictionary
     with keys = non-numeric entries in demo_and_account[feature],
     vals = number of occurences of these bad values in the dataframe.
     '''
-    bad_vals = {}
-    for val in dataframe[feature].astype(str):
-        finder = re.match('[0-9]+\.?[0-9]*', val)
-        if finder == None:
-            if val in bad_vals:
-                bad_vals[val] += 1
-            else:
-                bad_vals[val] = 1
-    return bad_vals
+    return coerce_numeric(dataframe[feature])[1]
 
 
-def fill_missed_ell(dataframe):
+def fill_missed_ell(dataframe, strategy='mean'):
     '''
     Use mean imputation to fill the missing ell_percent values
     '''
-    missing_ell = dataframe[dataframe.ell_percent.isnull()].groupby('DBN')
-    avg_ell = {}
-    for group in missing_ell.groups:
-        avg_ell[group] = dataframe[(dataframe.DBN == group)]['ell_percent'].mean()
-    dataframe.loc[dataframe['ell_percent'].isnull(),'ell_percent'] = dataframe.loc[dataframe['ell_percent'].isnull(), 'DBN'].map(lambda x: avg_ell[x])
+    return impute_from_group(dataframe, 'ell_percent', 'DBN', strategy)
+
+
+def impute_from_group(dataframe, feature, by, strategy='mean', drop_unfilled=True):
+    '''
+    Fills the missing values of feature with a summary (strategy- any groupby aggregation, i.e. 'mean'
+    or 'median') of the available values in the same group (i.e. for ell_percent, the school's values
+    in other years), computed for all groups at once. If drop_unfilled, rows that still have no value
+    (because no value is available for their group) are dropped.
+    '''
+    missing = dataframe[feature].isnull()
+    dataframe.loc[missing,feature] = dataframe.groupby(by)[feature].transform(strategy)[missing]
     ## Drop school's with no mean available (only 3 cases- see exploratory ipynb)
-    dataframe = dataframe.loc[dataframe['ell_percent'].notnull(),:]
+    if drop_unfilled:
+        dataframe = dataframe.loc[dataframe[feature].notnull(),:]
     return dataframe
 
 
@@ -99,18 +124,21 @@ def construct_poverty_rank_measure(dataframe):
     poverty_level- that ranks a school's poverty level as a percentile
     using the available metric for each year.
     '''
-    grouped = dataframe.groupby('schoolyear')
-    
-    for year in range(2006,2010):
-        data = dataframe.loc[grouped.groups[str(year)],'fl_percent']
-        dataframe.loc[grouped.groups[str(year)],'poverty_level'] = [stats.percentileofscore(data, a, 'weak') for a in data]
-        
-    for year in range(2010,2013):
-        data = dataframe.loc[grouped.groups[str(year)],'frl_percent']
-        dataframe.loc[grouped.groups[str(year)],'poverty_level'] = [stats.percentileofscore(data, a, 'weak') for a in data]
+    ## fl_percent for AYs ending 2006-2009, frl_percent for AYs ending 2010-2012
+    year = dataframe['schoolyear'].astype(int)
+    poverty = dataframe['fl_percent'].where(year < 2010, dataframe['frl_percent'])
+    in_range = (year >= 2006) & (year <= 2012)
+    dataframe.loc[in_range,'poverty_level'] = percentile_rank(poverty[in_range], by=dataframe.loc[in_range,'schoolyear'])
     return dataframe
     
-def impute_school_type(dataframe):
+## School type cutoffs: a school is of each type if at least the given share of its students are
+## enrolled in the given grades.
+GRADES = ['prek','k','grade1','grade2','grade3','grade4','grade5','grade6','grade7','grade8','grade9','grade10','grade11','grade12']
+SCHOOL_TYPE_THRESHOLDS = [('elementary_school', GRADES[:7], 0.3),
+                          ('middle_school', GRADES[7:10], 0.15),
+                          ('high_school', GRADES[10:], 0.3)]
+
+def impute_school_type(dataframe, thresholds=SCHOOL_TYPE_THRESHOLDS):
     '''
     Impute whether a school is an elementary, middle, and/or high school.
     Heuristically define cutoffs as:
@@ -120,10 +148,12 @@ def impute_school_type(dataframe):
     Note this does not partition schools, but it is reasonable in that
     no school is considered an elementary and high, but not middle.
     After imputation, drop grade level enrollment totals.
+    (The cutoffs can be changed with thresholds, a list of (school type, grades, cutoff)).
     '''
-
-    dataframe['elementary_school'] = ((dataframe['prek']+dataframe['k']+dataframe['grade1']+dataframe['grade2']+dataframe['grade3']+dataframe['grade4']+dataframe['grade5'])/dataframe['total_enrollment']).map(lambda x: 0 if x<0.3 else 1)
-    dataframe['middle_school'] = ((dataframe['grade6']+dataframe['grade7']+dataframe['grade8'])/dataframe['total_enrollment']).map(lambda x: 0 if x<0.15 else 1)
-    dataframe['high_school'] = ((dataframe['grade9']+dataframe['grade10']+dataframe['grade11']+dataframe['grade12'])/dataframe['total_enrollment']).map(lambda x: 0 if x<0.3 else 1)
-    dataframe.drop(['prek', 'k', 'grade1', 'grade2', 'grade3', 'grade4', 'grade5', 'grade6', 'grade7', 'grade8', 'grade9', 'grade10', 'grade11', 'grade12'], axis=1, inplace=True)
-    return dataframe
\ No newline at end of file
+    
+    for school_type, grades, cutoff in thresholds:
+        share = dataframe[grades].sum(axis=1, skipna=False)/dataframe['total_enrollment']
+        ## Note schools with no enrollment data (share NaN or infinite) are not below the cutoff
+        dataframe[school_type] = (~(share < cutoff)).astype(int)
+    dataframe.drop(GRADES, axis=1, inplace=True)
+    return dataframe
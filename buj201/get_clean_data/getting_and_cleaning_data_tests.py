@@ -5,8 +5,31 @@ Created on Dec 10, 2015
 '''
 import unittest
 import pandas as pd
-from check_webscraper_coverage import check_webscraper_coverage, retry_if_URL_error_not_HTTP_error
+from check_webscraper_coverage import check_webscraper_coverage
 from urllib2 import HTTPError, URLError
+from fetch_engine import fetch_engine
+from row_collector import expenditure_row_collector
+from scrape_journal import scrape_journal
+from work_queue import work_queue
+from response_cache import response_cache, OfflineCacheMiss
+from school_name_index import school_name_index
+from scrape_expenditure_data import school_name_from_options, retry_if_URL_error_or_throttled
+from retry_scheduler import retry_scheduler, token_bucket, circuit_breaker
+from benchmark_report_extractor import legacy_extract_school_features, parse_or_error, load_fixture_corpus
+from report_page_extractor import extract_school_features
+from page_archive import page_archive
+from get_and_clean_school_demo_and_account import coerce_numeric_features, construct_poverty_rank_measure
+from percentile_rank import percentile_rank
+from pipeline import stage, stage_graph
+from storage import save_table, load_table
+from panel import build_panel, save_panel, load_panel
+from derived_features import save_derived_features, derived_path, NON_EXPENDITURE_FEATURES
+from scipy import stats
+import numpy as np
+import shutil
+import time
+import os
+import tempfile
 
 class Test(unittest.TestCase):
 
@@ -15,23 +38,177 @@ class Test(unittest.TestCase):
         ## Drop two columns systematically missing data across years:
         demo_and_account = demo_and_account.drop(['fl_percent', 'frl_percent'], axis=1)
         self.assertEqual(demo_and_account.isnull().any(axis=1).sum(), 0)
-       
+
     def test_clean_expenditure_data_not_NaN(self):
         all_years_data = {}
         for year in range(2006,2013):
             all_years_data[year] = pd.read_csv('../data/clean_expenditure_data_by_year/clean_year_{}.csv'.format(str(year)), index_col=0)
         ## Drop two columns systematically missing data across years:
-            self.assertEqual(all_years_data[year].isnull().any(axis=1).sum(), 0) 
-    
+            self.assertEqual(all_years_data[year].isnull().any(axis=1).sum(), 0)
+
     def test_webscraper_coverage(self):
-        missed_schools_by_year = check_webscraper_coverage()
+        ## Note the coverage check needs the real expenditure report site, so it's skipped when the network is unavailable
+        try:
+            missed_schools_by_year = check_webscraper_coverage()
+        except URLError as e:
+            self.skipTest('network unavailable ({})'.format(e))
         none_missed = dict(zip(range(2006,2013),[0,0,0,0,0,0,0]))
         self.assertDictEqual(missed_schools_by_year, none_missed)
-        
+
     def test_shape_clean_SCHMA(self):
         SCHMA = pd.read_csv('../data/clean_SCHMA.csv', index_col=0)
         self.assertEqual(SCHMA.shape[1], 4)
-        
+
+    def test_fetch_engine_preserves_order(self):
+        engine = fetch_engine(concurrency=8)
+        self.assertEqual(engine.map(lambda x: x*2, range(100)), [x*2 for x in range(100)])
+
+    def test_row_collector_matches_concat(self):
+        raw = pd.read_csv('../data/raw_school_expenditures_by_year/year_2006.csv', index_col=0, dtype=str)
+        schools = [raw.loc[DBN].dropna() for DBN in raw.index[:50]]
+        collector = expenditure_row_collector()
+        for school in schools:
+            collector.add(school)
+        self.assertEqual(collector.to_dataframe().to_csv(), pd.concat(schools, axis=1).T.to_csv())
+
+    def test_scrape_journal_resumes(self):
+        journal_path = tempfile.mktemp(suffix='.sqlite')
+        journal = scrape_journal(journal_path)
+        journal.record(2006, 'M015', 0, 'found', pd.Series({'Teachers': 1}, name='M015'))
+        journal.record(2006, 'X999', 1, 'not_found')
+        journal.close()
+        journal = scrape_journal(journal_path)
+        self.assertEqual(journal.status_counts(2006), {'found': 1, 'not_found': 1})
+        journal.close()
+        os.remove(journal_path)
+
+    def test_work_queue_leases_units(self):
+        queue_path = tempfile.mktemp(suffix='.sqlite')
+        queue = work_queue(queue_path, lease_seconds=60)
+        queue.enqueue(2006, ['M015', 'M019', 'M020'], completed=set(['M019']))
+        ## Workers claim disjoint units, in (year, position) order
+        self.assertEqual(queue.claim('a', 1), [(2006, 'M015', 0)])
+        self.assertEqual(queue.claim('b', 5), [(2006, 'M020', 2)])
+        queue.complete(2006, 'M015')
+        self.assertEqual(queue.remaining(2006), 1)
+        queue.close()
+        os.remove(queue_path)
+
+    def test_response_cache(self):
+        cache_dir = tempfile.mkdtemp()
+        cache = response_cache(cache_dir, ttl=60)
+        cache.put('http://example.com/a', 'page a')
+        self.assertEqual(cache.get('http://example.com/a'), 'page a')
+        ## Expired entries are misses, unless offline
+        os.utime(cache.path_for('http://example.com/a'), (time.time()-120, time.time()-120))
+        self.assertIsNone(cache.get('http://example.com/a'))
+        cache.offline = True
+        self.assertEqual(cache.get('http://example.com/a'), 'page a')
+        self.assertRaises(OfflineCacheMiss, cache.get, 'http://example.com/b')
+        shutil.rmtree(cache_dir)
+
+    def test_response_cache_replays_errors(self):
+        cache_dir = tempfile.mkdtemp()
+        cache = response_cache(cache_dir)
+        cache.put_error('http://example.com/a', 404)
+        with self.assertRaises(HTTPError) as raised:
+            cache.get('http://example.com/a')
+        self.assertEqual(raised.exception.code, 404)
+        shutil.rmtree(cache_dir)
+
+    def test_school_name_index(self):
+        options = ['School List', 'District: 01--M015 P.S. 015 Roberto Clemente']
+        school_name = school_name_from_options('M015', options)
+        self.assertEqual(school_name, 'M01501M015+P.S.+015+Roberto+Clemente')
+        index_dir = tempfile.mkdtemp()
+        index = school_name_index(2006, index_dir)
+        index.put('M015', school_name, options)
+        index.save()
+        self.assertEqual(school_name_index(2006, index_dir).get('M015'), {'school_name': school_name, 'options': options})
+        shutil.rmtree(index_dir)
+
+    def test_report_page_extractor_matches_original_parser(self):
+        for year, DBN, school_name, page in load_fixture_corpus():
+            self.assertEqual(parse_or_error(extract_school_features, page, school_name, DBN),
+                             parse_or_error(legacy_extract_school_features, page, school_name, DBN))
+
+    def test_retry_scheduler(self):
+        failures = [URLError('reset'), HTTPError('url', 503, 'Busy', {}, None)]
+        def flaky():
+            if failures:
+                raise failures.pop(0)
+            return 'page'
+        scheduler = retry_scheduler(retry_if_URL_error_or_throttled, token_bucket(rate=100.0), circuit_breaker(),
+                                    max_attempts=3, base_delay=0.01)
+        self.assertEqual(scheduler.call(flaky), 'page')
+        self.assertEqual(scheduler.stats()['retries'], 2)
+
+    def test_page_archive(self):
+        scratch_directory = tempfile.mkdtemp()
+        archive = page_archive(scratch_directory)
+        archive.put(2006, 'M015', 'M01501M015+P.S.+015', '<html></html>')
+        self.assertEqual(archive.get(2006, 'M015')[0], 'M01501M015+P.S.+015')
+        self.assertEqual(archive.DBNs(2006), ['M015'])
+        shutil.rmtree(scratch_directory)
+
+    def test_coerce_numeric_features(self):
+        snapshot = pd.DataFrame({'ell_num': ['12', 's', '7.5', np.nan]})
+        bad_vals = coerce_numeric_features(snapshot, ['ell_num'])
+        self.assertEqual(bad_vals['ell_num'], {'s': 1, 'nan': 1})
+        pd.util.testing.assert_series_equal(snapshot['ell_num'], pd.Series([12.0, np.nan, 7.5, np.nan], name='ell_num'))
+
+    def test_percentile_rank_matches_percentileofscore(self):
+        data = pd.Series([3.0, 1.0, 3.0, np.nan, 2.0, 5.0])
+        expected = [0.0 if np.isnan(x) else stats.percentileofscore(data, x, 'weak') for x in data]
+        np.testing.assert_array_equal(percentile_rank(data), expected)
+        ## poverty_level is unchanged
+        demo_and_account = pd.read_csv('../data/clean_demo_account.csv', index_col=0, dtype={'schoolyear': str})
+        rebuilt = construct_poverty_rank_measure(demo_and_account.drop('poverty_level', axis=1))
+        pd.util.testing.assert_series_equal(rebuilt['poverty_level'], demo_and_account['poverty_level'])
+
+    def test_stage_graph_runs_stale_stages(self):
+        scratch_directory = tempfile.mkdtemp()
+        path = lambda name: os.path.join(scratch_directory, name)
+        with open(path('raw'), 'w') as f:
+            f.write('raw data')
+        stages = [stage('copy', lambda: shutil.copy(path('raw'), path('clean')), [path('raw')], [path('clean')])]
+        stage_graph(stages, path('state.json')).run(parallel=False)
+        self.assertEqual(stage_graph(stages, path('state.json')).plan(), [])
+        with open(path('raw'), 'w') as f:
+            f.write('new raw data')
+        self.assertEqual([s.name for s, reason in stage_graph(stages, path('state.json')).plan()], ['copy'])
+        shutil.rmtree(scratch_directory)
+
+    def test_storage_round_trip(self):
+        scratch_directory = tempfile.mkdtemp()
+        path = os.path.join(scratch_directory, 'table.csv')
+        save_table(pd.DataFrame({'name': ['a', np.nan], 'count': [1, 2], 'schoolyear': ['2006', '2007']}, index=['x', 'y']), path)
+        pd.util.testing.assert_frame_equal(load_table(path), pd.read_csv(path, index_col=0))
+        ## A binary copy isn't used once its csv file is rewritten
+        pd.DataFrame({'count': [4]}, index=['w']).to_csv(path)
+        self.assertEqual(list(load_table(path).index), ['w'])
+        shutil.rmtree(scratch_directory)
+
+    def test_school_panel(self):
+        scratch_directory = tempfile.mkdtemp()
+        all_years_data = {}
+        for year in [2011, 2012]:
+            all_years_data[year] = pd.read_csv('../data/merged_data/expenditure_demo_account_year_{}.csv'.format(year), index_col=0)
+        save_panel(build_panel(all_years_data), os.path.join(scratch_directory, 'panel.csv'))
+        panel = load_panel(os.path.join(scratch_directory, 'panel.csv'))
+        self.assertEqual(panel.years, [2011, 2012])
+        self.assertEqual(panel.school('M015').loc[2012, 'Total'], all_years_data[2012].loc['M015', 'Total'])
+        shutil.rmtree(scratch_directory)
+
+    def test_derived_shares_match_boxplots(self):
+        scratch_directory = tempfile.mkdtemp()
+        save_derived_features(years=[2012], directory=scratch_directory)
+        merged = pd.read_csv('../data/merged_data/expenditure_demo_account_year_2012.csv', index_col=0)
+        numeric = merged.drop(NON_EXPENDITURE_FEATURES, axis=1)
+        shares = load_table(derived_path('shares', 2012, scratch_directory))
+        np.testing.assert_allclose(shares[numeric.columns].values, numeric.div(numeric.Total, axis='index').values, rtol=1e-12)
+        shutil.rmtree(scratch_directory)
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
-    unittest.main()
\ No newline at end of file
+    unittest.main()
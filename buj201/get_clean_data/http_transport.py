@@ -0,0 +1,170 @@
+'''
+This module provides the shared HTTP transport used for all network requests in get_clean_data.
+
+urllib2.urlopen opens (and closes) a new connection- including a new TLS handshake- for every
+request. For the tens of thousands of requests made to www.nycenet.edu, that handshake is a
+large share of the time spent per request. http_transport instead:
+    - Keeps a pool of open (keep-alive) connections to each host, re-using them across requests
+    and threads (each connection is only used by one thread at a time).
+    - Requests compressed (gzip or deflate) responses, and decompresses them.
+    - Follows redirects, and raises urllib2's HTTPError and URLError on failure (so callers handle
+    errors exactly as they would for urllib2.urlopen).
+    - Keeps connection reuse statistics (see http_transport.stats).
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import httplib
+import socket
+import threading
+import zlib
+from urllib2 import HTTPError, URLError
+from urlparse import urlparse, urljoin
+from StringIO import StringIO
+
+class connection_pool(object):
+    '''
+    Pool of idle keep-alive connections, keyed by (scheme, host). At most max_idle_per_host
+    idle connections are kept for each host.
+    '''
+
+    def __init__(self, max_idle_per_host=8, timeout=60):
+        self.max_idle_per_host = max_idle_per_host
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.idle = {}
+
+    def get(self, scheme, host):
+        '''
+        Returns a (connection, reused) pair- an idle connection to host if one is available,
+        otherwise a new connection.
+        '''
+        with self.lock:
+            idle = self.idle.get((scheme, host), [])
+            if idle:
+                return idle.pop(), True
+        if scheme == 'https':
+            return httplib.HTTPSConnection(host, timeout=self.timeout), False
+        return httplib.HTTPConnection(host, timeout=self.timeout), False
+
+    def put(self, scheme, host, connection):
+        '''
+        Returns a connection to the pool (closing it if the pool for host is full).
+        '''
+        with self.lock:
+            idle = self.idle.setdefault((scheme, host), [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self.lock:
+            for idle in self.idle.values():
+                for connection in idle:
+                    connection.close()
+            self.idle = {}
+
+
+class http_transport(object):
+    '''
+    HTTP transport with connection pooling, keep-alive, and compression. http_transport.request
+    returns the body of the response to a GET request.
+    '''
+
+    def __init__(self, max_idle_per_host=8, timeout=60, max_redirects=5):
+        self.pool = connection_pool(max_idle_per_host, timeout)
+        self.max_redirects = max_redirects
+        self.lock = threading.Lock()
+        self.counts = {'requests': 0, 'connections_opened': 0, 'connections_reused': 0,
+                       'bytes_received': 0, 'bytes_decompressed': 0}
+
+    def count(self, **increments):
+        with self.lock:
+            for key in increments:
+                self.counts[key] += increments[key]
+
+    def stats(self):
+        '''
+        Returns a dictionary of transport statistics, including the fraction of requests that
+        re-used an open connection.
+        '''
+        with self.lock:
+            stats = dict(self.counts)
+        total = stats['connections_opened'] + stats['connections_reused']
+        stats['reuse_ratio'] = stats['connections_reused']/float(total) if total > 0 else 0.0
+        return stats
+
+    def request(self, url):
+        '''
+        Requests url, following redirects. Returns the (decompressed) response body.
+        Raises HTTPError if the server returns an error status, and URLError if the
+        request fails due to a network problem.
+        '''
+        for i in range(self.max_redirects + 1):
+            status, reason, headers, body = self.send(url)
+            if status in (301, 302, 303, 307) and headers.get('location'):
+                url = urljoin(url, headers['location'])
+                continue
+            if status >= 400:
+                raise HTTPError(url, status, reason, headers, StringIO(body))
+            return body
+        raise HTTPError(url, status, 'Too many redirects', headers, StringIO(body))
+
+    def send(self, url):
+        '''
+        Sends a single GET request for url over a pooled connection. Returns the response's
+        (status, reason, headers, body), raising URLError if the request fails or the body can't be
+        decompressed. A request that fails on a re-used connection (i.e. because the
+        server closed it while it was idle) is retried once on a new connection.
+        '''
+        parsed = urlparse(url)
+        scheme, host = parsed.scheme, parsed.netloc
+        path = parsed.path or '/'
+        if parsed.query:
+            path = path + '?' + parsed.query
+        request_headers = {'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'}
+
+        while True:
+            connection, reused = self.pool.get(scheme, host)
+            try:
+                connection.request('GET', path, headers=request_headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (httplib.HTTPException, socket.error) as e:
+                connection.close()
+                if reused:
+                    continue
+                raise URLError(e)
+            break
+
+        if reused:
+            self.count(requests=1, connections_reused=1, bytes_received=len(body))
+        else:
+            self.count(requests=1, connections_opened=1, bytes_received=len(body))
+        headers = dict(response.getheaders())
+        if response.will_close:
+            connection.close()
+        else:
+            self.pool.put(scheme, host, connection)
+
+        encoding = headers.get('content-encoding', '').lower()
+        try:
+            if encoding == 'gzip':
+                body = zlib.decompress(body, 16 + zlib.MAX_WBITS)
+            elif encoding == 'deflate':
+                try:
+                    body = zlib.decompress(body)
+                except zlib.error: ##Some servers send raw deflate data, without the zlib header
+                    body = zlib.decompress(body, -zlib.MAX_WBITS)
+        ## A truncated or corrupt body is a network failure (so it's retried, like any other URLError)
+        except zlib.error as e:
+            raise URLError('could not decompress {} response body from {} ({})'.format(encoding, url, e))
+        self.count(bytes_decompressed=len(body))
+        return response.status, response.reason, headers, body
+
+
+## The transport shared by the scraper, the coverage check, and the snapshot download
+shared_transport = http_transport()
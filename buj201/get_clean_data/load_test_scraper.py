@@ -0,0 +1,121 @@
+'''
+This module load tests the webscraper against the local stand-in server (stand_in_server.py),
+without making any requests to the real expenditure report site.
+
+The scraper (with its usual concurrency, politeness, rate limiting, and fetch/parse pipeline settings)
+scrapes one year's expenditure reports for a list of schools from the stand-in server. The load test reports the number
+of requests made, requests per second, the median (p50) and 99th percentile (p99) request latency,
+and the total wall time, along with the outcome of each school and the server's statistics. Scraped
+pages are not cached, and the school name search indexes and page archive are kept in a temporary
+directory, so every school is searched for and scraped.
+
+It is run from the terminal (after cd-ing into the get_clean_data directory) with the command
+'python load_test_scraper.py', optionally followed by: the number of schools, the server latency
+(in seconds), the server error rate, and the server's maximum requests per second. The schools are
+those in the 2006 school name index (if it lists enough schools), and pages recorded in the response
+cache are served where available (other pages are generated).
+'''
+import sys
+import shutil
+import tempfile
+import time
+import numpy as np
+import scrape_expenditure_data
+from scrape_expenditure_data import (fetch_unit, extract_unit, retry_if_URL_error_or_throttled, CACHE_DIRECTORY, CONCURRENCY,
+                                     MAX_CONNECTIONS_PER_HOST, MIN_REQUEST_INTERVAL, INITIAL_REQUESTS_PER_SECOND,
+                                     MIN_REQUESTS_PER_SECOND, MAX_REQUESTS_PER_SECOND, MAX_ATTEMPTS, BASE_RETRY_DELAY,
+                                     MAX_RETRY_DELAY, BREAKER_COOLDOWN, PARSE_PROCESSES, PARSE_QUEUE_SIZE)
+from fetch_engine import fetch_engine
+from fetch_parse_pipeline import fetch_parse_pipeline
+from page_archive import page_archive, ARCHIVE_DIRECTORY
+from http_transport import http_transport
+from response_cache import response_cache
+from retry_scheduler import retry_scheduler, token_bucket, circuit_breaker
+from school_name_index import school_name_index, set_school_name_index_directory, INDEX_DIRECTORY
+from stand_in_server import stand_in_server
+
+class timed_transport(http_transport):
+    '''
+    http_transport that records the latency (in seconds) of every request (including failed requests).
+    '''
+
+    def __init__(self, *args, **kwargs):
+        http_transport.__init__(self, *args, **kwargs)
+        self.latencies = []
+
+    def request(self, url):
+        start = time.time()
+        try:
+            return http_transport.request(self, url)
+        finally:
+            latency = time.time() - start
+            with self.lock:
+                self.latencies.append(latency)
+
+def scraper_scheduler():
+    '''Returns a retry scheduler with the scraper's rate limiting and retry settings.'''
+    return retry_scheduler(retry_if_URL_error_or_throttled,
+                           token_bucket(INITIAL_REQUESTS_PER_SECOND, MIN_REQUESTS_PER_SECOND, MAX_REQUESTS_PER_SECOND),
+                           circuit_breaker(cooldown=BREAKER_COOLDOWN),
+                           MAX_ATTEMPTS, BASE_RETRY_DELAY, MAX_RETRY_DELAY)
+
+def run_load_test(server, DBNs, year=2006, scheduler=None):
+    '''
+    Scrapes the expenditure reports for year for each of DBNs from server (a started stand_in_server).
+    Returns a dictionary of results.
+    '''
+    if scheduler is None:
+        scheduler = scraper_scheduler()
+    transport = timed_transport()
+    engine = fetch_engine(CONCURRENCY, MAX_CONNECTIONS_PER_HOST, MIN_REQUEST_INTERVAL, transport=transport, scheduler=scheduler)
+    scratch_directory = tempfile.mkdtemp()
+    saved = scrape_expenditure_data.BASE_URL, scrape_expenditure_data.engine, scrape_expenditure_data.archive
+    scrape_expenditure_data.BASE_URL = server.base_url
+    scrape_expenditure_data.engine = engine
+    scrape_expenditure_data.archive = page_archive(scratch_directory + '/archive')
+    set_school_name_index_directory(scratch_directory + '/index')
+    try:
+        start = time.time()
+        pipeline = fetch_parse_pipeline(engine, PARSE_PROCESSES, PARSE_QUEUE_SIZE)
+        units = [(year, DBN, position) for position, DBN in enumerate(DBNs)]
+        statuses = [result[3] for result in pipeline.run([units], fetch_unit, extract_unit)]
+        wall_time = time.time() - start
+    finally:
+        scrape_expenditure_data.BASE_URL, scrape_expenditure_data.engine, scrape_expenditure_data.archive = saved
+        set_school_name_index_directory(INDEX_DIRECTORY)
+        transport.pool.close()
+        shutil.rmtree(scratch_directory)
+
+    latencies = np.array(transport.latencies)
+    status_counts = dict((status, statuses.count(status)) for status in set(statuses))
+    return {'schools': len(DBNs), 'statuses': status_counts, 'requests': len(latencies), 'wall_seconds': wall_time,
+            'requests_per_second': len(latencies)/wall_time if wall_time > 0 else float('nan'),
+            'p50_seconds': np.percentile(latencies, 50) if len(latencies) > 0 else float('nan'),
+            'p99_seconds': np.percentile(latencies, 99) if len(latencies) > 0 else float('nan'),
+            'scheduler': scheduler.stats(), 'transport': transport.stats(), 'server': server.stats()}
+
+def main():
+    schools = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.1
+    error_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0
+    max_requests_per_second = float(sys.argv[4]) if len(sys.argv) > 4 else None
+
+    ## Scrape schools found by previous scrapes (so recorded pages are served), or made-up DBNs
+    DBNs = [str(DBN) for DBN in sorted(school_name_index(2006).entries)[:schools]]
+    if len(DBNs) < schools:
+        DBNs = ['M{:03d}'.format(i) for i in range(schools)]
+    server = stand_in_server(response_cache(CACHE_DIRECTORY), latency, error_rate, max_requests_per_second,
+                             archive=page_archive(ARCHIVE_DIRECTORY)).start()
+    try:
+        results = run_load_test(server, DBNs)
+    finally:
+        server.stop()
+    print 'Schools scraped:', results['schools'], results['statuses']
+    print 'Requests: {} ({:.1f} requests/s)'.format(results['requests'], results['requests_per_second'])
+    print 'Latency: p50 {:.1f} ms, p99 {:.1f} ms'.format(1000*results['p50_seconds'], 1000*results['p99_seconds'])
+    print 'Wall time: {:.2f} s'.format(results['wall_seconds'])
+    print 'Scheduler:', results['scheduler']
+    print 'Server:', results['server']
+
+if __name__ == '__main__':
+    main()
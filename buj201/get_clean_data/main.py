@@ -11,41 +11,93 @@ The main module for get_clean_data. It:
     - SCHMA data
     - Demographic accountability snapshot data
     - Expenditure data
-Note this program will take several hours to run, as it is scraping data from approximately 20K HTML
-pages. 
+- Merges the data, and derives the features plotted by the visualizers
+Note this program can take a long time to run, as it is scraping data from approximately 20K HTML
+pages (the scraper fetches pages concurrently- see fetch_engine.py). 
+
+The stages run incrementally (see pipeline.py): only stages whose inputs (data files or source code)
+have changed since they last ran, or whose outputs are missing, are re-run- along with the stages
+downstream of them. Stages whose outputs already exist (i.e. the data included in the repository)
+aren't re-run until their inputs change. Options:
+    --only STAGE [STAGE ...]: run only the named stages
+    --from STAGE: run the named stage and every stage after it
+    --force: run every stage
+    --dry-run: print the stages that would run (and why), without running them
+    --serial: run the stages one at a time (by default, independent stages- i.e. the scrape and
+    cleaning the SCHMA data- run concurrently, in separate processes)
 '''
 
 if __name__ == '__main__':
     pass
 
 import sys
+import argparse
+from pipeline import stage, stage_graph
+from schma_reader import SCHMA_PATH
+from demo_account_snapshot import SNAPSHOT_PATH, LOCAL_SNAPSHOT_PATH
 from clean_SCHMA_data import clean_SCHMA
 from scrape_expenditure_data import save_2006_to_2012_data
 from clean_scraped_data import clean_scraped_data
 from get_and_clean_school_demo_and_account import get_and_clean_demo_and_account
 from merge_expenditure_and_demo_account_data import merge_demo_account_and_expenditure
 from check_filesystem import check_filesystem
+from panel import PANEL_PATH
+from derived_features import save_derived_features, derived_outputs
 
+YEARS = range(2006,2013)
+SNAPSHOT = LOCAL_SNAPSHOT_PATH or SNAPSHOT_PATH
+RAW_EXPENDITURES = ['../data/raw_school_expenditures_by_year/year_{}.csv'.format(year) for year in YEARS]
+CLEAN_EXPENDITURES = ['../data/clean_expenditure_data_by_year/clean_year_{}.csv'.format(year) for year in YEARS]
+MERGED = ['../data/merged_data/expenditure_demo_account_year_{}.csv'.format(year) for year in YEARS]
+
+def get_stages():
+    '''
+    Returns the pipeline's stages, in order. Each stage's inputs are the data files it reads and the
+    source code of the modules it uses. Note the scrape stage's report page parser isn't one of its
+    inputs (the scrape takes hours)- after a change to the parser, run reextract_pages.py.
+    '''
+    return [stage('scrape', save_2006_to_2012_data, [SNAPSHOT, 'row_collector.py'], RAW_EXPENDITURES,
+                  'Getting expenditure data'),
+            stage('clean_expenditures', clean_scraped_data, RAW_EXPENDITURES + ['clean_scraped_data.py', 'storage.py'],
+                  CLEAN_EXPENDITURES, 'Cleaning expenditure data'),
+            stage('clean_SCHMA', clean_SCHMA, [SCHMA_PATH, 'clean_SCHMA_data.py', 'schma_reader.py', 'storage.py'],
+                  ['../data/clean_SCHMA.csv'], 'Cleaning SCHMA data'),
+            stage('demo_account', get_and_clean_demo_and_account,
+                  [SNAPSHOT, 'get_and_clean_school_demo_and_account.py', 'demo_account_snapshot.py',
+                   'percentile_rank.py', 'storage.py'],
+                  ['../data/clean_demo_account.csv'],
+                  'Getting and cleaning demographic and accountability snapshot data'),
+            stage('merge', merge_demo_account_and_expenditure,
+                  ['../data/clean_demo_account.csv'] + CLEAN_EXPENDITURES +
+                  ['merge_expenditure_and_demo_account_data.py', 'panel.py', 'storage.py'],
+                  MERGED + [PANEL_PATH], 'Merging demographic/accountabilty and expenditure data'),
+            stage('derived_features', save_derived_features, MERGED + ['derived_features.py', 'storage.py'],
+                  derived_outputs(), 'Deriving expenditure shares and scaled expenditures for the visualizers')]
 
-try:
-    check_filesystem()
-except IOError as msg:
-    print msg
-    sys.exit()
-    
 def main():
-    print 'Getting and cleaning expenditure data'
-    save_2006_to_2012_data()
-    clean_scraped_data()
-    print 'Cleaning SCHMA data'
-    clean_SCHMA()
-    print 'Getting and cleaning demographic and accountability snapshot data'
-    get_and_clean_demo_and_account()
-    print 'Merging demographic/accountabilty and expenditure data'
-    merge_demo_account_and_expenditure()
+    stages = get_stages()
+    parser = argparse.ArgumentParser(description='Gets, cleans, and merges the school expenditure, SCHMA, and demographic/accountability data.')
+    names = [s.name for s in stages]
+    parser.add_argument('--only', nargs='+', choices=names, metavar='STAGE',
+                        help='run only these stages (of: {})'.format(', '.join(names)))
+    parser.add_argument('--from', dest='start', choices=names, metavar='STAGE',
+                        help='run this stage and every stage after it')
+    parser.add_argument('--force', action='store_true', help='run every stage')
+    parser.add_argument('--dry-run', action='store_true', help='print the stages that would run, without running them')
+    parser.add_argument('--serial', action='store_true', help='run the stages one at a time, in this process')
+    args = parser.parse_args()
+    graph = stage_graph(stages)
+    planned = [s for s, reason in graph.plan(args.only, args.start, args.force)]
+    ## Only the stages that will run need the SCHMA data (i.e. --only derived_features doesn't)
+    try:
+        check_filesystem(any(SCHMA_PATH in s.inputs for s in planned))
+    except IOError as msg:
+        print msg
+        sys.exit()
+    graph.run(args.only, args.start, args.force, args.dry_run, not args.serial)
     return
 
 try:
     main()
 except KeyboardInterrupt:
-    print 'Program terminated by keyboard interrupt- restart main.py to get data.'
\ No newline at end of file
+    print 'Program terminated by keyboard interrupt- restart main.py to get data (scraping resumes where it stopped).'
\ No newline at end of file
@@ -5,7 +5,8 @@ Created on Dec 10, 2015
 '''
 '''
 This module merges the cleaned demographic and accountability data with the cleaned school expenditure data.
-The final merged dataset is saved as a csv file.
+The final merged dataset is saved as a csv file (and its binary copy- see storage.py) for each year, and
+as a single school by year panel (see panel.py).
 '''
 import sys
 if __name__ == "__main__":
@@ -13,15 +14,18 @@ if __name__ == "__main__":
     sys.exit()
     
 import pandas as pd
+from storage import load_table, save_table
+from panel import build_panel, save_panel
 
 def merge_demo_account_and_expenditure():
-    demo_and_account = pd.read_csv('../data/clean_demo_account.csv', index_col=0)
+    demo_and_account = load_table('../data/clean_demo_account.csv')
     all_years_data = {}
     for year in range(2006,2013):
     ## read in raw expenditure data
-        all_years_data[year] = pd.read_csv('../data/clean_expenditure_data_by_year/clean_year_{}.csv'.format(str(year)), index_col=0)
+        all_years_data[year] = load_table('../data/clean_expenditure_data_by_year/clean_year_{}.csv'.format(str(year)))
     ## merge dataframes and save data
         all_years_data[year] = pd.merge(all_years_data[year], demo_and_account[demo_and_account['schoolyear']==year], how='inner', left_on='School', right_on='DBN')
         all_years_data[year].set_index('DBN',inplace=True)
         path = '../data/merged_data/expenditure_demo_account_year_{}.csv'.format(str(year))
-        all_years_data[year].to_csv(path)
\ No newline at end of file
+        save_table(all_years_data[year], path)
+    save_panel(build_panel(all_years_data))
\ No newline at end of file
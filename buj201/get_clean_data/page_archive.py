@@ -0,0 +1,70 @@
+'''
+This module provides a permanent, on-disk archive of the expenditure report pages fetched by
+the webscraper.
+
+The archive is the only store of report pages (the response cache, which is keyed by URL and
+trimmed after each scrape, only keeps the search pages): it keeps one compressed page per
+(year, DBN), along with the school name used to request it. The scraper reads a school's report
+page from the archive rather than fetching it again, and every archived page can be re-parsed
+(i.e. after a change to the report page extractor) without fetching anything.
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import gzip
+import os
+import tempfile
+
+ARCHIVE_DIRECTORY = '../data/report_page_archive'
+
+class page_archive(object):
+    '''
+    Archive of report pages, stored at directory/year_{year}/{DBN}.html.gz. The first line of each
+    file is the school name; the rest is the page.
+    '''
+
+    def __init__(self, directory=ARCHIVE_DIRECTORY):
+        self.directory = directory
+
+    def path_for(self, year, DBN):
+        return os.path.join(self.directory, 'year_{}'.format(str(year)), DBN + '.html.gz')
+
+    def put(self, year, DBN, school_name, page):
+        '''
+        Archives the report page for (year, DBN) (via a temporary file, so archived pages are
+        never partially written).
+        '''
+        path = self.path_for(year, DBN)
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError: ##Created by another thread
+                pass
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(handle, 'wb') as f:
+            with gzip.GzipFile(fileobj=f, mode='wb') as compressed:
+                compressed.write(school_name + '\n')
+                compressed.write(page)
+        os.rename(temp_path, path)
+
+    def get(self, year, DBN):
+        '''
+        Returns the archived (school_name, page) for (year, DBN), or None if the page isn't archived.
+        '''
+        path = self.path_for(year, DBN)
+        if not os.path.exists(path):
+            return None
+        with gzip.open(path, 'rb') as f:
+            school_name = f.readline().rstrip('\n')
+            return school_name, f.read()
+
+    def DBNs(self, year):
+        '''
+        Returns the sorted list of DBNs with an archived page for year.
+        '''
+        year_directory = os.path.join(self.directory, 'year_{}'.format(str(year)))
+        if not os.path.isdir(year_directory):
+            return []
+        return sorted(name[:-len('.html.gz')] for name in os.listdir(year_directory) if name.endswith('.html.gz'))
@@ -0,0 +1,73 @@
+'''
+This module builds (and reads) the school by year panel: the merged expenditure and demographic/
+accountability data for every year, in one long-format table indexed by (DBN, year).
+
+The panel has one row per school per year, and one column for every feature in any year (in the
+order the features first appear, 2006-2012), so features missing in some years (i.e.
+Central_Leadership) are NaN there. Its school_panel accessors return
+    - One school's full history (school),
+    - One year's cross-section (year), or
+    - One feature across all years, as a schools by years table (feature),
+each in a single indexing step, rather than a loop over seven yearly dataframes.
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import numpy as np
+import pandas as pd
+from storage import load_table, save_table
+
+PANEL_PATH = '../data/merged_data/expenditure_demo_account_panel.csv'
+
+def build_panel(all_years_data):
+    '''
+    Takes a dictionary with keys = years, vals = the merged data for that year (indexed by DBN), and
+    returns the panel (indexed by DBN and year, sorted). Note a school listed more than once in a year
+    keeps only its first record (in the merged data, these are duplicated rows).
+    '''
+    columns = []
+    for year in sorted(all_years_data):
+        columns.extend(feature for feature in all_years_data[year].columns if feature not in columns)
+    frames = [all_years_data[year][~all_years_data[year].index.duplicated()] for year in sorted(all_years_data)]
+    panel = pd.concat(frames, keys=sorted(all_years_data), names=['year', 'DBN'], sort=False)[columns]
+    return panel.swaplevel('year', 'DBN').sort_index()
+
+def save_panel(panel, path=PANEL_PATH):
+    '''Saves the panel (with DBN as its index, and year as its first column- see storage.py).'''
+    save_table(panel.reset_index('year'), path)
+
+def load_panel(path=PANEL_PATH, columns=None):
+    '''Returns the school_panel saved at path, with only the input features (or all features).'''
+    data = load_table(path, None if columns is None else ['year'] + [c for c in columns if c != 'year'])
+    return school_panel(data.set_index('year', append=True).sort_index())
+
+
+class school_panel(object):
+    '''
+    Accessors for the panel (a dataframe indexed by DBN and year, sorted).
+    '''
+
+    def __init__(self, panel):
+        self.panel = panel
+        self.years = sorted(set(panel.index.get_level_values('year')))
+        ## The row positions of each year's records (so a cross-section is a single take)
+        year_values = panel.index.get_level_values('year').values
+        self.year_rows = dict((year, np.flatnonzero(year_values == year)) for year in self.years)
+
+    def school(self, DBN):
+        '''Returns the school's records (indexed by year).'''
+        return self.panel.xs(DBN, level='DBN')
+
+    def year(self, year):
+        '''Returns the year's records (indexed by DBN).'''
+        return self.panel.iloc[self.year_rows[year]].reset_index('year', drop=True)
+
+    def feature(self, feature):
+        '''Returns the feature for every school and year (as a dataframe indexed by DBN, with a column per year).'''
+        return self.panel[feature].unstack('year')
+
+    def all_years_data(self):
+        '''Returns a dictionary with keys = years, vals = that year's records (indexed by DBN).'''
+        return dict((year, self.year(year)) for year in self.years)
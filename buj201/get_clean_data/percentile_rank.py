@@ -0,0 +1,47 @@
+'''
+This module provides a percentile rank function shared by get_clean_data (to construct the poverty_level
+feature) and the expenditure visualizers (to color schools by their rank on a feature).
+
+percentile_rank gives exactly the 'weak' percentile of each value, as scipy's
+stats.percentileofscore(column, value, 'weak')- the percentage of values in the column less than
+or equal to the value. But rather than counting the column once per value (O(n^2) for a whole
+column), it ranks the column once (O(n log n)), ranking every column of a DataFrame at once,
+and ranking within groups (i.e. school years) if requested.
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import numpy as np
+import pandas as pd
+
+def percentile_rank(data, by=None):
+    '''
+    Takes a pd.Series or pd.DataFrame (data), and returns the weak percentile rank (from 0 to 100) of
+    each value in data, within its column. If by is given, values are ranked within groups- by can be
+    anything accepted by groupby (i.e. a Series of group keys aligned with data, or the name of one
+    of data's columns, which is then left out of the result).
+    Note NaN values count toward the number of values in their column, but are not less than or equal
+    to any value (so they have percentile rank 0, as in the cleaned data- though recent versions of
+    stats.percentileofscore return NaN for them).
+    '''
+    if by is None:
+        return to_percentile(data.rank(method='max'), len(data))
+    keys = by
+    if isinstance(data, pd.DataFrame) and isinstance(by, basestring) and by in data.columns:
+        keys = data[by]
+        data = data.drop(by, axis=1)
+    ## Note rank(method='max') is the number of values less than or equal to each value
+    ranks = data.groupby(keys).rank(method='max')
+    sizes = pd.Series(np.ones(len(data)), index=data.index).groupby(keys).transform('sum')
+    return to_percentile(ranks, sizes)
+
+def to_percentile(ranks, sizes):
+    '''
+    Converts ranks (counts of values less than or equal to each value) to percentiles of sizes values.
+    '''
+    ranks = ranks.fillna(0)
+    if isinstance(ranks, pd.DataFrame):
+        return ranks.div(sizes, axis=0) * 100
+    return ranks / sizes * 100
@@ -0,0 +1,274 @@
+'''
+This module runs get_clean_data's stages (scrape, clean, merge, ...) incrementally, make-style.
+
+Each stage declares the files it reads (its inputs- including its own source code) and the files
+it writes (its outputs). After a stage runs, the content hash (md5) of each of its inputs is saved
+in a state file. On the next run, a stage is only re-run if it's stale:
+    - One of its outputs is missing,
+    - One of its inputs has changed (or is missing) since it last ran, or
+    - A stage it depends on (one whose outputs it reads) is re-run.
+A stage that has never run, but whose outputs all exist (i.e. the data included in the repository),
+is up to date: its inputs' hashes are recorded, so it's re-run once they change. So is an input
+that's declared since a stage last ran (or that didn't exist then).
+Stages can also be selected explicitly (see stage_graph.plan), and the plan can be printed
+without running anything (a dry run).
+Stages that don't depend on each other (i.e. cleaning the SCHMA data and the scrape) run
+concurrently, each in its own process, and a stage starts as soon as the stages it depends on
+have finished (see stage_graph.run).
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import Queue
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import traceback
+
+STATE_PATH = '../data/pipeline_state.json'
+
+def file_hash(path, known=None):
+    '''
+    Returns the md5 hash of the file at path (or None if it doesn't exist). known is the file's
+    saved {'size', 'mtime', 'md5'} record, if any: if the file's size and modification time are
+    unchanged, its saved hash is returned without reading the file.
+    '''
+    if not os.path.exists(path):
+        return None
+    info = os.stat(path)
+    if known is not None and known.get('size') == info.st_size and known.get('mtime') == info.st_mtime:
+        return known['md5']
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024*1024), ''):
+            md5.update(block)
+    return md5.hexdigest()
+
+def file_record(path, known=None):
+    '''Returns the {'size', 'mtime', 'md5'} record for the file at path (or None if it doesn't exist).'''
+    md5 = file_hash(path, known)
+    if md5 is None:
+        return None
+    info = os.stat(path)
+    return {'size': info.st_size, 'mtime': info.st_mtime, 'md5': md5}
+
+
+class stage(object):
+    '''
+    A pipeline stage: function (called with no arguments) reads inputs and writes outputs (lists of paths).
+    If function returns False, the stage didn't finish (i.e. the scrape was interrupted), so the run stops.
+    '''
+
+    def __init__(self, name, function, inputs, outputs, description=None):
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.description = description if description is not None else name
+
+
+class stage_graph(object):
+    '''
+    The pipeline's stages, in the order they run. Stage dependencies are found from the stages'
+    inputs and outputs. Saved input hashes are stored in the state file at state_path.
+    '''
+
+    def __init__(self, stages, state_path=STATE_PATH):
+        self.stages = list(stages)
+        self.names = [s.name for s in self.stages]
+        self.state_path = state_path
+        self.state = {}
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self.state = json.load(f)
+
+    def get(self, name):
+        if name not in self.names:
+            raise ValueError('Unknown stage {} (stages are: {})'.format(name, ', '.join(self.names)))
+        return self.stages[self.names.index(name)]
+
+    def upstream(self, stage):
+        '''Returns the stages whose outputs stage reads.'''
+        return [s for s in self.stages if s is not stage and set(s.outputs) & set(stage.inputs)]
+
+    def downstream(self, stage):
+        '''Returns the stages that (directly or indirectly) read stage's outputs.'''
+        found = []
+        for s in self.stages[self.stages.index(stage)+1:]:
+            if any(u is stage or u in found for u in self.upstream(s)):
+                found.append(s)
+        return found
+
+    def stale_reason(self, stage):
+        '''
+        Returns the reason stage is stale (without considering upstream stages), or None if it's up to date.
+        '''
+        missing = [path for path in stage.outputs if not os.path.exists(path)]
+        if missing:
+            return 'missing output ' + missing[0]
+        saved = self.state.get(stage.name, {'inputs': {}})
+        for path in stage.inputs:
+            known = saved['inputs'].get(path)
+            if known is None:
+                ## Not recorded yet (see adopt)
+                continue
+            md5 = file_hash(path, known)
+            if md5 is None:
+                return 'missing input ' + path
+            if md5 != known['md5']:
+                return 'changed input ' + path
+        return None
+
+    def plan(self, only=None, start=None, force=False):
+        '''
+        Returns the list of (stage, reason) pairs to run, in order. By default, stale stages and
+        their downstream stages run. only (a list of stage names) runs just those stages; start (a
+        stage name) runs that stage and every stage after it; force runs every stage.
+        '''
+        if only:
+            selected = [self.get(name) for name in only]
+            return [(s, 'selected') for s in self.stages if s in selected]
+        if start is not None:
+            index = self.names.index(self.get(start).name)
+            return [(s, 'selected') for s in self.stages[index:]]
+        if force:
+            return [(s, 'forced') for s in self.stages]
+        reasons = {}
+        for s in self.stages:
+            if s.name in reasons:
+                continue
+            reason = self.stale_reason(s)
+            if reason is not None:
+                reasons[s.name] = reason
+                for d in self.downstream(s):
+                    reasons.setdefault(d.name, 'upstream stage {} runs'.format(s.name))
+        return [(s, reasons[s.name]) for s in self.stages if s.name in reasons]
+
+    def record(self, stage):
+        '''
+        Saves the hashes of stage's inputs (after it has run).
+        '''
+        saved = self.state.get(stage.name, {'inputs': {}})
+        self.state[stage.name] = {'inputs': dict((path, file_record(path, saved['inputs'].get(path)))
+                                                 for path in stage.inputs if os.path.exists(path))}
+        self.save_state()
+
+    def adopt(self, stage):
+        '''
+        Saves the hashes of an up to date stage's inputs that aren't recorded yet (leaving the recorded
+        ones unchanged- so a stage that's stale, but not selected to run, stays stale).
+        '''
+        inputs = self.state.setdefault(stage.name, {'inputs': {}})['inputs']
+        new = [path for path in stage.inputs if path not in inputs and os.path.exists(path)]
+        for path in new:
+            inputs[path] = file_record(path)
+        if new:
+            self.save_state()
+
+    def save_state(self):
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        handle, temp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(handle, 'w') as f:
+            json.dump(self.state, f, indent=1, sort_keys=True)
+        os.rename(temp_path, self.state_path)
+
+    def run(self, only=None, start=None, force=False, dry_run=False, parallel=True):
+        '''
+        Runs the planned stages (see plan), printing each stage (and why it runs). If dry_run, only
+        prints the plan. Returns False if a stage didn't finish, otherwise True.
+        If parallel, each stage runs (in its own process) as soon as the planned stages upstream of it
+        have finished- so independent stages run concurrently, and the run takes about as long as its
+        slowest chain of dependent stages. Otherwise, the stages run one at a time, in order, in this process.
+        '''
+        planned = self.plan(only, start, force)
+        if len(planned) == 0:
+            print 'All stages are up to date'
+        if dry_run:
+            for s, reason in planned:
+                waits_for = [u.name for u in self.upstream(s) if u in dict(planned)]
+                print 'Would run', s.name, '({})'.format(reason) + (', after ' + ', '.join(waits_for) if waits_for else '')
+            return True
+        for s in self.stages:
+            if s not in dict(planned) and self.stale_reason(s) is None:
+                self.adopt(s)
+        if not parallel:
+            for s, reason in planned:
+                print s.description, '({})'.format(reason)
+                if s.function() is False:
+                    return False
+                self.record(s)
+            return True
+        return self.run_parallel(planned)
+
+    def run_parallel(self, planned):
+        '''
+        Runs the planned (stage, reason) pairs, each in its own process once its planned upstream stages
+        have finished. If a stage doesn't finish, the stages downstream of it are skipped (but independent
+        stages still run). If a stage raises an exception (or its process dies), no further stages are started,
+        and a RuntimeError (with the stage's traceback) is raised once the running stages have finished.
+        '''
+        waiting = [s for s, reason in planned]
+        reasons = dict((s.name, reason) for s, reason in planned)
+        running = {}
+        finished = set()
+        results = multiprocessing.Queue()
+        completed = True
+        error = None
+        while waiting or running:
+            for s in list(waiting):
+                upstream = [u for u in self.upstream(s) if u.name in reasons]
+                if error is not None or any(u not in waiting and u.name not in running and u.name not in finished
+                                            for u in upstream):
+                    ## An upstream stage didn't finish (or another stage failed)
+                    waiting.remove(s)
+                    print 'Skipping', s.name
+                elif all(u.name in finished for u in upstream):
+                    waiting.remove(s)
+                    print s.description, '({})'.format(reasons[s.name])
+                    running[s.name] = multiprocessing.Process(target=_run_stage, args=(s, results))
+                    running[s.name].start()
+            if not running:
+                break
+            ## Note we wait with a timeout so a KeyboardInterrupt reaches this process
+            name, result, trace = self.next_result(results, running)
+            running.pop(name).join()
+            if trace is not None:
+                error = error or 'Stage {} failed:\n{}'.format(name, trace)
+            elif result is False:
+                completed = False
+            else:
+                self.record(self.get(name))
+                finished.add(name)
+        if error is not None:
+            raise RuntimeError(error)
+        return completed
+
+    def next_result(self, results, running):
+        '''
+        Waits for the next (name, result, traceback) sent to results by a running stage's process.
+        If a process dies without sending a result (i.e. it's killed, or exits), its stage has failed.
+        '''
+        while True:
+            try:
+                return results.get(timeout=1)
+            except Queue.Empty:
+                dead = [name for name, process in running.items() if not process.is_alive()]
+                if not dead:
+                    continue
+            ## Note the results are checked once more, since a process may send its result just before exiting
+            try:
+                return results.get(timeout=1)
+            except Queue.Empty:
+                return dead[0], None, 'Stage process exited (exit code {}) without a result'.format(running[dead[0]].exitcode)
+
+
+def _run_stage(stage, results):
+    ## Runs stage (in a child process), sending its name and result (or its traceback) to results
+    try:
+        results.put((stage.name, stage.function(), None))
+    except Exception:
+        results.put((stage.name, None, traceback.format_exc()))
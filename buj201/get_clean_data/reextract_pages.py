@@ -0,0 +1,24 @@
+'''
+This module re-extracts the scraped expenditure data from the archived report pages, without
+fetching anything (i.e. after a change to the report page extractor).
+
+Every archived page is re-parsed (in parallel, in a pool of worker processes), its outcome is
+recorded in the scrape journal, and each fully scraped year's csv file is re-written.
+
+It is run from the terminal (after cd-ing into the get_clean_data directory) with the command
+'python reextract_pages.py'.
+'''
+from scrape_journal import scrape_journal
+from work_queue import work_queue
+from scrape_expenditure_data import reextract_archived_pages, merge_scraped_years
+
+def main():
+    journal = scrape_journal()
+    queue = work_queue()
+    print 'Re-extracted', reextract_archived_pages(journal), 'archived pages'
+    merge_scraped_years(queue, journal)
+    queue.close()
+    journal.close()
+
+if __name__ == '__main__':
+    main()
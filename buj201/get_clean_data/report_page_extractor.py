@@ -0,0 +1,115 @@
+'''
+This module extracts a school's features and per student expenditures from the HTML of its
+expenditure report page.
+
+The report page contains a dozen or so tables, but only three are needed:
+    - Table 5, whose third row includes the school's district, DBN, and Title 1 status
+    - Tables 7 and 10, whose rows hold the per student expenditures by category
+extract_school_features goes straight to these tables (with pre-compiled XPath expressions),
+cleans the cells with pre-compiled regular expressions, and returns typed values (expenditures
+as integers). The features it extracts are exactly those extracted by the original parser-
+benchmark_report_extractor.py checks this (and times both parsers) over a corpus of saved pages.
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import re
+from lxml import etree
+import lxml.html
+import pandas as pd
+
+## The first cell of the third row of table 5 (school features), and the rows of tables 7 and 10 (expenditures).
+## Note XPath positions start at 1.
+SCHOOL_CELL = etree.XPath('(((//table)[5]//tr)[3]//td)[1]')
+TABLE = etree.XPath('(//table)[$n]')
+
+NBSP_SPLIT = re.compile(u'[\xa0]+[\\s]?')
+NBSP_SPLIT_SPECIAL_DISTRICTS = re.compile(u'[\\s]?[\xa0]+[\\s]?')
+KEY_SPLIT = re.compile(':\\s')
+VALUE_SPLIT = re.compile(':[\\s]+')
+WHITESPACE = re.compile('\\s')
+NBSP_RUN = re.compile(u'[\xa0]+')
+ITEM_NUMBER = re.compile('.*?\\._')
+NOT_LETTER = re.compile('[^A-Za-z_]')
+NOT_DIGIT = re.compile('[^0-9]')
+
+SPECIAL_DISTRICTS = {'Citywide_Sp_Ed_(75)': 75, 'Alternative_HS': 79}
+
+def extract_school_features(page, school_name, DBN):
+    '''
+    Takes the HTML of a school's expenditure report page (page), the school name used to request it,
+    and the school's DBN. Returns a pd.Series (named DBN) of the school's features and per student
+    expenditures. Raises IndexError if any of the expected tables, rows, or cells are missing.
+    '''
+    doc = lxml.html.document_fromstring(page)
+    school_features = extract_table_5(doc, school_name)
+    expenditures = {}
+    extract_expenditures(doc, 7, expenditures)
+    extract_expenditures(doc, 10, expenditures)
+
+    ##Drop the null value read in due to table structure
+    del expenditures['_']
+    school_features.update(expenditures)
+    return pd.Series(school_features.values(), index=school_features.keys(), name=DBN)
+
+def extract_table_5(doc, school_name):
+    '''
+    Extracts the school's district, DBN, and Title 1 status from table 5. Note districts 75 and 79
+    are formatted differently from districts 1-32.
+    '''
+    cell = SCHOOL_CELL(doc)[0]
+    regular_district = int(school_name[4:6]) in range(1,33)
+
+    ##Note (as in the original parser) the features are read from the cell's last child element
+    for val in cell:
+        text = val.text_content()
+        school_features = {}
+        if regular_district:
+            items = NBSP_SPLIT.split(text)
+        else:
+            items = NBSP_SPLIT_SPECIAL_DISTRICTS.split(text)
+            school_features['District'] = str(WHITESPACE.sub('_', items[0]))
+            items = items[1:]
+        for item in items:
+            school_features[str(WHITESPACE.sub('_', KEY_SPLIT.split(item)[0]))] = str(VALUE_SPLIT.split(item)[1])
+
+    district = school_features['District']
+    if district in SPECIAL_DISTRICTS:
+        school_features['District'] = SPECIAL_DISTRICTS[district]
+    return school_features
+
+def extract_expenditures(doc, table_number, expenditures):
+    '''
+    Adds the per student expenditures in table table_number (numbered from 1) to the expenditures
+    dictionary, mapping expenditure categories to integer amounts (or None if an amount is blank).
+    '''
+    table = TABLE(doc, n=table_number)[0]
+    for row in table.iter('tr'):
+        cells = list(row.iter('td'))
+        for label, amount in zip(cells[0], cells[3]):
+            key = NBSP_RUN.sub('_', text_content(label))
+            key = strip_item_numbers(key)
+            key = NOT_LETTER.sub('', key)
+            amount = NOT_DIGIT.sub('', text_content(amount))
+            expenditures[str(key)] = int(amount) if amount else None
+
+def strip_item_numbers(key):
+    '''
+    Removes item numbers (i.e. '12._') from an expenditure category. Equivalent to
+    ITEM_NUMBER.sub('', key)- which removes everything up to the last '._' on each line- but
+    avoids the (slow) lazy regular expression for the usual case of a single-line category.
+    '''
+    if '\n' in key:
+        return ITEM_NUMBER.sub('', key)
+    return key[key.rfind('._') + 2:] if '._' in key else key
+
+def text_content(element):
+    '''
+    Equivalent to element.text_content(), but skips the (relatively slow) XPath evaluation
+    for the usual case of a cell element with no child nodes.
+    '''
+    if len(element) == 0:
+        return element.text or ''
+    return element.text_content()
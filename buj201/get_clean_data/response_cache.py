@@ -0,0 +1,175 @@
+'''
+This module provides an on-disk, compressed HTTP response cache for the webscraper.
+
+Each response body is stored gzip-compressed in a file named by the SHA-1 hash of the
+request URL (so a URL always maps to the same file). Error responses that won't change on a
+retry (i.e. 404 Not Found- see cacheable_error) are cached too, as their status code (in a
+file named by the hash, with the extension .error.gz), and are replayed as an HTTPError.
+The cache supports:
+    - A time-to-live (TTL): entries older than the TTL are treated as misses and re-fetched.
+    - An offline replay mode: every request is served from the cache (regardless of age),
+    and requests for pages that aren't cached raise OfflineCacheMiss rather than going to the network.
+    - Hit/miss statistics, and eviction of entries by age and by total cache size.
+With a warm cache, re-running the scraper, re-parsing pages after a parser change, or running
+the coverage audit reads local files instead of making thousands of network requests.
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from urllib2 import URLError, HTTPError
+
+class OfflineCacheMiss(URLError):
+    '''
+    Raised in offline mode when the requested page is not in the cache.
+    '''
+    pass
+
+
+def cacheable_error(status):
+    '''
+    Returns True if an error response with the given HTTP status is cached: client errors (the page
+    doesn't exist), but not 429 Too Many Requests (the server is throttling requests).
+    '''
+    return 400 <= status < 500 and status != 429
+
+
+class response_cache(object):
+    '''
+    Compressed response cache stored under directory. ttl is the maximum age of a usable
+    entry in seconds (None for no limit), and offline=True serves all requests from the cache.
+    '''
+
+    def __init__(self, directory='../data/response_cache', ttl=None, offline=False):
+        self.directory = directory
+        self.ttl = ttl
+        self.offline = offline
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def path_for(self, url):
+        key = hashlib.sha1(url).hexdigest()
+        return os.path.join(self.directory, key[:2], key + '.gz')
+
+    def error_path_for(self, url):
+        return self.path_for(url)[:-len('.gz')] + '.error.gz'
+
+    def usable(self, path):
+        ## Returns True if the entry at path exists and hasn't expired (or the cache is offline)
+        if not os.path.exists(path):
+            return False
+        return self.offline or self.ttl is None or time.time() - os.path.getmtime(path) <= self.ttl
+
+    def get(self, url):
+        '''
+        Returns the cached response body for url, or None if url is not cached (or its entry
+        has expired). In offline mode, raises OfflineCacheMiss instead of returning None.
+        If the cached response is an error, raises it as an HTTPError.
+        '''
+        page = None
+        status = None
+        if self.usable(self.path_for(url)):
+            with gzip.open(self.path_for(url), 'rb') as f:
+                page = f.read()
+        elif self.usable(self.error_path_for(url)):
+            with gzip.open(self.error_path_for(url), 'rb') as f:
+                status = int(f.read())
+        with self.lock:
+            if page is None and status is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if status is not None:
+            raise HTTPError(url, status, 'Cached error response', {}, None)
+        if page is None and self.offline:
+            raise OfflineCacheMiss('Page not cached (offline mode): ' + url)
+        return page
+
+    def put(self, url, page):
+        '''
+        Stores the response body page for url (replacing a cached error response, if any).
+        '''
+        self.write(self.path_for(url), page)
+        try:
+            os.remove(self.error_path_for(url))
+        except OSError: ##Not cached (or removed by another thread)
+            pass
+
+    def put_error(self, url, status):
+        '''
+        Stores an error response (with HTTP status code status) for url.
+        '''
+        self.write(self.error_path_for(url), str(status))
+        try:
+            os.remove(self.path_for(url))
+        except OSError: ##Not cached (or removed by another thread)
+            pass
+
+    def write(self, path, data):
+        '''
+        Writes the entry at path. The entry is written to a temporary file then renamed, so
+        concurrent readers never see a partially written entry.
+        '''
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError: ##Created by another thread
+                pass
+        handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(handle, 'wb') as f:
+            with gzip.GzipFile(fileobj=f, mode='wb') as compressed:
+                compressed.write(data)
+        os.rename(temp_path, path)
+        with self.lock:
+            self.stores += 1
+
+    def entries(self):
+        '''
+        Returns a list of (path, size in bytes, modification time) for all cache entries.
+        '''
+        entries = []
+        for root, dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.gz'):
+                    path = os.path.join(root, name)
+                    entries.append((path, os.path.getsize(path), os.path.getmtime(path)))
+        return entries
+
+    def stats(self):
+        '''
+        Returns a dictionary of cache statistics: hits, misses, and stores since the cache was
+        opened, and the number of entries and total (compressed) bytes on disk.
+        '''
+        entries = self.entries()
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'stores': self.stores,
+                    'entries': len(entries), 'bytes': sum(size for path, size, mtime in entries)}
+
+    def evict(self, max_age=None, max_bytes=None):
+        '''
+        Deletes entries older than max_age seconds, then deletes the oldest remaining entries
+        until the cache is no larger than max_bytes. Returns the number of entries deleted.
+        '''
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        now = time.time()
+        total = sum(size for path, size, mtime in entries)
+        deleted = 0
+        for path, size, mtime in entries:
+            too_old = max_age is not None and now - mtime > max_age
+            too_big = max_bytes is not None and total > max_bytes
+            if not (too_old or too_big):
+                ## Entries are sorted oldest first, so no later entry needs to be evicted
+                break
+            os.remove(path)
+            total -= size
+            deleted += 1
+        return deleted
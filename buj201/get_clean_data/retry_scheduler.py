@@ -0,0 +1,164 @@
+'''
+This module provides adaptive rate limiting and retry scheduling for the webscraper.
+
+Rather than retrying each request on its own with a fixed sleep, all requests share:
+    - A token bucket rate limiter, whose rate adapts to what the server tolerates: the rate
+    increases slowly (additively) while requests succeed, and is halved whenever a request fails
+    due to a network error or server throttling.
+    - A circuit breaker, which pauses all new requests for a cool-down period when the error rate
+    over the most recent requests spikes.
+    - A retry scheduler, which retries failed requests with jittered exponential backoff. Note each
+    request waits (sleeps) in its own worker thread, so other in-flight requests are not blocked.
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import random
+import threading
+import time
+from collections import deque
+
+class token_bucket(object):
+    '''
+    Thread-safe token bucket allowing (on average) rate requests per second, with bursts of up
+    to capacity requests. The rate adapts between min_rate and max_rate (see success and failure).
+    '''
+
+    def __init__(self, rate=10.0, min_rate=1.0, max_rate=50.0, capacity=10, increase=0.1):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.capacity = capacity
+        self.increase = increase
+        self.tokens = float(capacity)
+        self.updated = time.time()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        '''
+        Takes a token from the bucket, waiting until one is available.
+        '''
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated)*self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens)/self.rate
+            time.sleep(wait)
+
+    def success(self):
+        '''Additively increase the rate after a successful request.'''
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def failure(self):
+        '''Halve the rate after a request fails due to network problems or throttling.'''
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate/2.0)
+
+
+class circuit_breaker(object):
+    '''
+    Tracks the outcomes of the most recent window requests. If at least min_requests have been
+    made and the fraction that failed reaches threshold, the breaker opens: all new requests wait
+    for cooldown seconds before proceeding.
+    '''
+
+    def __init__(self, window=50, min_requests=20, threshold=0.5, cooldown=30.0):
+        self.window = window
+        self.min_requests = min_requests
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.outcomes = deque(maxlen=window)
+        self.open_until = 0.0
+        self.trips = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        '''
+        Waits until the breaker is closed.
+        '''
+        while True:
+            with self.lock:
+                remaining = self.open_until - time.time()
+            if remaining <= 0:
+                return
+            time.sleep(remaining)
+
+    def record(self, succeeded):
+        '''
+        Records the outcome of a request, opening the breaker if the error rate is too high.
+        '''
+        with self.lock:
+            self.outcomes.append(succeeded)
+            failures = self.outcomes.count(False)
+            if len(self.outcomes) >= self.min_requests and failures >= self.threshold*len(self.outcomes):
+                self.open_until = time.time() + self.cooldown
+                self.trips += 1
+                self.outcomes.clear()
+
+
+class retry_scheduler(object):
+    '''
+    Runs requests subject to the shared rate limiter and circuit breaker, retrying requests that
+    fail with an exception for which should_retry(exception) is True. The n-th retry waits a random
+    time between 0 and min(max_delay, base_delay*2**n) seconds ("full jitter"). After max_attempts
+    attempts, the last exception is raised.
+    '''
+
+    def __init__(self, should_retry, limiter=None, breaker=None, max_attempts=5, base_delay=1.0, max_delay=30.0):
+        self.should_retry = should_retry
+        self.limiter = limiter if limiter is not None else token_bucket()
+        self.breaker = breaker if breaker is not None else circuit_breaker()
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.counts = {'attempts': 0, 'retries': 0, 'failures': 0}
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def call(self, function, *args):
+        '''
+        Calls function(*args), retrying as described above. Returns function's result.
+        '''
+        for attempt in range(self.max_attempts):
+            self.breaker.wait()
+            self.limiter.acquire()
+            self.count('attempts')
+            try:
+                result = function(*args)
+            except Exception as e:
+                if not self.should_retry(e):
+                    ## Not a network or server problem (i.e. the page doesn't exist), so the request counts as completed
+                    self.breaker.record(True)
+                    raise
+                self.breaker.record(False)
+                self.limiter.failure()
+                if attempt == self.max_attempts - 1:
+                    self.count('failures')
+                    raise
+                self.count('retries')
+                time.sleep(random.uniform(0, min(self.max_delay, self.base_delay*2**attempt)))
+                continue
+            self.breaker.record(True)
+            self.limiter.success()
+            return result
+
+    def stats(self):
+        '''
+        Returns a dictionary of statistics: attempts, retries, and failures (requests that failed
+        on every attempt), the current request rate, and the number of times the circuit breaker opened.
+        '''
+        with self.lock:
+            stats = dict(self.counts)
+        stats['rate'] = self.limiter.rate
+        stats['breaker_trips'] = self.breaker.trips
+        return stats
@@ -0,0 +1,124 @@
+'''
+This module provides a streaming row collector for the scraped expenditure data.
+
+Each school's expenditure report is scraped as a pd.Series (see get_all_school_data).
+Rather than growing a dataframe one school at a time (which copies the whole frame
+for every school), the collector:
+    - Records each school's row as it arrives, keeping track of the union of all
+    features seen so far.
+    - Optionally spools rows to a file on disk (one JSON record per line) instead of
+    holding them in memory, so peak memory stays flat as the number of schools grows.
+    - Materializes the year's data once at the end, either as a dataframe or by writing
+    the year's csv file directly from the spooled rows.
+The output matches that of pd.concat([...], axis=1).T over the same series: one row per school
+(in the order the rows were added), with the features sorted alphabetically as columns.
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import csv
+import json
+import os
+import tempfile
+import pandas as pd
+
+class expenditure_row_collector(object):
+    '''
+    Collects school expenditure rows (pd.Series named by DBN). If spool_path is given,
+    rows are appended to that file as they arrive; otherwise they are held in memory.
+    '''
+
+    def __init__(self, spool_path=None):
+        self.spool_path = spool_path
+        self.columns = set()
+        self.n_rows = 0
+        self.rows = []
+        self.spool = None
+        if spool_path is not None:
+            self.spool = open(spool_path, 'w')
+
+    def add(self, school_results):
+        '''
+        Adds a school's results (as returned by get_all_school_data) to the collector.
+        Schools without data (None) are skipped.
+        '''
+        if school_results is None:
+            return
+        row = dict(zip(school_results.index, school_results.values))
+        self.columns.update(row.keys())
+        self.n_rows += 1
+        if self.spool is not None:
+            self.spool.write(json.dumps([school_results.name, row]) + '\n')
+            self.spool.flush()
+        else:
+            self.rows.append((school_results.name, row))
+
+    def iter_rows(self):
+        '''
+        Yields (DBN, row dictionary) pairs in the order they were added.
+        '''
+        if self.spool is None:
+            for name, row in self.rows:
+                yield name, row
+        else:
+            self.spool.flush()
+            with open(self.spool_path) as spooled:
+                for line in spooled:
+                    name, row = json.loads(line)
+                    yield encode_value(name), dict((encode_value(k), encode_value(v)) for k, v in row.items())
+
+    def sorted_columns(self):
+        return sorted(self.columns)
+
+    def to_dataframe(self):
+        '''
+        Materializes all collected rows as a single dataframe (one row per school).
+        '''
+        names = []
+        records = []
+        for name, row in self.iter_rows():
+            names.append(name)
+            records.append(row)
+        return pd.DataFrame.from_records(records, index=names, columns=self.sorted_columns())
+
+    def write_csv(self, path):
+        '''
+        Writes the collected rows to the csv file at path, streaming one row at a time.
+        The file is identical to that written by self.to_dataframe().to_csv(path).
+        '''
+        write_rows_csv(path, self.sorted_columns(), self.iter_rows())
+
+    def close(self):
+        '''
+        Closes and deletes the spool file (if any).
+        '''
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+            os.remove(self.spool_path)
+
+
+def write_rows_csv(path, columns, rows):
+    '''
+    Writes (DBN, row dictionary) pairs to the csv file at path, one row at a time, in the
+    format written by pandas' to_csv (with missing features left empty).
+    The file is written to a temporary file and then renamed, so readers (and other scrape
+    workers writing the same file) never see a partially written file.
+    '''
+    handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(handle, 'wb') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow([''] + columns)
+        for name, row in rows:
+            writer.writerow([name] + [row.get(column, '') for column in columns])
+    os.rename(temp_path, path)
+
+def encode_value(value):
+    '''
+    json.loads returns strings as unicode- convert them back to str, as returned by the scraper.
+    '''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
@@ -0,0 +1,46 @@
+'''
+This module reads the School-Level Master File (SCHMA) in chunks.
+
+The SCHMA csv file holds every school's records for 1996-2013, but we only use a few of its
+columns, for a few years. Rather than reading the whole file and then selecting the columns
+and years needed, iter_SCHMA reads only the requested columns (plus YEAR), a chunk of rows at
+a time, and drops the rows outside the requested years from each chunk as it's read. So at most
+one chunk of the file is held in memory at once, however large the file is.
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import pandas as pd
+
+SCHMA_PATH = '../data/SCHMA/schma19962013.csv'
+
+## The types of the SCHMA columns we use- pass these (for the columns read) as iter_SCHMA's dtype, so
+## a column's type doesn't depend on the values in each chunk (i.e. a chunk of numeric-looking codes).
+## Note YEAR is read as a float, since it may be missing.
+SCHMA_DTYPES = {'YEAR': float, 'BNLONG': str, 'LCGGEOX': float, 'LCGGEOY': float}
+
+def iter_SCHMA(path=SCHMA_PATH, columns=None, years=None, chunksize=100000, dtype=None):
+    '''
+    Yields the SCHMA records as dataframes of up to chunksize rows. Only the input columns (a list,
+    or None for all columns) are read, and only records with YEAR in years (a (first, last) tuple,
+    inclusive, or None for all years) are kept. Note the columns keep their order in the file, and
+    the rows keep their row numbers in the file as their index. dtype is passed to pd.read_csv
+    (i.e. to fix the type of columns whose type could otherwise differ between chunks).
+    '''
+    usecols = None
+    if columns is not None:
+        usecols = list(columns) if 'YEAR' in columns else list(columns) + ['YEAR']
+    for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize, dtype=dtype):
+        if years is not None:
+            chunk = chunk.loc[(years[0] <= chunk.YEAR) & (chunk.YEAR <= years[1])]
+        if columns is not None and 'YEAR' not in columns:
+            chunk = chunk.drop('YEAR', axis=1)
+        yield chunk
+
+def read_SCHMA(path=SCHMA_PATH, columns=None, years=None, chunksize=100000, dtype=None):
+    '''
+    Returns the SCHMA records (for the input columns and years, as in iter_SCHMA) as a single dataframe.
+    '''
+    return pd.concat(list(iter_SCHMA(path, columns, years, chunksize, dtype)))
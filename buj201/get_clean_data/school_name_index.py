@@ -0,0 +1,124 @@
+'''
+This module provides a persistent, per-year index of expenditure report search results.
+
+Every school's expenditure report is found by first searching the year's expenditure reports
+for the school's DBN. The index records, for each (year, DBN) searched:
+    - school_name: the resolved, URL-encoded school name used to request the school's
+    expenditure report (or None if the school was not found)
+    - options: the text of the options listed on the search results page
+Both the scraper (get_school_name_from_year_and_DBN) and the webscraper coverage check
+(how_many_schools_missed) read the index before searching, so each DBN is searched for at
+most once per year. Each year's index is saved as a JSON file in INDEX_DIRECTORY. Delete the
+index files to force new searches.
+Several scrape workers (see scrape_worker.py) may save the same year's index: each save merges
+the entries already on disk (under a file lock), so no worker's entries are lost.
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import fcntl
+import json
+import os
+import tempfile
+import threading
+
+INDEX_DIRECTORY = '../data/school_name_index'
+
+class school_name_index(object):
+    '''
+    The search index for a single year, stored at INDEX_DIRECTORY/year_{year}.json.
+    The index is saved after every save_every new entries, and when save is called.
+    '''
+
+    def __init__(self, year, directory=INDEX_DIRECTORY, save_every=100):
+        self.year = year
+        self.path = os.path.join(directory, 'year_{}.json'.format(str(year)))
+        self.save_every = save_every
+        self.lock = threading.Lock()
+        self.unsaved = 0
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.entries = json.load(f)
+
+    def get(self, DBN):
+        '''
+        Returns the index entry (a dictionary with keys 'school_name' and 'options') for DBN,
+        or None if DBN has not been searched for.
+        '''
+        with self.lock:
+            entry = self.entries.get(DBN)
+        if entry is None:
+            return None
+        school_name = entry['school_name']
+        if school_name is not None:
+            school_name = str(school_name)
+        return {'school_name': school_name, 'options': entry['options']}
+
+    def put(self, DBN, school_name, options):
+        '''
+        Adds the search result for DBN to the index, and returns the new entry.
+        '''
+        with self.lock:
+            self.entries[DBN] = {'school_name': school_name, 'options': options}
+            self.unsaved += 1
+            save_now = self.unsaved >= self.save_every
+        if save_now:
+            self.save()
+        return {'school_name': school_name, 'options': options}
+
+    def save(self):
+        '''
+        Writes the index to disk (via a temporary file, so the saved index is never partially written).
+        Entries saved by other processes since the index was loaded are merged in first (while holding
+        a lock on path + '.lock', so concurrent saves don't overwrite each other's entries).
+        '''
+        with self.lock:
+            if not os.path.isdir(os.path.dirname(self.path)):
+                os.makedirs(os.path.dirname(self.path))
+            with open(self.path + '.lock', 'a') as lock_file:
+                fcntl.lockf(lock_file, fcntl.LOCK_EX)
+                if os.path.exists(self.path):
+                    with open(self.path) as f:
+                        for DBN, entry in json.load(f).items():
+                            self.entries.setdefault(DBN, entry)
+                handle, temp_path = tempfile.mkstemp(dir=os.path.dirname(self.path))
+                with os.fdopen(handle, 'w') as f:
+                    json.dump(self.entries, f)
+                os.rename(temp_path, self.path)
+            self.unsaved = 0
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+_index_directory = INDEX_DIRECTORY
+
+def get_school_name_index(year):
+    '''
+    Returns the (shared) search index for year, loading it from disk the first time it's used.
+    '''
+    with _indexes_lock:
+        if year not in _indexes:
+            _indexes[year] = school_name_index(year, _index_directory)
+        return _indexes[year]
+
+def set_school_name_index_directory(directory):
+    '''
+    Stores the shared indexes in directory (discarding any indexes already loaded by this process)-
+    i.e. so scraper load tests neither use nor modify the saved indexes.
+    '''
+    global _index_directory
+    with _indexes_lock:
+        _index_directory = directory
+        _indexes.clear()
+
+def save_school_name_indexes():
+    '''
+    Saves all indexes loaded by this process.
+    '''
+    with _indexes_lock:
+        indexes = _indexes.values()
+    for index in indexes:
+        index.save()
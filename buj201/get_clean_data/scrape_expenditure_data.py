@@ -24,11 +24,88 @@ if __name__ == "__main__":
     print "Not to be called directly- exiting program"
     sys.exit()
     
-from urllib2 import urlopen, HTTPError, URLError
+from urllib2 import HTTPError, URLError
 from lxml.html import parse
 import re
-import pandas as pd
-from retrying import retry
+from fetch_engine import fetch_engine
+from retry_scheduler import retry_scheduler, token_bucket, circuit_breaker
+from response_cache import response_cache, OfflineCacheMiss
+from row_collector import expenditure_row_collector, write_rows_csv
+from scrape_journal import scrape_journal
+from work_queue import work_queue, lease_renewer, default_worker_name
+from page_archive import page_archive, ARCHIVE_DIRECTORY
+from fetch_parse_pipeline import fetch_parse_pipeline
+from demo_account_snapshot import get_demo_account_snapshot
+from school_name_index import get_school_name_index, save_school_name_indexes
+from report_page_extractor import extract_school_features
+
+## The expenditure report site. BASE_URL can be pointed at a stand-in server (see stand_in_server.py)
+## to test or benchmark the scraper offline.
+NYCENET_BASE_URL = "https://www.nycenet.edu/offices/d_chanc_oper/budget/exp01"
+BASE_URL = NYCENET_BASE_URL
+
+## Concurrency and per-host politeness settings for the scraper. At most CONCURRENCY schools are
+## scraped at once, with at most MAX_CONNECTIONS_PER_HOST open requests to www.nycenet.edu, started
+## at least MIN_REQUEST_INTERVAL seconds apart.
+## Note the shared transport keeps up to 8 idle keep-alive connections per host, so all
+## MAX_CONNECTIONS_PER_HOST connections are re-used across requests.
+CONCURRENCY = 16
+MAX_CONNECTIONS_PER_HOST = 8
+MIN_REQUEST_INTERVAL = 0.05
+
+## Years scraped, and the number of (year, DBN) work units a worker claims from the work queue at once.
+YEARS = range(2006,2013)
+CLAIM_BATCH_SIZE = 4*CONCURRENCY
+
+## Fetched report pages are archived (the archive is their only store- they aren't also kept in the response
+## cache), then parsed in PARSE_PROCESSES worker processes (None for one per CPU).
+## At most PARSE_QUEUE_SIZE fetched pages wait to be parsed.
+PARSE_PROCESSES = None
+PARSE_QUEUE_SIZE = 4*CONCURRENCY
+
+## Response cache settings. Fetched search pages are cached (compressed) in CACHE_DIRECTORY, and re-used
+## for up to CACHE_TTL seconds. After each scrape, the cache is trimmed to CACHE_MAX_BYTES.
+## Set OFFLINE = True to replay a previous scrape entirely from the cache (without any network requests).
+CACHE_DIRECTORY = '../data/response_cache'
+CACHE_TTL = 90*24*60*60
+CACHE_MAX_BYTES = 2*1024**3
+OFFLINE = False
+
+## Rate limiting and retry settings. Requests start at INITIAL_REQUESTS_PER_SECOND; the rate increases
+## while requests succeed (up to MAX_REQUESTS_PER_SECOND), and is halved on each network error or
+## throttling response (down to MIN_REQUESTS_PER_SECOND). Failed requests are retried up to
+## MAX_ATTEMPTS times, with jittered exponential backoff (starting at BASE_RETRY_DELAY seconds, and at
+## most MAX_RETRY_DELAY seconds). If at least half of the last 50 requests fail, all requests pause for
+## BREAKER_COOLDOWN seconds.
+INITIAL_REQUESTS_PER_SECOND = 10.0
+MIN_REQUESTS_PER_SECOND = 1.0
+MAX_REQUESTS_PER_SECOND = 20.0
+MAX_ATTEMPTS = 5
+BASE_RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+BREAKER_COOLDOWN = 30.0
+
+## HTTP statuses returned when the server is overloaded or throttling requests- these are retried.
+THROTTLED_STATUSES = (429, 503)
+
+def retry_if_URL_error_not_HTTP_error(exception):
+    '''Return True if we should retry (in this case when a URLError has been raised (i.e. network connection
+    problem) and not an HTTPError (i.e. page doesn't exist) or an OfflineCacheMiss (page not cached in offline mode)'''
+    return (isinstance(exception, URLError) and not isinstance(exception, (HTTPError, OfflineCacheMiss)))
+
+def retry_if_URL_error_or_throttled(exception):
+    '''Return True if we should retry- when a URLError has been raised (as for retry_if_URL_error_not_HTTP_error),
+    or when the server is throttling requests'''
+    return (retry_if_URL_error_not_HTTP_error(exception) or
+            (isinstance(exception, HTTPError) and exception.code in THROTTLED_STATUSES))
+
+cache = response_cache(CACHE_DIRECTORY, ttl=CACHE_TTL, offline=OFFLINE)
+scheduler = retry_scheduler(retry_if_URL_error_or_throttled,
+                            token_bucket(INITIAL_REQUESTS_PER_SECOND, MIN_REQUESTS_PER_SECOND, MAX_REQUESTS_PER_SECOND),
+                            circuit_breaker(cooldown=BREAKER_COOLDOWN),
+                            MAX_ATTEMPTS, BASE_RETRY_DELAY, MAX_RETRY_DELAY)
+engine = fetch_engine(CONCURRENCY, MAX_CONNECTIONS_PER_HOST, MIN_REQUEST_INTERVAL, cache=cache, scheduler=scheduler)
+archive = page_archive(ARCHIVE_DIRECTORY)
 
 def hexencode(matchobj):
     '''
@@ -38,169 +115,165 @@ def hexencode(matchobj):
     encoded = '%' + matchobj.group(0).encode('hex')
     return encoded
 
-def retry_if_URL_error_not_HTTP_error(exception):
-    '''Return True if we should retry (in this case when a URLError has been raised (i.e. network connection
-    problem) and not an HTTPError (i.e. page doesn't exist)'''
-    return (isinstance(exception, URLError) and not isinstance(exception, HTTPError))
-            
-##Retry decorator will retry every two seconds, for up to 10 seconds, if URLError    
-@retry(retry_on_exception=retry_if_URL_error_not_HTTP_error, wait_fixed=2000, stop_max_delay=10000)
+def search_url(year, DBN):
+    '''
+    Builds the URL to search the given year's expenditure reports for a school code (DBN).
+    '''
+    years = str(year-1) + '_' + str(year)
+    return (BASE_URL + "/y" + years +
+            "/function.asp?district=All&search=" + DBN +
+            "&searchgo=Search&LCMS=**&GRANT=NO&cr1=All&cr2=All&cr3=All&cr4=All&R=1&prior=search")
+
+def report_url(year, DBN, school_name):
+    '''
+    Builds the URL for a school's expenditure report for the given year, using the school name
+    returned by get_school_name_from_year_and_DBN.
+    '''
+    years = str(year-1) + '_' + str(year)
+    return (BASE_URL + "/y" + years +
+            "/function.asp?district=All&search=" + DBN + "&LCMS=" + school_name +
+            "&schoolgo=Go&GRANT=NO&cr1=All&cr2=All&cr3=All&cr4=All&R=1&prior=search")
+
 def get_school_name_from_year_and_DBN(year, DBN):
     '''
     Takes an input year and school code (DBN). Builds a URL to search the given year's expenditure
     reports for that DBN. If a result (i.e. school name) is found, returns the URL to get that school's
-    expenditure report'''
-    
-    #build initial query:
-    
-    years = str(year-1) + '_' + str(year)
-    query1 = ("https://www.nycenet.edu/offices/d_chanc_oper/budget/exp01/y" + years +
-             "/function.asp?district=All&search=" + DBN +
-             "&searchgo=Search&LCMS=**&GRANT=NO&cr1=All&cr2=All&cr3=All&cr4=All&R=1&prior=search")
+    expenditure report (otherwise returns None). Note search results are stored in the year's school name
+    index, so each DBN is only searched for once. If the search fails, its exception (see
+    search_expenditure_reports) is raised, and nothing is indexed.'''
     
+    index = get_school_name_index(year)
+    entry = index.get(DBN)
+    if entry is None:
+        options = search_expenditure_reports(year, DBN)
+        entry = index.put(DBN, school_name_from_options(DBN, options), options)
+    return entry['school_name']
+
+##Note failed requests are retried by the engine's retry scheduler
+def search_expenditure_reports(year, DBN):
+    '''
+    Takes an input year and school code (DBN). Searches the given year's expenditure reports for that DBN,
+    and returns the text of each option on the search results page. If the search page can't be fetched, the
+    HTTPError (i.e. page doesn't exist, or the server is still throttling requests after all retries) or
+    URLError (network problem) is raised, so the failed search isn't mistaken for a school that wasn't found.
+    '''
     
-    ##get school name by searching html page returned from query- if not found, return None.
-    try:
-        parsed1 = parse(urlopen(query1))
-        doc=parsed1.getroot()
-        options = doc.findall('.//option')
-        for option in options:
-            ##Schools in districts 1-32
-            if re.match('District', option.text_content()):
-                school_name = option.text_content()
-                school_name = re.sub('--','',school_name)
-                school_name = re.sub('District:\s','', school_name)
-                school_name = re.sub('\s','+', school_name)
-                school_name = re.sub('[^A-Za-z0-9\s+.]', hexencode, school_name)
-                school_name = str(DBN) + school_name
-                return school_name
-            
-            ##Schools in district 75- citywide special education district
-            elif re.match('Citywide', option.text_content()):
-                school_name = option.text_content()
-                school_name = re.split('--',school_name)[1]
-                school_name = re.sub('\s','+',school_name)
-                school_name = re.sub('\.\+?','+',school_name)
-                ##Note even though it's district 75, it's coded as 97 in the url
-                school_name = str(DBN) + str(97) + str(school_name)
-                school_name = re.sub('[^A-Za-z0-9\s+.]', hexencode, school_name)
-                return school_name 
-            
-            ##Schools in district 79- alternative HS's
-            elif re.match('Alternative HS', option.text_content()):
-                school_name = option.text_content()
-                school_name = re.split('--',school_name)[1]
-                school_name = re.sub('\s+','+',school_name)
-                school_name = str(DBN) + str(79) + str(school_name)
-                school_name = re.sub('[^A-Za-z0-9\s+.]', hexencode, school_name)
-                return school_name
-            
-        ##If not found, return None- school expenditure report not available.
-        return None
-            
-    except HTTPError:
-        return None
+    parsed1 = parse(engine.urlopen(search_url(year, DBN)))
+    doc=parsed1.getroot()
+    return [option.text_content() for option in doc.findall('.//option')]
+
+def school_name_from_options(DBN, options):
+    '''
+    Takes a school code (DBN) and the text of the options on the search results page for that DBN.
+    If a result (i.e. school name) is found, returns the school name as used in the URL for that school's
+    expenditure report. Otherwise returns None.
+    '''
     
-    except URLError:
-        return None
+    ##get school name from the search results- if not found, return None.
+    for option in options:
+        ##Schools in districts 1-32
+        if re.match('District', option):
+            school_name = option
+            school_name = re.sub('--','',school_name)
+            school_name = re.sub('District:\s','', school_name)
+            school_name = re.sub('\s','+', school_name)
+            school_name = re.sub('[^A-Za-z0-9\s+.]', hexencode, school_name)
+            school_name = str(DBN) + school_name
+            return school_name
+        
+        ##Schools in district 75- citywide special education district
+        elif re.match('Citywide', option):
+            school_name = option
+            school_name = re.split('--',school_name)[1]
+            school_name = re.sub('\s','+',school_name)
+            school_name = re.sub('\.\+?','+',school_name)
+            ##Note even though it's district 75, it's coded as 97 in the url
+            school_name = str(DBN) + str(97) + str(school_name)
+            school_name = re.sub('[^A-Za-z0-9\s+.]', hexencode, school_name)
+            return school_name 
+        
+        ##Schools in district 79- alternative HS's
+        elif re.match('Alternative HS', option):
+            school_name = option
+            school_name = re.split('--',school_name)[1]
+            school_name = re.sub('\s+','+',school_name)
+            school_name = str(DBN) + str(79) + str(school_name)
+            school_name = re.sub('[^A-Za-z0-9\s+.]', hexencode, school_name)
+            return school_name
+        
+    ##If not found, return None- school expenditure report not available.
+    return None
     
-@retry(retry_on_exception=retry_if_URL_error_not_HTTP_error, wait_fixed=2000, stop_max_delay=10000)
 def get_all_school_data(year,DBN):
     '''
     Takes a year and DBN as input. Searches expenditure reports for that DBN to get
     the school name (URL for school expenditure report). If a school name found, then
     reads in the school's expenditure report page, parses it, and returns a dataframe with
-    per student expenditures for that year.
+    per student expenditures for that year (or None if the data isn't available, or can't be fetched).
+    '''
+    return scrape_unit(year, DBN)[1]
+
+def scrape_school(year, DBN):
+    '''
+    Scrapes the expenditure report for the input year and DBN (as described in get_all_school_data).
+    Returns a (status, school_features) tuple, where status is one of the work journal outcomes
+    ('found', 'not_found', 'http_error', or 'missing_tables') and school_features is the school's
+    data (or None if the school's data is not available).
     '''
     
-    ##Build URL to get school expenditure data
-    school_name = get_school_name_from_year_and_DBN(year, DBN)
-    if school_name is None:
-        return None
+    status, school_name, page = fetch_report_page(year, DBN)
+    if status != 'fetched':
+        return status, None
+    return extract_report_page(page, school_name, DBN)
 
-    ##if found, use school name to build new query to get expenditure report for year:
-    years = str(year-1) + '_' + str(year)
-    query2 = ("https://www.nycenet.edu/offices/d_chanc_oper/budget/exp01/y" + years +
-             "/function.asp?district=All&search=" + DBN + "&LCMS=" + school_name +
-             "&schoolgo=Go&GRANT=NO&cr1=All&cr2=All&cr3=All&cr4=All&R=1&prior=search")
-    
-    try: ##Try opening the URL page and parsing it.
-        parsed = parse(urlopen(query2))
-        doc = parsed.getroot()
-        tables = doc.findall('.//table')
-        
-        ##Table 5 data includes the school name, district, and it's Title 1 status
-        rows = tables[4].findall('.//tr')
-        elts = rows[2].findall('.//td')
-        
-        ## This will work for Districts 1-32, but not 75 or 79, which are formatted differently
-        if int(school_name[4:6]) in range(1,33): 
-            for val in elts[0]:
-                table_5_dat = val.text_content()
-                table_5_dat = re.split('[\xa0]+[\s]?',table_5_dat)
-                school_features = {}
-                for i in table_5_dat:
-                    school_features[str(re.sub('\s','_', re.split(':\s',i)[0]))]=str(re.split(':[\s]+',i)[1])
-        
-        ## Handles districts 75 and 79
-        else:
-            for val in elts[0]:
-                table_5_dat = val.text_content()
-                table_5_dat = re.split('[\s]?[\xa0]+[\s]?',table_5_dat)
-                school_features = {}
-                school_features['District'] = str(re.sub('\s', '_', table_5_dat[0]))
-                for i in table_5_dat[1:]:
-                    school_features[str(re.sub('\s','_', re.split(':\s',i)[0]))]=str(re.split(':[\s]+',i)[1])
-        
-        ## Now we need to convert the text district names to numeric district codes:
-        if school_features['District'] == 'Citywide_Sp_Ed_(75)':
-            school_features['District'] = 75
-        elif  school_features['District'] == 'Alternative_HS':
-            school_features['District'] = 79
-        
-        ##Make expenditure dict:
-        expenditures = {}
-        
-        ##Table 7 includes part of the per student expenditures
-        rows = tables[6].findall('.//tr')
-        for row in rows:
-            elts = row.findall('.//td')
-            for pair in zip(elts[0],elts[3]):
-                key = re.sub('[\xa0]+','_', pair[0].text_content())
-                key = re.sub('.*?\._','',key)
-                key = re.sub('[^A-Za-z_]','',key)
-                expenditures[key] = re.sub('[^0-9]','', pair[1].text_content())
-                 
-        ##Table 10 includes the rest of the per student expenditures.
-        rows = tables[9].findall('.//tr')
-        for row in rows:
-            elts = row.findall('.//td')
-            for pair in zip(elts[0],elts[3]):
-                key = re.sub('[\xa0]+','_', pair[0].text_content())
-                key = re.sub('.*?\._','',key)
-                key = re.sub('[^A-Za-z_]','',key)
-                expenditures[key] = re.sub('[^0-9]','', pair[1].text_content())
+def fetch_report_page(year, DBN):
+    '''
+    Fetches the expenditure report page for the input year and DBN (from the page archive, if it's archived-
+    otherwise the fetched page is archived). Returns a (status, school_name, page)
+    tuple, where status is 'fetched' if the page was fetched, 'not_found' if the search found no matching
+    school, or 'http_error' if the search or report page doesn't exist. Network problems (URLError) and
+    throttling responses (once the retry scheduler's retries run out) are raised, so the unit isn't
+    journaled (and is retried).
+    '''
+    
+    try:
+        ##Build URL to get school expenditure data
+        school_name = get_school_name_from_year_and_DBN(year, DBN)
+        if school_name is None:
+            return 'not_found', None, None
+
+        ##if found, use school name to request the school's expenditure report for year (unless it's archived):
+        archived = archive.get(year, DBN)
+        if archived is not None and archived[0] == school_name:
+            return 'fetched', school_name, archived[1]
+        page = engine.urlopen(report_url(year, DBN, school_name), store=False).read()
+        archive.put(year, DBN, school_name, page)
                                            
-    ## Note- @retry wrapper will retry if URLerror but not HTTPError (so if network connectivity issue we'll retry)
-    ## If HTTPError, we want to just return- the page doesn't exisT
+    ## Note- the retry scheduler retries if URLerror or throttled, but not other HTTPErrors (so if network connectivity issue we'll retry)
+    ## If HTTPError, we want to just return- the page doesn't exist
+    
+    except HTTPError as error:
+        if error.code in THROTTLED_STATUSES:
+            raise
+        return 'http_error', None, None
     
-    except HTTPError:
-        return
+    return 'fetched', school_name, page
+
+def extract_report_page(page, school_name, DBN):
+    '''
+    Parses a school's expenditure report page. Returns a (status, school_features) tuple, with
+    status 'found' or 'missing_tables'.
+    '''
+    try:
+        school_features = extract_school_features(page, school_name, DBN)
     
     ## If data not available it will throw an IndexError (list out of bounds).
     ## This reflects missing data (i.e. missing tables, or rows, or cells) so we return 'none'.
     
     except IndexError:
-        return
-    
-    ##clean up expenditures- read in one null value that should be deleted due to table structure
-    
-    del expenditures['_']
+        return 'missing_tables', None
     
-    ##join two dictionaries and return as series
-    school_features.update(expenditures)
-    school_features = pd.Series(school_features.values(), index=school_features.keys(), name=DBN)
-    return school_features
+    return 'found', school_features
 
 def get_DBN_list():
     '''
@@ -208,40 +281,189 @@ def get_DBN_list():
     we'll use to query the expenditure report tool.
     '''
     
-    query = 'https://nycopendata.socrata.com/api/views/ihfw-zy9j/rows.csv?accessType=DOWNLOAD'
-    Demo_and_Account = pd.read_csv(query)
+    Demo_and_Account = get_demo_account_snapshot()
     all_DBNs = Demo_and_Account['DBN']
     unique_DBNs = all_DBNs.unique()
     for i in range(len(unique_DBNs)):
         unique_DBNs[i] = unique_DBNs[i][2:]
     return unique_DBNs
 
+def collect_expenditure_rows(year, collector):
+    '''
+    Scrapes school expenditure data for all available DBN's for the input year (concurrently,
+    using the fetch engine), adding each school's results to collector as they arrive.
+    '''
+    
+    unique_DBNs = get_DBN_list()
+    for school_results in engine.imap(lambda DBN: get_all_school_data(year, DBN), unique_DBNs):
+        collector.add(school_results)
+    return collector
+
 def build_expenditure_dataframe(year):
     '''
     Get's school expenditure data for all available DBN's for the input year. Returns
     all school data as a dataframe.
     '''
     
+    collector = collect_expenditure_rows(year, expenditure_row_collector())
+    return collector.to_dataframe()
+
+def scrape_unit(year, DBN):
+    '''
+    Scrapes a single (year, DBN) work unit for the journaled scrape. Returns the unit's
+    (status, school_features) tuple, or ('url_error', None) if the unit could not be scraped
+    due to network problems (so it isn't journaled, and is retried on restart).
+    '''
+    try:
+        return scrape_school(year, DBN)
+    except URLError:
+        return 'url_error', None
+
+def enqueue_units(queue, journal, years=YEARS):
+    '''
+    Adds a work unit for each (year, DBN) to the work queue. Units already recorded in the
+    scrape journal are added as done, and units not recorded in it are (re)set to pending.
+    '''
     unique_DBNs = get_DBN_list()
-    results_for_year = get_all_school_data(year, unique_DBNs[0])
-    for DBN in unique_DBNs[1:]:
-        school_results = get_all_school_data(year, DBN)
-        results_for_year = pd.concat([results_for_year, school_results], axis=1)
-    results_for_year = results_for_year.T
-    return results_for_year
+    for year in years:
+        queue.enqueue(year, unique_DBNs, journal.completed(year))
+
+def fetch_unit(unit):
+    '''
+    Fetch stage of the scrape pipeline: fetches (and archives) the report page for a (year, DBN, position)
+    work unit. Returns a (year, DBN, position, status) item, where status is 'fetched' if the page was
+    archived, the unit's outcome if the school's report isn't available, or 'url_error' if the unit
+    could not be fetched due to network problems.
+    '''
+    year, DBN, position = unit
+    try:
+        status, school_name, page = fetch_report_page(year, DBN)
+    except URLError:
+        return year, DBN, position, 'url_error'
+    return year, DBN, position, status
+
+def extract_unit(item):
+    '''
+    Parse stage of the scrape pipeline (run in a worker process): parses the archived page for a fetched
+    item. Returns a (year, DBN, position, status, school_features) tuple.
+    '''
+    year, DBN, position, status = item
+    if status != 'fetched':
+        return year, DBN, position, status, None
+    school_name, page = archive.get(year, DBN)
+    status, school_features = extract_report_page(page, school_name, DBN)
+    return year, DBN, position, status, school_features
+
+def run_scrape_worker(queue, journal, worker=None):
+    '''
+    Claims batches of work units from the work queue and scrapes them, until no units are left to
+    claim. Pages are fetched concurrently (using the fetch engine) and parsed in a pool of worker
+    processes (see fetch_parse_pipeline.py). Each unit's outcome is recorded in the scrape journal
+    before the unit is marked done. The leases on claimed units are renewed until they're done (see
+    lease_renewer). Units that could not be scraped due to network problems are left claimed, so
+    they're retried (by any worker) once their lease expires. Returns the number of units scraped,
+    and the number that failed.
+    '''
+    if worker is None:
+        worker = default_worker_name()
+    renewer = lease_renewer(queue, worker).start()
+
+    def claimed_batches():
+        while True:
+            units = queue.claim(worker, CLAIM_BATCH_SIZE)
+            if len(units) == 0:
+                return
+            renewer.add(units)
+            yield units
+
+    pipeline = fetch_parse_pipeline(engine, PARSE_PROCESSES, PARSE_QUEUE_SIZE)
+    scraped = 0
+    failed = 0
+    try:
+        for year, DBN, position, status, school_results in pipeline.run(claimed_batches(), fetch_unit, extract_unit):
+            renewer.discard(year, DBN)
+            if status == 'url_error':
+                failed += 1
+                continue
+            journal.record(year, DBN, position, status, school_results)
+            queue.complete(year, DBN)
+            scraped += 1
+            if scraped % CLAIM_BATCH_SIZE == 0:
+                print 'Scraped', scraped, 'schools,', queue.remaining(), 'remaining'
+    finally:
+        renewer.stop()
+    save_school_name_indexes()
+    return scraped, failed
+
+def reextract_archived_pages(journal, years=YEARS):
+    '''
+    Re-parses every archived report page for years (in parallel, without fetching anything), i.e.
+    after a change to the report page extractor, and records the new outcomes in the scrape journal.
+    Returns the number of pages re-parsed.
+    '''
+    items = []
+    for year in years:
+        positions = journal.positions(year)
+        items.extend((year, DBN, positions[DBN], 'fetched') for DBN in archive.DBNs(year) if DBN in positions)
+    pipeline = fetch_parse_pipeline(engine, PARSE_PROCESSES, PARSE_QUEUE_SIZE)
+    for year, DBN, position, status, school_results in pipeline.parse(items, extract_unit):
+        journal.record(year, DBN, position, status, school_results)
+    return len(items)
+
+def merge_scraped_years(queue, journal):
+    '''
+    Saves expenditure data for each year whose work units are all done as a csv file (streaming
+    rows from the scrape journal). A year is only saved if every one of its units has a journaled
+    outcome (so a year's csv file is never overwritten with missing schools, i.e. if the journal
+    was deleted after the units were done). Returns True if every year's csv file was saved.
+    '''
+    all_complete = True
+    for year in queue.years():
+        remaining = queue.remaining(year)
+        if remaining > 0:
+            print remaining, 'schools still to scrape for year', year
+            all_complete = False
+            continue
+        missing = queue.DBNs(year) - journal.completed(year)
+        if missing:
+            print len(missing), 'schools for year', year, 'are done but not in the scrape journal- not saving the year (restart main.py to re-scrape them)'
+            all_complete = False
+            continue
+        save_path = "../data/raw_school_expenditures_by_year/year_" + str(year) + ".csv"
+        write_rows_csv(save_path, journal.columns(year), journal.rows(year))
+        print 'Saved data for year', year
+    return all_complete
+
+def print_scrape_stats():
+    cache.evict(max_age=CACHE_TTL, max_bytes=CACHE_MAX_BYTES)
+    print 'Response cache:', cache.stats()
+    print 'HTTP connections:', engine.transport.stats()
+    print 'Requests:', scheduler.stats()
 
 def save_2006_to_2012_data():
     '''
     Scrapes data for all years, 2006-2012. Saves expenditure data for all
     available schools for these years in csv files.
+    
+    The (year, DBN) work units are added to the shared work queue, and this process then works
+    through them as a single scrape worker (more workers can be started with scrape_worker.py,
+    on this or any machine sharing the data directory). The outcome of each unit is recorded in
+    the scrape journal as it's scraped, so if the scrape is interrupted, restarting it only scrapes
+    the remaining units. Each year's csv file is written once all of the year's units are complete.
     '''
     
+    journal = scrape_journal()
+    queue = work_queue()
     print 'Starting to get data'
-    for year in range(2006,2013):
-        print 'Starting to get data for', year
-        save_path = "../data/raw_school_expenditures_by_year/year_" + str(year) + ".csv"
-        year_expenditure_data = build_expenditure_dataframe(year)
-        print 'Got data for year', year
-        year_expenditure_data.to_csv(save_path)
-        print 'Saved data for year', year
-    print 'Done'
\ No newline at end of file
+    enqueue_units(queue, journal)
+    print 'Scraping', queue.remaining(), 'remaining schools'
+    scraped, failed = run_scrape_worker(queue, journal)
+    if failed > 0:
+        print 'Could not reach', failed, 'schools- restart main.py to finish scraping'
+    all_complete = merge_scraped_years(queue, journal)
+    queue.close()
+    journal.close()
+    print_scrape_stats()
+    if all_complete:
+        print 'Done'
+    return all_complete
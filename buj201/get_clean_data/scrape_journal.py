@@ -0,0 +1,104 @@
+'''
+This module provides a durable, on-disk work journal for the webscraper.
+
+The scrape is divided into work units- one per (year, DBN). As each unit is completed,
+its outcome is recorded in a local SQLite file:
+    - 'found': the school's expenditure report was scraped (the scraped features are stored)
+    - 'not_found': the school was not found by the expenditure report search
+    - 'http_error': the expenditure report page returned an HTTP error
+    - 'missing_tables': the expenditure report page was missing the expected tables
+Units that failed due to network problems (URLError) are not recorded, so they're retried.
+If the scrape is interrupted, restarting it skips all completed units and finishes only
+the rest. Delete the journal file to force a full re-scrape- when the scrape restarts, every
+unit without a journaled outcome is reset to pending in the work queue (see work_queue.enqueue).
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import json
+import sqlite3
+import threading
+from row_collector import encode_value
+
+JOURNAL_PATH = '../data/raw_school_expenditures_by_year/scrape_journal.sqlite'
+
+class scrape_journal(object):
+    '''
+    Records the outcome of each (year, DBN) work unit in a SQLite file at path.
+    '''
+
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        with self.connection:
+            self.connection.execute('''CREATE TABLE IF NOT EXISTS results (
+                                           year INTEGER NOT NULL,
+                                           DBN TEXT NOT NULL,
+                                           position INTEGER NOT NULL,
+                                           status TEXT NOT NULL,
+                                           data TEXT,
+                                           PRIMARY KEY (year, DBN))''')
+
+    def record(self, year, DBN, position, status, school_results=None):
+        '''
+        Records the outcome (status) of the work unit (year, DBN). position is the DBN's
+        position in the list of DBNs for the year (so rows can be written in the original order),
+        and school_results is the school's scraped data (a pd.Series), if found.
+        '''
+        data = None
+        if school_results is not None:
+            data = json.dumps(dict(zip(school_results.index, school_results.values)))
+        with self.lock:
+            with self.connection:
+                self.connection.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                                        (year, DBN, position, status, data))
+
+    def completed(self, year):
+        '''
+        Returns the set of DBNs with a recorded outcome for year.
+        '''
+        with self.lock:
+            cursor = self.connection.execute('SELECT DBN FROM results WHERE year = ?', (year,))
+            return set(str(row[0]) for row in cursor.fetchall())
+
+    def positions(self, year):
+        '''
+        Returns a dictionary mapping each DBN with a recorded outcome for year to its position.
+        '''
+        with self.lock:
+            cursor = self.connection.execute('SELECT DBN, position FROM results WHERE year = ?', (year,))
+            return dict((str(DBN), position) for DBN, position in cursor.fetchall())
+
+    def status_counts(self, year):
+        '''
+        Returns a dictionary mapping each status to the number of units with that status for year.
+        '''
+        with self.lock:
+            cursor = self.connection.execute('SELECT status, COUNT(*) FROM results WHERE year = ? GROUP BY status', (year,))
+            return dict((str(status), count) for status, count in cursor.fetchall())
+
+    def rows(self, year):
+        '''
+        Yields (DBN, row dictionary) pairs for all schools found in year, in DBN list order.
+        Note the rows are read from disk one at a time.
+        '''
+        cursor = self.connection.cursor()
+        cursor.execute("SELECT DBN, data FROM results WHERE year = ? AND status = 'found' ORDER BY position", (year,))
+        for DBN, data in cursor:
+            row = json.loads(data)
+            yield str(DBN), dict((encode_value(k), encode_value(v)) for k, v in row.items())
+
+    def columns(self, year):
+        '''
+        Returns the sorted union of the features scraped for all schools found in year.
+        '''
+        columns = set()
+        for DBN, row in self.rows(year):
+            columns.update(row.keys())
+        return sorted(columns)
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,42 @@
+'''
+This module runs an additional scrape worker, to scale the expenditure report scrape across
+several processes or machines.
+
+Each worker claims (year, DBN) work units from the shared work queue (see work_queue.py), scrapes
+them, and records their outcomes in the shared scrape journal. Once no units are left to claim,
+the worker saves the csv file for each year whose units are all complete (so whichever worker
+finishes last writes the remaining years' files).
+
+It is run from the terminal (after cd-ing into the get_clean_data directory) with the command
+'python scrape_worker.py' (optionally followed by a name for the worker, which defaults to the
+host name and process id). All workers (including main.py) must share the ../data directory.
+Each worker saves the school name indexes it builds, merged with the entries saved by the other
+workers (see school_name_index.py).
+'''
+import sys
+from check_filesystem import check_filesystem
+from scrape_journal import scrape_journal
+from work_queue import work_queue
+from scrape_expenditure_data import enqueue_units, run_scrape_worker, merge_scraped_years, print_scrape_stats
+
+def main():
+    worker = sys.argv[1] if len(sys.argv) > 1 else None
+    try:
+        check_filesystem(SCHMA_required=False)
+    except IOError as msg:
+        print msg
+        return
+    journal = scrape_journal()
+    queue = work_queue()
+    enqueue_units(queue, journal)
+    scraped, failed = run_scrape_worker(queue, journal, worker)
+    print 'Worker scraped', scraped, 'schools'
+    if failed > 0:
+        print 'Could not reach', failed, 'schools- they will be retried by the next worker to claim them'
+    merge_scraped_years(queue, journal)
+    queue.close()
+    journal.close()
+    print_scrape_stats()
+
+if __name__ == '__main__':
+    main()
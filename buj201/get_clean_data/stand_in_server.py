@@ -0,0 +1,182 @@
+'''
+This module provides a local stand-in for the expenditure report site (www.nycenet.edu), so the
+scraper can be tested and benchmarked offline (see load_test_scraper.py).
+
+The stand-in serves function.asp (for any year):
+    - Search requests (searchgo=Search) return a search results page listing the searched DBN.
+    - Report requests (schoolgo=Go) return an expenditure report page for the school.
+If a response_cache (and page_archive) is given, pages (and error responses) recorded by a previous
+scrape (for the same request on the real site) are served where available; all other requests get generated pages with the same
+structure. To mimic a loaded server, the stand-in can delay each response (latency), fail a
+fraction of requests with a server error (error_rate), and throttle clients that exceed
+max_requests_per_second (with a 503 response).
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import BaseHTTPServer
+import SocketServer
+import gzip
+import random
+import threading
+import time
+from collections import deque
+from StringIO import StringIO
+from urllib2 import HTTPError
+from urlparse import urlparse, parse_qs
+from scrape_expenditure_data import NYCENET_BASE_URL
+
+## Expenditures listed on generated report pages- the first two are in table 7, the rest in table 10.
+SYNTHETIC_EXPENDITURES = {'Teachers': '9,186', 'Text Books': '112', 'Classroom Instruction (All Funds)': '12,345',
+                          'Energy': '421', 'Building Maintenance': '1,030'}
+
+def synthetic_search_page(DBN):
+    '''
+    Builds a search results page listing the school DBN (as a district 1-32 school).
+    '''
+    return ('<html><body><form><select><option>School List</option><option>District: 01--' + DBN +
+            ' P.S. ' + DBN[1:] + '</option></select></form></body></html>')
+
+def synthetic_report_page(DBN, district_text='District: 01', title_1='Yes', expenditures=SYNTHETIC_EXPENDITURES):
+    '''
+    Builds a minimal expenditure report page for DBN (tables 5, 7, and 10 hold the data).
+    '''
+    school_cell = '<font>{0}&nbsp;&nbsp;School: {1}&nbsp;&nbsp;Title 1: {2}</font>'.format(district_text, DBN, title_1)
+    def expenditure_table(items):
+        rows = ['<tr><td><font>&nbsp;</font></td><td></td><td></td><td><font></font></td></tr>']
+        for i, (category, amount) in enumerate(items):
+            rows.append('<tr><td><font>{0}.&nbsp;{1}</font></td><td>a</td><td>b</td><td><font>${2}</font></td></tr>'.format(i+1, category.replace(' ', '&nbsp;'), amount))
+        return '<table>' + ''.join(rows) + '</table>'
+    filler = '<table><tr><td>filler</td></tr></table>'
+    items = sorted(expenditures.items())
+    return ('<html><body>' + filler*4 + '<table><tr><td>a</td></tr><tr><td>b</td></tr><tr><td>' + school_cell + '</td></tr></table>' +
+            filler + expenditure_table(items[:2]) + filler*2 + expenditure_table(items[2:]) + filler + '</body></html>')
+
+
+class stand_in_handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''
+    Handles requests to the stand-in server (configured by the server's stand_in attribute).
+    '''
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        stand_in = self.server.stand_in
+        status, page = stand_in.respond(self.path)
+        if stand_in.latency > 0:
+            time.sleep(random.uniform(0.5, 1.5)*stand_in.latency)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            compressed = StringIO()
+            with gzip.GzipFile(fileobj=compressed, mode='wb') as f:
+                f.write(page)
+            page = compressed.getvalue()
+            encoding = 'gzip'
+        else:
+            encoding = None
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html')
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        if status == 503:
+            self.send_header('Retry-After', '1')
+        self.send_header('Content-Length', str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def log_message(self, *args):
+        pass
+
+
+class threaded_http_server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class stand_in_server(object):
+    '''
+    Stand-in expenditure report server, listening on host:port (port=0 picks a free port).
+    Point the scraper at stand_in_server.base_url once the server is started.
+    '''
+
+    def __init__(self, cache=None, latency=0.0, error_rate=0.0, max_requests_per_second=None, host='127.0.0.1', port=0, archive=None):
+        self.cache = cache
+        self.archive = archive
+        self.latency = latency
+        self.error_rate = error_rate
+        self.max_requests_per_second = max_requests_per_second
+        self.server = threaded_http_server((host, port), stand_in_handler)
+        self.server.stand_in = self
+        self.base_url = 'http://{}:{}'.format(host, self.server.server_port)
+        self.lock = threading.Lock()
+        self.recent = deque()
+        self.counts = {'requests': 0, 'recorded': 0, 'generated': 0, 'errors': 0, 'throttled': 0, 'not_found': 0}
+
+    def start(self):
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def throttled(self):
+        '''
+        Returns True if more than max_requests_per_second requests were made in the last second.
+        '''
+        if self.max_requests_per_second is None:
+            return False
+        now = time.time()
+        with self.lock:
+            while self.recent and self.recent[0] < now - 1:
+                self.recent.popleft()
+            if len(self.recent) >= self.max_requests_per_second:
+                return True
+            self.recent.append(now)
+            return False
+
+    def respond(self, path):
+        '''
+        Returns the (status, page) response to a request for path.
+        '''
+        self.count('requests')
+        if self.throttled():
+            self.count('throttled')
+            return 503, 'Service Unavailable'
+        if self.error_rate > 0 and random.random() < self.error_rate:
+            self.count('errors')
+            return 500, 'Internal Server Error'
+        parsed = urlparse(path)
+        query = parse_qs(parsed.query)
+        if not parsed.path.endswith('/function.asp') or 'search' not in query:
+            self.count('not_found')
+            return 404, 'Not Found'
+        if self.cache is not None:
+            try:
+                page = self.cache.get(NYCENET_BASE_URL + path)
+            except HTTPError as error:
+                self.count('recorded')
+                return error.code, ''
+            if page is not None:
+                self.count('recorded')
+                return 200, page
+        DBN = query['search'][0]
+        if 'schoolgo' in query and self.archive is not None:
+            ## The report page's year is the second year of the path's school year (i.e. /y2005_2006/function.asp)
+            archived = self.archive.get(int(parsed.path.split('/')[-2].split('_')[-1]), DBN)
+            if archived is not None and 'LCMS=' + archived[0] + '&' in parsed.query:
+                self.count('recorded')
+                return 200, archived[1]
+        self.count('generated')
+        if 'schoolgo' in query:
+            return 200, synthetic_report_page(DBN)
+        return 200, synthetic_search_page(DBN)
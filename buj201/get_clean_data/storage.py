@@ -0,0 +1,280 @@
+'''
+This module stores the cleaned and merged datasets in a typed, columnar binary format, alongside
+their csv files.
+
+Every dataset is still exported as a csv file (at the same path as before), but reading a csv file
+means parsing every value and inferring every column's type, each time it's read. So when a
+dataset's csv file is written, save_table also saves the dataset (from memory- the csv file isn't read
+back) in a binary format, with the types read_csv would infer, and load_table reads that (only the
+requested columns) instead. The binary formats are:
+    - 'npy' (the default): a directory holding NumPy array (.npy) files, plus a schema file
+    (schema.json) listing the columns and their types. Numeric columns of each type are stored
+    together, one column per row of a memory-mapped array, and text columns are stored as
+    fixed-width strings (with a mask of missing values).
+    - 'parquet' and 'feather': pandas' Parquet and Feather formats (these need pyarrow installed).
+Each binary copy records the size and modification time of the csv file it was stored with, and
+is only used if the csv file still matches- otherwise (or if there is no binary copy) load_table
+falls back to reading the csv file.
+Datasets too large to hold in memory are written a chunk at a time with save_table_chunks, which
+builds the 'npy' copy from the chunks as they're written (rather than reading the csv file back).
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+FORMAT = 'npy'
+EXTENSIONS = {'npy': '.columns', 'parquet': '.parquet', 'feather': '.feather'}
+
+def binary_path(path, format=FORMAT):
+    '''Returns the path of the binary copy (in format) of the csv file at path.'''
+    return os.path.splitext(path)[0] + EXTENSIONS[format]
+
+def save_table(dataframe, path, formats=(FORMAT,)):
+    '''
+    Writes dataframe to the csv file at path, and stores it in each of formats (see store_table).
+    '''
+    dataframe.to_csv(path)
+    store_table(path, formats, dataframe)
+
+def store_table(path, formats=(FORMAT,), dataframe=None):
+    '''
+    Stores the dataset in the csv file at path (written with its index as the first column) in each
+    of formats. dataframe is the dataset as written to the csv file (if it's None, the csv file is read).
+    Its text columns are stored with the types read_csv infers (see csv_types), so the binary copies
+    load as the csv file would.
+    '''
+    dataframe = pd.read_csv(path, index_col=0) if dataframe is None else csv_types(dataframe)
+    for format in formats:
+        target = binary_path(path, format)
+        if format == 'npy':
+            write_columns(dataframe, target, path)
+            continue
+        if format == 'parquet':
+            dataframe.to_parquet(target)
+        elif format == 'feather':
+            ## Note feather files can't store an index, so it's stored as the first column
+            dataframe.reset_index().to_feather(target)
+        else:
+            raise ValueError('Unknown storage format {} (formats are: {})'.format(format, ', '.join(EXTENSIONS)))
+        with open(target + '.source.json', 'w') as f:
+            json.dump(source_record(path), f)
+
+def csv_types(dataframe):
+    '''
+    Returns dataframe with the types read_csv infers when it's read back from a csv file: text columns
+    (and index) whose values are all numbers (i.e. school years) are numeric, and empty text is missing.
+    '''
+    def converted(values):
+        values = pd.to_numeric(values, errors='ignore')
+        return values.where(values != '') if values.dtype == object else values
+    dataframe = dataframe.copy()
+    for name in dataframe.columns[(dataframe.dtypes == object).values]:
+        dataframe[name] = converted(dataframe[name])
+    if dataframe.index.dtype == object:
+        dataframe.index = pd.Index(converted(dataframe.index.to_series()), name=dataframe.index.name)
+    return dataframe
+
+def source_record(path):
+    '''Returns the {'size', 'mtime'} record of the csv file at path, saved with its binary copies.'''
+    info = os.stat(path)
+    return {'size': info.st_size, 'mtime': info.st_mtime}
+
+def is_current(path, format=FORMAT):
+    '''
+    Returns True if there is a binary copy (in format) of the csv file at path, stored with the csv file
+    as it is now (i.e. the csv file hasn't been rewritten since).
+    '''
+    target = binary_path(path, format)
+    record_path = os.path.join(target, 'schema.json') if format == 'npy' else target + '.source.json'
+    if not os.path.exists(record_path):
+        return False
+    with open(record_path) as f:
+        record = json.load(f)
+    if format == 'npy':
+        record = record.get('source')
+    return record == source_record(path)
+
+def load_table(path, columns=None, format=FORMAT):
+    '''
+    Returns the dataset in the csv file at path (as pd.read_csv(path, index_col=0) would), with only
+    the input columns (a list, or None for all columns). It's read from its binary copy in format,
+    if there is a current one (see is_current).
+    '''
+    target = binary_path(path, format)
+    if not is_current(path, format):
+        dataframe = pd.read_csv(path, index_col=0)
+        return dataframe if columns is None else dataframe[list(columns)]
+    if format == 'npy':
+        return read_columns(target, columns)
+    if format == 'parquet':
+        return pd.read_parquet(target, columns=None if columns is None else list(columns))
+    dataframe = pd.read_feather(target)
+    dataframe = dataframe.set_index(dataframe.columns[0])
+    return dataframe if columns is None else dataframe[list(columns)]
+
+def save_table_chunks(chunks, path):
+    '''
+    Writes the dataset in chunks (an iterable of dataframes with the same columns and types) to the csv
+    file at path, a chunk at a time, and stores it in the 'npy' format from the same chunks- so the
+    dataset is never held in memory (or read back) whole. Note the stored types are the chunks' types,
+    so they should be the types read_csv infers for the csv file (i.e. read the chunks with explicit
+    dtypes). Only the 'npy' format can be stored a chunk at a time.
+    '''
+    def written_chunks():
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(path, mode='a' if i > 0 else 'w', header=(i == 0))
+            yield chunk
+    write_column_chunks(written_chunks(), binary_path(path, 'npy'), path)
+
+def write_columns(dataframe, directory, source=None):
+    '''
+    Writes dataframe to directory in the 'npy' format (replacing any existing copy). Numeric columns
+    of the same type are saved together, as the rows of one array (so each column is contiguous, and
+    a dataset is read from a few files, rather than one file per column). source is the path of the
+    csv file the copy is stored with (its record is saved in the schema- see is_current), if any.
+    '''
+    write_column_chunks([dataframe], directory, source)
+
+def write_column_chunks(chunks, directory, source=None):
+    '''
+    Writes the dataset in chunks (an iterable of dataframes with the same columns and types) to directory
+    in the 'npy' format (as write_columns). Each chunk's columns are spooled to temporary files as it's
+    read, then copied into the dataset's arrays, so only one chunk is held in memory at once.
+    '''
+    parent = os.path.dirname(os.path.abspath(directory))
+    temp_directory = tempfile.mkdtemp(dir=parent)
+    spool_directory = os.path.join(temp_directory, 'spool')
+    os.mkdir(spool_directory)
+    spooled = lambda j, i, suffix='': os.path.join(spool_directory, '{}_{}{}.npy'.format(j, i, suffix))
+    first = None
+    lengths = []
+    text_types = {}
+    ## Spool each chunk's index (j = 0) and columns (j = 1, 2, ...)
+    for i, chunk in enumerate(chunks):
+        values = [chunk.index.to_series()] + [chunk.iloc[:, k] for k in range(chunk.shape[1])]
+        kinds = ['text' if v.dtype == object else v.dtype.str for v in values]
+        if first is None:
+            first = {'index_name': chunk.index.name, 'names': list(chunk.columns), 'kinds': kinds}
+        elif list(chunk.columns) != first['names'] or kinds != first['kinds']:
+            raise ValueError('Chunk {} has different columns or types than the first chunk'.format(i))
+        for j, (kind, column) in enumerate(zip(kinds, values)):
+            if kind == 'text':
+                missing = column.isnull().values
+                text = column.where(~missing, '').values.astype(str)
+                text_types[j] = np.result_type(text_types.get(j, text.dtype), text.dtype)
+                np.save(spooled(j, i), text)
+                np.save(spooled(j, i, '.mask'), missing)
+            else:
+                np.save(spooled(j, i), column.values)
+        lengths.append(len(chunk))
+    if first is None:
+        raise ValueError('No chunks to write')
+
+    ## Copy the spooled chunks into the dataset's arrays
+    rows = [slice(start, start + length) for start, length in zip(np.cumsum([0] + lengths), lengths)]
+    total = sum(lengths)
+    kinds = first['kinds']
+    schema = {'index': kinds[0], 'index_name': first['index_name'], 'columns': []}
+    blocks = {}
+    for j, kind in enumerate(kinds):
+        name = 'index' if j == 0 else str(j - 1)
+        if kind == 'text':
+            save_spooled(os.path.join(temp_directory, name + '.npy'), text_types[j], (total,),
+                         [(r, spooled(j, i)) for i, r in enumerate(rows)])
+            save_spooled(os.path.join(temp_directory, name + '.mask.npy'), bool, (total,),
+                         [(r, spooled(j, i, '.mask')) for i, r in enumerate(rows)])
+        elif j == 0:
+            save_spooled(os.path.join(temp_directory, 'index.npy'), kind, (total,),
+                         [(r, spooled(j, i)) for i, r in enumerate(rows)])
+        else:
+            blocks.setdefault(kind, []).append(j)
+        if j > 0:
+            schema['columns'].append([first['names'][j - 1], kind, name if kind == 'text' else len(blocks[kind]) - 1])
+    for kind, block in blocks.items():
+        save_spooled(os.path.join(temp_directory, block_name(kind) + '.npy'), kind, (len(block), total),
+                     [((position, r), spooled(j, i)) for position, j in enumerate(block) for i, r in enumerate(rows)])
+    shutil.rmtree(spool_directory)
+    if source is not None:
+        ## Note the csv file is complete once every chunk has been read
+        schema['source'] = source_record(source)
+    with open(os.path.join(temp_directory, 'schema.json'), 'w') as f:
+        json.dump(schema, f, indent=1)
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.rename(temp_directory, directory)
+
+def save_spooled(path, dtype, shape, pieces):
+    '''
+    Saves an array of dtype and shape to path, assembled from pieces- (key, spooled path) pairs, where the
+    spooled file holds array[key]. The array is written through a memory map, one piece at a time.
+    '''
+    if np.prod(shape) == 0:
+        np.save(path, np.empty(shape, dtype))
+        return
+    array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+    for key, piece in pieces:
+        array[key] = np.load(piece)
+    array.flush()
+    del array
+
+def block_name(kind):
+    ## The file name for the block of columns of type kind (i.e. '<f8' is saved as block_f8.npy)
+    return 'block_' + kind.lstrip('<>|=')
+
+def read_columns(directory, columns=None):
+    '''
+    Reads the dataset in directory (in the 'npy' format), with only the input columns (or all columns).
+    Numeric columns are read from their memory-mapped blocks, so only the requested columns are read.
+    '''
+    with open(os.path.join(directory, 'schema.json')) as f:
+        schema = json.load(f, object_hook=to_str)
+    stored = dict((name, (kind, position)) for name, kind, position in schema['columns'])
+    names = [name for name, kind, position in schema['columns']] if columns is None else list(columns)
+    for name in names:
+        if name not in stored:
+            raise KeyError('{} not in the stored columns'.format(name))
+    if schema['index'] == 'text':
+        index = read_text(directory, 'index')
+    else:
+        index = np.load(os.path.join(directory, 'index.npy'))
+    index = pd.Index(index, name=schema['index_name'])
+    frames = []
+    for kind in sorted(set(stored[name][0] for name in names) - set(['text'])):
+        ## Each block's columns are built in one piece
+        block_columns = [name for name in names if stored[name][0] == kind]
+        block = np.load(os.path.join(directory, block_name(kind) + '.npy'), mmap_mode='r')
+        frames.append(pd.DataFrame(block[[stored[name][1] for name in block_columns]].T,
+                                   index=index, columns=block_columns))
+    text_columns = [name for name in names if stored[name][0] == 'text']
+    if text_columns:
+        frames.append(pd.DataFrame(dict((name, read_text(directory, stored[name][1])) for name in text_columns),
+                                   index=index, columns=text_columns))
+    if len(frames) == 0:
+        return pd.DataFrame(index=index)
+    return pd.concat(frames, axis=1, copy=False)[names]
+
+def to_str(value):
+    ## json reads text as unicode- converts it back to str (recursively)
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [to_str(v) for v in value]
+    if isinstance(value, dict):
+        return dict((to_str(k), to_str(v)) for k, v in value.items())
+    return value
+
+def read_text(directory, name):
+    '''
+    Reads the text column name (saved by write_column_chunks) from directory.
+    '''
+    values = np.load(os.path.join(directory, name + '.npy')).astype(object)
+    values[np.load(os.path.join(directory, name + '.mask.npy'))] = np.nan
+    return values
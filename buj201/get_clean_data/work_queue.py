@@ -0,0 +1,184 @@
+'''
+This module provides a shared work queue for the webscraper, so the scrape can be split
+across several worker processes (on one machine, or on several machines sharing a filesystem).
+
+The queue holds one work unit per (year, DBN), in a SQLite file. Each worker repeatedly claims
+a batch of pending units, scrapes them, and marks them done (recording their outcomes in the
+scrape journal). A claim is a lease: if a worker dies (or can't reach the server) before finishing
+its units, they become claimable again once the lease expires, so no unit is lost. While a worker is
+scraping a unit, its lease is renewed (see lease_renewer), so a unit that takes longer than a lease
+to scrape (i.e. while its requests are retried) isn't claimed by a second worker.
+Note SQLite's file locking must work on the shared filesystem (it does on local disks and most
+NFS setups, but not on some network filesystems).
+'''
+import sys
+if __name__ == "__main__":
+    print "Not to be called directly- exiting program"
+    sys.exit()
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+QUEUE_PATH = '../data/raw_school_expenditures_by_year/work_queue.sqlite'
+
+def default_worker_name():
+    '''Returns a name identifying this worker process (host name and process id).'''
+    return socket.gethostname() + ':' + str(os.getpid())
+
+class work_queue(object):
+    '''
+    Queue of (year, DBN) work units in a SQLite file at path. Units claimed by a worker are
+    leased for lease_seconds.
+    '''
+
+    def __init__(self, path=QUEUE_PATH, lease_seconds=600):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.lock = threading.Lock()
+        ## Note transactions are managed explicitly, so claims can lock the queue (BEGIN IMMEDIATE)
+        self.connection = sqlite3.connect(path, timeout=60, isolation_level=None, check_same_thread=False)
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS units (
+                                       year INTEGER NOT NULL,
+                                       DBN TEXT NOT NULL,
+                                       position INTEGER NOT NULL,
+                                       state TEXT NOT NULL,
+                                       worker TEXT,
+                                       lease_expires REAL,
+                                       attempts INTEGER NOT NULL DEFAULT 0,
+                                       PRIMARY KEY (year, DBN))''')
+
+    def enqueue(self, year, DBNs, completed=()):
+        '''
+        Adds a unit for each DBN (in DBNs, a list in the order the year's rows should be written)
+        for year. Units for DBNs in completed (the DBNs with a journaled outcome) are added as already
+        done. Units already in the queue keep their state, except done units for DBNs not in completed
+        (i.e. after the journal is deleted), which are reset to pending- so enqueueing is safe to repeat
+        (i.e. from each worker), and every unit without a journaled outcome is scraped.
+        '''
+        rows = [(year, str(DBN), position, 'done' if DBN in completed else 'pending')
+                for position, DBN in enumerate(DBNs)]
+        reset = [(year, str(DBN)) for DBN in DBNs if DBN not in completed]
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                self.connection.executemany('INSERT OR IGNORE INTO units (year, DBN, position, state) VALUES (?, ?, ?, ?)', rows)
+                self.connection.executemany("""UPDATE units SET state = 'pending', worker = NULL, lease_expires = NULL
+                                               WHERE year = ? AND DBN = ? AND state = 'done'""", reset)
+            except:
+                self.connection.execute('ROLLBACK')
+                raise
+            self.connection.execute('COMMIT')
+
+    def claim(self, worker, count=64):
+        '''
+        Claims up to count units for worker- pending units, or units whose lease has expired-
+        in (year, position) order. Returns a list of (year, DBN, position) tuples (empty once
+        there are no claimable units).
+        '''
+        now = time.time()
+        with self.lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                units = self.connection.execute('''SELECT year, DBN, position FROM units
+                                                   WHERE state = 'pending' OR (state = 'claimed' AND lease_expires < ?)
+                                                   ORDER BY year, position LIMIT ?''', (now, count)).fetchall()
+                self.connection.executemany('''UPDATE units SET state = 'claimed', worker = ?, lease_expires = ?,
+                                               attempts = attempts + 1 WHERE year = ? AND DBN = ?''',
+                                            [(worker, now + self.lease_seconds, year, DBN) for year, DBN, position in units])
+            except:
+                self.connection.execute('ROLLBACK')
+                raise
+            self.connection.execute('COMMIT')
+        return [(year, str(DBN), position) for year, DBN, position in units]
+
+    def renew(self, worker, units):
+        '''
+        Extends worker's leases on units (a list of (year, DBN)) that it still holds. Returns the number of
+        leases renewed (a unit whose lease expired and was claimed by another worker isn't renewed).
+        '''
+        lease_expires = time.time() + self.lease_seconds
+        with self.lock:
+            cursor = self.connection.executemany('''UPDATE units SET lease_expires = ?
+                                                    WHERE year = ? AND DBN = ? AND state = 'claimed' AND worker = ?''',
+                                                 [(lease_expires, year, DBN, worker) for year, DBN in units])
+            return cursor.rowcount
+
+    def complete(self, year, DBN):
+        '''
+        Marks the unit (year, DBN) done.
+        '''
+        with self.lock:
+            self.connection.execute("UPDATE units SET state = 'done', lease_expires = NULL WHERE year = ? AND DBN = ?",
+                                    (year, DBN))
+
+    def remaining(self, year=None):
+        '''
+        Returns the number of units (for year, or for all years) not yet done.
+        '''
+        with self.lock:
+            if year is None:
+                cursor = self.connection.execute("SELECT COUNT(*) FROM units WHERE state != 'done'")
+            else:
+                cursor = self.connection.execute("SELECT COUNT(*) FROM units WHERE state != 'done' AND year = ?", (year,))
+            return cursor.fetchone()[0]
+
+    def DBNs(self, year):
+        '''
+        Returns the set of DBNs with units (in any state) for year.
+        '''
+        with self.lock:
+            cursor = self.connection.execute('SELECT DBN FROM units WHERE year = ?', (year,))
+            return set(str(row[0]) for row in cursor.fetchall())
+
+    def years(self):
+        '''
+        Returns the sorted list of years with units in the queue.
+        '''
+        with self.lock:
+            return [row[0] for row in self.connection.execute('SELECT DISTINCT year FROM units ORDER BY year')]
+
+    def close(self):
+        self.connection.close()
+
+
+class lease_renewer(object):
+    '''
+    Renews worker's leases on the units it has in flight, every interval seconds (by default, a third of
+    the queue's lease), in a background thread. Units are added once claimed, and discarded once done
+    (or given up on, so their leases expire and another worker retries them).
+    '''
+
+    def __init__(self, queue, worker, interval=None):
+        self.queue = queue
+        self.worker = worker
+        self.interval = interval if interval is not None else queue.lease_seconds/3.0
+        self.lock = threading.Lock()
+        self.in_flight = set()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.renew_leases)
+        self.thread.daemon = True
+
+    def add(self, units):
+        with self.lock:
+            self.in_flight.update((year, DBN) for year, DBN, position in units)
+
+    def discard(self, year, DBN):
+        with self.lock:
+            self.in_flight.discard((year, DBN))
+
+    def renew_leases(self):
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                units = list(self.in_flight)
+            self.queue.renew(self.worker, units)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()